@@ -1,12 +1,19 @@
 import httpx
+from ..utils.ratelimit import limited_request
+from ..utils.singleflight import dexscreener_flight, normalize_key
 BASE = "https://api.dexscreener.com"
-async def token_info_solana(mint: str) -> dict:
-    async with httpx.AsyncClient(timeout=20) as cli:
-        r = await cli.get(f"{BASE}/latest/dex/tokens/{mint}")
-        r.raise_for_status()
-        return r.json()
-async def search_pairs_solana(query: str) -> dict:
-    async with httpx.AsyncClient(timeout=20) as cli:
-        r = await cli.get(f"{BASE}/latest/dex/search", params={"q": query})
-        r.raise_for_status()
-        return r.json()
+# Одновременные одинаковые запросы склеиваются в один (результат общий - не мутировать)
+async def token_info_solana(mint: str, priority: str = "discovery") -> dict:
+    async def fetch() -> dict:
+        async with httpx.AsyncClient(timeout=20) as cli:
+            r = await limited_request("dexscreener", lambda: cli.get(f"{BASE}/latest/dex/tokens/{mint}"), priority=priority)
+            r.raise_for_status()
+            return r.json()
+    return await dexscreener_flight.do(normalize_key("tokens", mint), fetch)
+async def search_pairs_solana(query: str, priority: str = "discovery") -> dict:
+    async def fetch() -> dict:
+        async with httpx.AsyncClient(timeout=20) as cli:
+            r = await limited_request("dexscreener", lambda: cli.get(f"{BASE}/latest/dex/search", params={"q": query}), priority=priority)
+            r.raise_for_status()
+            return r.json()
+    return await dexscreener_flight.do(normalize_key("search", query.strip().lower()), fetch)
@@ -0,0 +1,123 @@
+"""
+Benchmark решений LLM против mock Perplexity.
+
+Поднимает mock сервер в том же процессе, подменяет endpoint и кольцо ключей
+на тестовые, гоняет раунды кандидатов через Orchestrator._evaluate_candidates
+(тот же путь, что и _loop_decisions: группы, батчи, hedging, каскад) и
+печатает throughput, p50/p99 time-to-decision и распределение запросов по ключам.
+
+    python -m bot.bench.decisions --keys 5 --candidates 10 --rounds 5 --latency lognormal:2000:0.6 --error k2:429:0.3
+"""
+from __future__ import annotations
+import argparse, asyncio, json, os, socket, tempfile, time
+from ..config import settings
+from ..llm import perplexity_client, router
+from ..llm.payload import build_payload
+from ..llm.prefilter import candidate_features
+from ..utils import ratelimit
+from .mock_pplx import Latency, MockConfig, create_app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+
+def _candidates(n: int, round_no: int) -> list[dict]:
+    out = []
+    for i in range(n):
+        sym = f"TOK{i}"
+        meta = {"mentions": 10 + i, "unique_authors": 5, "red_flag": False, "z_m": 1.0 + 0.1 * i + round_no, "z_a": 0.5}
+        market = {"liq_usd": 50_000.0 * (i + 1), "vol_1h": 10_000.0, "txns_h1": 200, "price_change_1h": 0.05}
+        out.append({"symbol": sym, "mkt": None, "dscore": 0.5,
+                    "payload": build_payload(sym, f"mint{i}", meta["z_m"], meta, [], market,
+                                             token_budget=settings.perplexity.prompt_token_budget),
+                    "features": candidate_features(meta["z_m"], meta, 1.0, 0.0, market["liq_usd"], market["vol_1h"])})
+    return out
+
+
+def _pct(values: list[float], q: float) -> float | None:
+    if not values: return None
+    v = sorted(values); return round(1000 * v[min(len(v) - 1, int(q * len(v)))], 1)
+
+
+async def run_benchmark(*, keys: int = 5, candidates: int = 10, rounds: int = 5, conf: MockConfig | None = None,
+                        key_rps: float = 1.0, stream: bool = True, batch: bool = True) -> dict:
+    import uvicorn
+    from .. import engine
+    conf = conf or MockConfig()
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(conf), host="127.0.0.1", port=port, log_level="warning"))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        if serve.done(): serve.result()
+        await asyncio.sleep(0.02)
+    # Тестовые ключи, endpoint и настройки; реальное состояние ключей не трогаем
+    saved = {"url": perplexity_client.PPLX_URL, "ring": perplexity_client.ring, "engine_ring": engine.ring,
+             "cache": router.decision_cache, "prefilter": router.prefilter, "env": os.environ.get("PPLX_API_KEYS"),
+             "stream": settings.perplexity.stream, "batch": settings.perplexity.batch_enabled,
+             "bucket": ratelimit._BUCKETS.get("perplexity")}
+    tmp = tempfile.mkdtemp(prefix="pplx-bench-")
+    try:
+        os.environ["PPLX_API_KEYS"] = ",".join(f"k{i + 1}" for i in range(keys))
+        ring = perplexity_client.PPLXKeyRing(path=os.path.join(tmp, "keys.json"), max_rps=key_rps)
+        perplexity_client.ring = engine.ring = ring
+        perplexity_client.PPLX_URL = f"http://127.0.0.1:{port}/chat/completions"
+        router.decision_cache = None; router.prefilter = None
+        settings.perplexity.stream = stream; settings.perplexity.batch_enabled = batch
+        ratelimit._BUCKETS["perplexity"] = ratelimit.TokenBucket("perplexity", 1000.0, 1000)  # провайдерский лимит не мерим
+        orch = engine.Orchestrator()
+        latencies: list[float] = []; decided = 0
+        t_start = time.monotonic()
+        for r in range(rounds):
+            cands = _candidates(candidates, r); t0 = time.monotonic()
+
+            async def record(cand, dec, t0=t0):
+                nonlocal decided
+                decided += 1; latencies.append(time.monotonic() - t0)
+            await orch._evaluate_candidates(cands, record)
+        elapsed = time.monotonic() - t_start
+        mock_stats = {k: {"requests": v["requests"], "ok": v["ok"], "errors": dict(v["errors"])}
+                      for k, v in server.config.app.state.stats.items()}
+        ring_stats = ring.status()
+        return {"rounds": rounds, "candidates": candidates, "keys": keys, "stream": stream, "batch": batch,
+                "elapsed_secs": round(elapsed, 2), "decisions": decided, "failed": rounds * candidates - decided,
+                "throughput_per_sec": round(decided / elapsed, 2) if elapsed > 0 else None,
+                "p50_ms": _pct(latencies, 0.5), "p99_ms": _pct(latencies, 0.99),
+                "keys_usage": [{"idx": k["idx"], "requests": k["requests"], "ok": k["ok"], "err": k["err"],
+                                "healthy": k["healthy"], "ewma_latency_ms": k["ewma_latency_ms"]} for k in ring_stats["keys"]],
+                "server": mock_stats, "hedging": perplexity_client.hedge_stats(), "batches": router.batch_sizer.stats()}
+    finally:
+        perplexity_client.PPLX_URL = saved["url"]; perplexity_client.ring = saved["ring"]; engine.ring = saved["engine_ring"]
+        router.decision_cache = saved["cache"]; router.prefilter = saved["prefilter"]
+        settings.perplexity.stream = saved["stream"]; settings.perplexity.batch_enabled = saved["batch"]
+        if saved["env"] is None: os.environ.pop("PPLX_API_KEYS", None)
+        else: os.environ["PPLX_API_KEYS"] = saved["env"]
+        if saved["bucket"] is None: ratelimit._BUCKETS.pop("perplexity", None)
+        else: ratelimit._BUCKETS["perplexity"] = saved["bucket"]
+        server.should_exit = True
+        await serve
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the decision loop against a mock Perplexity server")
+    ap.add_argument("--keys", type=int, default=5)
+    ap.add_argument("--candidates", type=int, default=10)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--latency", default="lognormal:1500:0.5", help="fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA")
+    ap.add_argument("--error", action="append", default=[], help="KEY:STATUS:PROB (KEY=* for all keys)")
+    ap.add_argument("--tail-secs", type=float, default=1.0)
+    ap.add_argument("--key-rps", type=float, default=1.0)
+    ap.add_argument("--no-stream", action="store_true")
+    ap.add_argument("--no-batch", action="store_true")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    conf = MockConfig(latency=Latency.parse(args.latency), tail_secs=args.tail_secs, seed=args.seed)
+    for spec in args.error: conf.add_error(spec)
+    report = asyncio.run(run_benchmark(keys=args.keys, candidates=args.candidates, rounds=args.rounds, conf=conf,
+                                       key_rps=args.key_rps, stream=not args.no_stream, batch=not args.no_batch))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Mock Perplexity - локальный Perplexity-совместимый сервер для нагрузочных тестов.
+
+POST /chat/completions отвечает schema-valid Decision JSON (или массивом для
+батчевого промпта) после задержки из настраиваемого распределения; ошибки
+429/401/402/5xx инжектируются по ключу с заданной вероятностью; stream=true
+отдает SSE (решение, затем медленный хвост с citations). GET /stats - счетчики.
+
+    python -m bot.bench.mock_pplx --port 8765 --latency lognormal:1500:0.5 --error k2:429:0.2 --error k3:401:1
+"""
+from __future__ import annotations
+import argparse, asyncio, hashlib, json, random
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from ..models import Decision, TradeProposal
+
+ERROR_MESSAGES = {401: "Invalid API key", 402: "insufficient credits", 429: "Rate limit exceeded",
+                  500: "Internal server error", 502: "Bad gateway", 503: "Service unavailable"}
+
+
+@dataclass
+class Latency:
+    """Распределение задержки ответа, мс: fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA."""
+    kind: str = "lognormal"
+    a: float = 1500.0
+    b: float = 0.5
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        parts = spec.split(":")
+        kind = parts[0]
+        if kind == "fixed": return cls(kind, float(parts[1]), 0.0)
+        if kind in ("uniform", "lognormal"): return cls(kind, float(parts[1]), float(parts[2]))
+        raise ValueError(f"unknown latency spec {spec}")
+
+    def sample(self, rnd: random.Random) -> float:
+        """Секунды."""
+        if self.kind == "fixed": ms = self.a
+        elif self.kind == "uniform": ms = rnd.uniform(self.a, self.b)
+        else: ms = rnd.lognormvariate(0.0, self.b) * self.a
+        return max(0.0, ms) / 1000.0
+
+
+@dataclass
+class MockConfig:
+    latency: Latency = field(default_factory=Latency)
+    errors: dict[str, dict[int, float]] = field(default_factory=dict)  # key ("*" = любой) -> {status: вероятность}
+    ttft_fraction: float = 0.3  # доля задержки до первого токена в SSE
+    tail_secs: float = 1.0  # хвост (пояснения, citations) после решения
+    long_rate: float = 0.3  # доля решений с action=long
+    seed: Optional[int] = None
+
+    def add_error(self, spec: str):
+        """KEY:STATUS:PROB, например k2:429:0.2 или *:503:0.01."""
+        key, status, prob = spec.split(":")
+        self.errors.setdefault(key, {})[int(status)] = float(prob)
+
+
+def _decision_for(item: dict, rnd: random.Random, long_rate: float) -> dict:
+    symbol = str(item.get("symbol") or "UNKNOWN")
+    # Уверенность детерминирована символом - повторные запросы дают похожие ответы
+    h = int(hashlib.blake2b(symbol.encode(), digest_size=4).hexdigest(), 16) / 2**32
+    action = "long" if rnd.random() < long_rate else "flat"
+    dec = Decision(symbol=symbol, contract=item.get("contract"), direction="up" if action == "long" else "neutral",
+                   confidence=round(0.3 + 0.6 * h, 3), novelty=0.5, magnitude=0.4,
+                   trade_proposal=TradeProposal(action=action, weight=0.5))
+    return dec.model_dump(mode="json")
+
+
+def _content_for(body: dict, rnd: random.Random, long_rate: float) -> str:
+    user = next((m.get("content") for m in reversed(body.get("messages") or []) if m.get("role") == "user"), "") or ""
+    try: data = json.loads(user)
+    except Exception: data = {}
+    if isinstance(data, list):
+        return json.dumps([_decision_for(it, rnd, long_rate) for it in data if isinstance(it, dict)])
+    return json.dumps(_decision_for(data if isinstance(data, dict) else {}, rnd, long_rate))
+
+
+def create_app(conf: MockConfig | None = None) -> FastAPI:
+    conf = conf or MockConfig()
+    rnd = random.Random(conf.seed)
+    stats: dict[str, dict] = defaultdict(lambda: {"requests": 0, "ok": 0, "errors": defaultdict(int)})
+    app = FastAPI(title="Mock Perplexity")
+    app.state.conf = conf; app.state.stats = stats
+
+    def _injected(key: str) -> Optional[int]:
+        for rules in (conf.errors.get(key) or {}, conf.errors.get("*") or {}):
+            for status, prob in rules.items():
+                if rnd.random() < prob: return status
+        return None
+
+    @app.post("/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        key = (request.headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+        st = stats[key]; st["requests"] += 1
+        delay = conf.latency.sample(rnd)
+        status = _injected(key)
+        if status is not None:
+            await asyncio.sleep(min(delay, 0.05))  # ошибки приходят быстро
+            st["errors"][status] += 1
+            return JSONResponse({"error": {"message": ERROR_MESSAGES.get(status, "error"), "code": status}}, status_code=status)
+        content = _content_for(body, rnd, conf.long_rate)
+        tail = " Sources: [1] https://example.com/news [2] https://example.com/chart"
+        st["ok"] += 1
+        if not body.get("stream"):
+            await asyncio.sleep(delay + conf.tail_secs)
+            return {"id": "mock", "model": body.get("model"), "choices": [{"index": 0, "message": {"role": "assistant", "content": content + tail}}]}
+
+        async def events():
+            await asyncio.sleep(delay * conf.ttft_fraction)
+            step = max(1, len(content) // 8)
+            chunks = [content[i:i + step] for i in range(0, len(content), step)]
+            for ch in chunks:
+                yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': ch}}]})}\n\n"
+                await asyncio.sleep(delay * (1 - conf.ttft_fraction) / len(chunks))
+            await asyncio.sleep(conf.tail_secs)
+            yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': tail}}]})}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return {k: {"requests": v["requests"], "ok": v["ok"], "errors": dict(v["errors"])} for k, v in stats.items()}
+
+    return app
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Mock Perplexity server for load testing")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", default="lognormal:1500:0.5", help="fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA")
+    ap.add_argument("--error", action="append", default=[], help="KEY:STATUS:PROB (KEY=* for all keys)")
+    ap.add_argument("--tail-secs", type=float, default=1.0)
+    ap.add_argument("--long-rate", type=float, default=0.3)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    conf = MockConfig(latency=Latency.parse(args.latency), tail_secs=args.tail_secs, long_rate=args.long_rate, seed=args.seed)
+    for spec in args.error: conf.add_error(spec)
+    import uvicorn
+    uvicorn.run(create_app(conf), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,58 @@
 from __future__ import annotations
 import os, yaml
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 DEFAULT_CFG = os.environ.get("CONFIG_PATH", "config/config.yaml")
 
 class PerplexityConf(BaseModel):
     enabled: bool = True
     model_fast: str = "sonar-small-online"
     model_final: str = "sonar-medium-online"
+    base_url: str = "https://api.perplexity.ai"  # Perplexity-совместимый endpoint (можно указать локальный стенд)
+    stream: bool = True  # SSE: решение возвращается, как только закрылся JSON объект
+    # Кеш решений по квантованному отпечатку payload (z-scores, полосы ликвидности/объема, набор новостей)
+    decision_cache_enabled: bool = True
+    decision_cache_ttl_secs: float = 300.0
+    decision_cache_max_entries: int = 2000
+    decision_cache_z_step: float = 0.5  # ширина корзины z-score
+    decision_cache_band: float = 0.25  # ширина полосы liq/vol в log10 (~1.8x)
+    decision_cache_chg_step: float = 0.10  # корзина изменения цены за 1ч (доля: 0.10 = 10%)
+    decision_cache_save_secs: float = 60.0  # как часто сбрасывать кеш на диск
+    max_concurrency: int = 8  # потолок параллельных решений (фактически min с числом здоровых ключей)
+    decision_timeout_secs: float = 20.0  # дедлайн на решение по одному кандидату
+    key_max_rps: float = 1.0  # потолок запросов в секунду на один ключ (0 = без потолка)
+    key_state_flush_secs: float = 30.0  # как часто сбрасывать состояние ключей на диск
+    # Hedging: дубль запроса на втором здоровом ключе, если первый не ответил к дедлайну
+    hedge_enabled: bool = True
+    hedge_percentile: float = 0.9  # дедлайн = этот перцентиль недавних задержек
+    hedge_min_delay_secs: float = 1.0
+    hedge_default_delay_secs: float = 4.0  # пока нет статистики задержек
+    hedge_max_fraction: float = 0.1  # не больше этой доли вызовов хеджируется
+    # Каскад решений для кандидатов: pre-filter -> model_fast -> model_final
+    prefilter_model_path: str | None = None  # по умолчанию <out_dir>/prefilter.json; без файла фильтр выключен
+    prefilter_explore_rate: float = 0.05  # доля отсеянных, которая все равно идет в LLM (данные для переобучения)
+    escalate_enabled: bool = True
+    escalate_confidence: float = 0.6  # решения model_fast увереннее этого подтверждаются model_final
+    # Батчи кандидатов в одном запросе model_fast (размер адаптируется к задержке, AIMD)
+    batch_enabled: bool = True
+    batch_max_size: int = 5
+    batch_target_latency_secs: float = 8.0
+    # Компактный payload: оценка токенов промпта и бюджет на один кандидат
+    prompt_token_budget: int = 600
+    news_max_items: int = 6
+
+    @field_validator('hedge_percentile', 'hedge_max_fraction', 'prefilter_explore_rate', 'escalate_confidence')
+    @classmethod
+    def validate_fractions(cls, v: float) -> float:
+        if not 0 <= v <= 1:
+            raise ValueError(f"fractions must be between 0 and 1, got {v}")
+        return v
+
+    @field_validator('decision_cache_z_step', 'decision_cache_band', 'decision_cache_chg_step', 'decision_timeout_secs')
+    @classmethod
+    def validate_cache_steps(cls, v: float) -> float:
+        if v <= 0:
+            raise ValueError(f"decision cache steps and timeouts must be positive, got {v}")
+        return v
 
 class OpenAIConf(BaseModel):
     api_key: str | None = None
@@ -18,6 +64,25 @@ class SolanaConf(BaseModel):
     private_key_b58: str | None = None
     address: str | None = None
     rpc_url: str | None = None
+    ws_url: str | None = None  # websocket RPC для подписок на пулы; по умолчанию rpc_url со схемой ws(s)://
+    send_endpoints: dict[str, str] = {}  # имя -> URL узла для sendTransaction (пути рассылки транзакций)
+    confirm_interval_secs: float = 0.4  # один batch getSignatureStatuses на все транзакции в полете
+    confirm_commitment: str = "confirmed"  # processed | confirmed | finalized
+    confirm_timeout_secs: float = 90.0  # предел ожидания (blockhash живет ~60-90 с)
+
+    @field_validator('confirm_commitment')
+    @classmethod
+    def validate_commitment(cls, v: str) -> str:
+        if v not in ("processed", "confirmed", "finalized"):
+            raise ValueError(f"confirm_commitment must be processed, confirmed or finalized, got {v}")
+        return v
+
+    @field_validator('confirm_interval_secs', 'confirm_timeout_secs')
+    @classmethod
+    def validate_confirm_timings(cls, v: float) -> float:
+        if v <= 0:
+            raise ValueError(f"confirmation timings must be positive, got {v}")
+        return v
 
 class ExecConf(BaseModel):
     dry_run: bool = True
@@ -31,6 +96,32 @@ class ExecConf(BaseModel):
     max_splits: int = 3
     # BUG FIX #32: Make WSOL/USDC rate configurable instead of hardcoded
     wsol_usdc_rate: float = 150.0  # Approximate USDC per WSOL for risk calculations
+    quote_cache_ttl_secs: float = 1.0  # micro-TTL кеш котировок GMGN (0 = только склейка запросов в полете)
+    route_reuse_max_age_secs: float = 20.0  # маршрут старше не подписывается (blockhash/цена устарели) - запрашивается заново
+    split_submit_mode: str = "sequential"  # sequential | concurrent | staggered - отправка сплитов
+    split_stagger_secs: float = 0.5  # staggered: пауза между отправками соседних сплитов
+    broadcast_buy_paths: list[str] = ["gmgn"]  # пути отправки покупок: gmgn, rpc (solana.rpc_url), имена solana.send_endpoints
+    broadcast_exit_paths: list[str] = ["gmgn", "rpc"]  # выходы - всеми путями сразу, важнее задержка (RPC пути - без anti-MEV)
+    broadcast_public_with_anti_mev: bool = False  # при anti_mev транзакция уходит только через GMGN; True - и публичными RPC путями
+    split_planner: str = "amm"  # amm - по оценке резервов пула и комиссий; threshold - ceil(pi / split_threshold_price_impact_pct) равных частей
+    split_recovery: float = 0.5  # amm: доля восстановления цены пула между сплитами (0 - сплит не помогает)
+    split_recovery_secs: float = 2.0  # amm: за сколько секунд пул восстанавливается на split_recovery (~подтверждение сплита в sequential)
+    split_reserve_lookback_mins: int = 30  # amm: окно декодов пула из прошлых сделок для оценки резервов
+    reconcile_async: bool = True  # getTransaction - в фоновом Reconciler, а не на пути исполнения (нужен solana.rpc_url)
+    reconcile_interval_secs: float = 2.0
+    reconcile_batch_size: int = 20  # подписей в одном JSON-RPC batch
+    reconcile_max_attempts: int = 8  # затем сделка помечается для ручной сверки
+    position_interval_secs: float = 15.0  # интервал проверки позиции, пока волатильность неизвестна
+    position_min_interval_secs: float = 2.0  # позиции у стопа/TP перепроверяются не реже
+    position_max_interval_secs: float = 30.0  # спокойные позиции перепроверяются не реже
+    position_vol_window: int = 20  # котировок для оценки волатильности позиции
+    position_marks_per_min: int = 120  # общий бюджет котировок всех воркеров позиций
+    position_supervisor_secs: float = 5.0  # сверка воркеров с открытыми позициями в БД
+    mark_concurrency: int = 8  # одновременных sell-котировок при mark-to-market
+    pool_tracking: bool = True  # резервы пулов позиций по подписке на vault-аккаунты: выход считается локально на каждое обновление
+    pool_fee_pct: float = 0.25  # комиссия пула в локальной цене выхода
+    onchain_detectors: bool = True  # kill-switch выходы по событиям в сети (допечатка, FreezeAccount, изъятие ликвидности)
+    lp_drop_pct: float = 30.0  # падение WSOL резерва пула (вместе с токеном), считающееся изъятием ликвидности
 
     # BUG FIX #21: Add config validation
     @field_validator('slippage_base_pct')
@@ -62,8 +153,149 @@ class ExecConf(BaseModel):
             raise ValueError(f"split_threshold_price_impact_pct must be non-negative, got {v}")
         return v
 
+    @field_validator('quote_cache_ttl_secs')
+    @classmethod
+    def validate_quote_ttl(cls, v: float) -> float:
+        if v < 0:
+            raise ValueError(f"quote_cache_ttl_secs must be >= 0, got {v}")
+        return v
+
+    @field_validator('split_submit_mode')
+    @classmethod
+    def validate_split_submit_mode(cls, v: str) -> str:
+        if v not in ("sequential", "concurrent", "staggered"):
+            raise ValueError(f"split_submit_mode must be sequential, concurrent or staggered, got {v}")
+        return v
+
+    @field_validator('split_stagger_secs')
+    @classmethod
+    def validate_split_stagger(cls, v: float) -> float:
+        if v < 0:
+            raise ValueError(f"split_stagger_secs must be >= 0, got {v}")
+        return v
+
+    @field_validator('broadcast_buy_paths', 'broadcast_exit_paths')
+    @classmethod
+    def validate_broadcast_paths(cls, v: list[str]) -> list[str]:
+        if not v:
+            raise ValueError("broadcast paths must not be empty")
+        return v
+
+    @field_validator('split_planner')
+    @classmethod
+    def validate_split_planner(cls, v: str) -> str:
+        if v not in ("amm", "threshold"):
+            raise ValueError(f"split_planner must be amm or threshold, got {v}")
+        return v
+
+    @field_validator('split_recovery')
+    @classmethod
+    def validate_split_recovery(cls, v: float) -> float:
+        if not 0 <= v <= 1:
+            raise ValueError(f"split_recovery must be between 0 and 1, got {v}")
+        return v
+
+    @field_validator('pool_fee_pct')
+    @classmethod
+    def validate_pool_fee(cls, v: float) -> float:
+        if not 0 <= v < 100:
+            raise ValueError(f"pool_fee_pct must be in [0, 100), got {v}")
+        return v
+
+    @field_validator('lp_drop_pct')
+    @classmethod
+    def validate_lp_drop(cls, v: float) -> float:
+        if not 0 < v < 100:
+            raise ValueError(f"lp_drop_pct must be in (0, 100), got {v}")
+        return v
+
+    @field_validator('route_reuse_max_age_secs', 'split_reserve_lookback_mins', 'split_recovery_secs', 'reconcile_interval_secs', 'reconcile_batch_size', 'reconcile_max_attempts',
+                     'position_interval_secs', 'position_min_interval_secs', 'position_max_interval_secs', 'position_vol_window',
+                     'position_marks_per_min', 'position_supervisor_secs', 'mark_concurrency')
+    @classmethod
+    def validate_positive_timings(cls, v):
+        if v <= 0:
+            raise ValueError(f"execution timing/batch settings must be positive, got {v}")
+        return v
+
 class FeaturesConf(BaseModel):
     hype_window_secs: int = 900
+    # Near-duplicate suppression (SimHash/LSH) для copy-paste шилл-кампаний
+    dedup_enabled: bool = True
+    dedup_max_entries: int = 20000  # жесткий лимит индекса (~320 байт на запись)
+    dedup_max_distance: int = 3  # макс. расстояние Хэмминга между 64-битными отпечатками
+    dedup_min_tokens: int = 6  # более короткие посты не дедуплицируются
+    # Symbol lifecycle: неактивные символы вытесняются из всех per-symbol кешей
+    symbol_ttl_secs: int = 3600
+    lifecycle_tick_secs: int = 30
+
+    @field_validator('dedup_max_distance')
+    @classmethod
+    def validate_dedup_distance(cls, v: int) -> int:
+        if v < 0 or v > 15:
+            raise ValueError(f"dedup_max_distance must be between 0 and 15, got {v}")
+        return v
+
+    @field_validator('symbol_ttl_secs', 'lifecycle_tick_secs')
+    @classmethod
+    def validate_lifecycle(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError(f"lifecycle intervals must be positive, got {v}")
+        return v
+
+class MarketConf(BaseModel):
+    snapshot_ttl_secs: float = 90.0  # старше - не используется в risk gates / market_score
+    max_symbols: int = 200  # LRU лимит снимков
+    max_age_secs: float = 3600.0  # снимки старше удаляются полностью
+    history_len: int = 64  # размер кольца последних снимков на токен
+    # Приоритетное обновление котировок (DexScreener)
+    discovery_interval_secs: float = 60.0  # как часто опрашивать trending pools GeckoTerminal
+    discovery_pools: int = 10
+    refresh_position_secs: float = 10.0  # открытые позиции
+    refresh_candidate_secs: float = 30.0  # топ hype-кандидаты
+    refresh_tail_secs: float = 300.0  # остальные токены
+    candidate_top_k: int = 10
+    dexscreener_budget_per_min: int = 120  # бюджет запросов планировщика
+    refresh_tick_secs: float = 1.0
+    refresh_concurrency: int = 5
+    lookup_cache_ttl_secs: float = 2.0  # micro-TTL кеш ответов DexScreener (0 = только склейка запросов в полете)
+
+    @field_validator('lookup_cache_ttl_secs')
+    @classmethod
+    def validate_lookup_ttl(cls, v: float) -> float:
+        if v < 0:
+            raise ValueError(f"lookup_cache_ttl_secs must be >= 0, got {v}")
+        return v
+
+    @field_validator('snapshot_ttl_secs', 'max_age_secs', 'refresh_position_secs', 'refresh_candidate_secs',
+                     'refresh_tail_secs', 'refresh_tick_secs', 'discovery_interval_secs')
+    @classmethod
+    def validate_ages(cls, v: float) -> float:
+        if v <= 0:
+            raise ValueError(f"market ages must be positive, got {v}")
+        return v
+
+class RateLimitConf(BaseModel):
+    rps: float  # устойчивая скорость запросов
+    burst: int = 1  # емкость bucket
+    max_retries: int = 3  # повторов после 429 прежде чем вернуть ответ
+
+    @field_validator('rps')
+    @classmethod
+    def validate_rps(cls, v: float) -> float:
+        if v <= 0:
+            raise ValueError(f"rate limit rps must be positive, got {v}")
+        return v
+
+def _default_rate_limits() -> dict[str, RateLimitConf]:
+    return {
+        "gecko": RateLimitConf(rps=0.5, burst=3),  # GeckoTerminal public: 30 req/min
+        "dexscreener": RateLimitConf(rps=4.0, burst=10),  # 300 req/min на /tokens и /search
+        "gmgn": RateLimitConf(rps=2.0, burst=5),
+        "perplexity": RateLimitConf(rps=5.0, burst=10),
+        "telegram": RateLimitConf(rps=1.0, burst=5),  # ~1 msg/s на чат
+        "solana_rpc": RateLimitConf(rps=10.0, burst=20),
+    }
 
 class LoggingConf(BaseModel):
     out_dir: str = "data"
@@ -135,12 +367,23 @@ class Settings(BaseModel):
     solana: SolanaConf = SolanaConf()
     execution: ExecConf = ExecConf()
     features: FeaturesConf = FeaturesConf()
+    market: MarketConf = MarketConf()
+    rate_limits: dict[str, RateLimitConf] = Field(default_factory=_default_rate_limits)
     logging: LoggingConf = LoggingConf()
     telegram: TelegramConf = TelegramConf()
     sources: SourcesConf = SourcesConf()
     risk: RiskConf = RiskConf()
     web: WebConf = WebConf()
 
+    @field_validator('rate_limits', mode='before')
+    @classmethod
+    def merge_rate_limits(cls, v):
+        # Частичный конфиг дополняет, а не заменяет лимиты по умолчанию
+        merged = {k: c.model_dump() for k, c in _default_rate_limits().items()}
+        for name, conf in (v or {}).items():
+            merged[name] = {**merged.get(name, {}), **(conf.model_dump() if isinstance(conf, BaseModel) else dict(conf or {}))}
+        return merged
+
     @staticmethod
     def load(path: str = DEFAULT_CFG) -> "Settings":
         if not os.path.exists(path):
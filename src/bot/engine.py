@@ -1,4 +1,4 @@
-import asyncio, json
+import asyncio, json, time
 from collections import defaultdict
 from .config import settings
 from .adapters.jetstream import stream_bluesky
@@ -9,46 +9,105 @@ from .adapters.farcaster import poll_farcaster
 from .adapters.reddit import poll_reddit_subs
 from .features.hype import HypeAggregator
 from .features.market import market_score
+from .features.market_store import MarketStore
 from .features.news import news_score
-from .llm.router import decide
+from .llm.router import decide, decide_batch, batch_sizer, decision_cache, cascade_stats
+from .llm.prefilter import candidate_features
+from .llm.payload import build_payload, prompt_stats
+from .llm.perplexity_client import ring, stream_stats, hedge_stats
 from .models import MarketSnapshot
 from .signals.scorer import decision_score
 from .signals.strategy import to_trade_signal
 from .execution.plan import to_execution_plan, to_exit_plan
-from .execution.executor import execute_sol
+from .execution.executor import execute_sol, submit_latency_stats
+from .execution.broadcast import broadcaster
+from .execution.split_planner import calibration_stats as split_calibration
+from .execution.pool_tracker import pools
+from .execution.detectors import ExitEvent, detectors
+from .execution.subscriptions import subscriptions, ws_url
+from .execution.confirm import tracker as confirmations
+from .execution.reconcile import reconciler
 from .utils.logging import log_signal, logger
 from .utils.filters import is_blocklisted, fails_risk_gates
 from .utils.control import get_dry_run, get_size_sol, get_size_usdc, is_source_enabled
 from .utils.solana import is_valid_mint
-from .utils.db import upsert_position_on_buy, get_open_positions, mark_position_check, reduce_position, get_recent_amm_pi, update_position_meta
+from .utils.db import upsert_position_on_buy, get_open_positions, get_position, mark_position_check, reduce_position, get_recent_amm_pi_many, update_position_meta, get_pool_vaults_many
 from .utils.alerts import send_alert
 from .utils.circuit_breaker import is_circuit_open, record_trade, get_status as get_cb_status
 from .utils.portfolio_risk import can_open_new_position, get_max_position_size, get_portfolio_status
+from .utils.lifecycle import SymbolLifecycle
+from .utils.refresh import RefreshScheduler
+from .utils.cadence import PositionCadence
+from .utils.ratelimit import TokenBucket
+from .utils import singleflight
+
+NEWS_PER_SYMBOL = 50
+# Котировки открытых позиций обслуживаются rate limiter'ом как выходы
+REFRESH_PRIORITY = {"position": "exit", "candidate": "execution", "tail": "discovery"}
+
+def _gecko_float(v) -> float | None:
+    """Числа GeckoTerminal приходят строками; None - поля нет или не число."""
+    try: return float(v) if v is not None else None
+    except (TypeError, ValueError): return None
 
 class Orchestrator:
     def __init__(self):
         self.hype = HypeAggregator(window_secs=settings.features.hype_window_secs)
-        self.market_cache: dict[str, MarketSnapshot] = {}
+        m = settings.market
+        self.market_cache = MarketStore(ttl_secs=m.snapshot_ttl_secs, max_symbols=m.max_symbols,
+                                        max_age_secs=m.max_age_secs, history_len=m.history_len)
         self.news_cache: dict[str, list[dict]] = defaultdict(list)
+        self.lifecycle = SymbolLifecycle(ttl_secs=settings.features.symbol_ttl_secs,
+                                         tick_secs=settings.features.lifecycle_tick_secs)
+        self.lifecycle.register("hype", self.hype.evict_symbol)
+        self.lifecycle.register("market_cache", lambda sym: self.market_cache.pop(sym, None))
+        self.lifecycle.register("news_cache", lambda sym: self.news_cache.pop(sym, None))
+        self.refresh = RefreshScheduler(intervals={"position": m.refresh_position_secs, "candidate": m.refresh_candidate_secs,
+                                                   "tail": m.refresh_tail_secs},
+                                        budget_per_min=m.dexscreener_budget_per_min, provider="dexscreener")
+        self.lifecycle.register("refresh", self.refresh.forget)
+        self.lifecycle.touch_many(self.hype.symbols())  # символы из восстановленного hype state
+        e = settings.execution
+        self.pos_cadence = PositionCadence(e.position_interval_secs, e.position_min_interval_secs, e.position_max_interval_secs,
+                                           window=e.position_vol_window)
+        # Общий бюджет котировок для всех воркеров позиций; позиции у стопа обслуживаются первыми
+        self.pos_budget = TokenBucket("position_marks", e.position_marks_per_min / 60.0, e.mark_concurrency)
+        self._mark_sem = asyncio.Semaphore(e.mark_concurrency)
+        self._amm_pi: dict[str, float | None] = {}
+        self._onchain_exits: dict[str, ExitEvent] = {}  # contract -> первое событие детекторов
 
     async def run(self):
-        tasks = [self._run_bluesky(), self._run_rss(), self._run_gecko(), self._loop_decisions(),
+        tasks = [self._run_bluesky(), self._run_rss(), self._run_gecko(), self._run_market_refresh(), self._loop_decisions(),
                  self._run_positions(), self._save_hype_state(), self._cleanup_caches()]  # BUG FIX #36
+        if settings.execution.reconcile_async and settings.solana.rpc_url: tasks.append(reconciler.run())
+        if (settings.execution.pool_tracking or settings.execution.onchain_detectors) and ws_url(): tasks.append(subscriptions.run())
+        if settings.execution.onchain_detectors and not ws_url():
+            logger.warning("onchain_detectors enabled without websocket (solana.ws_url/rpc_url) - kill-switch exits fall back to LLM kill_switch")
         if settings.sources.google_news_enabled: tasks.append(self._run_google_news())
         if settings.sources.farcaster_enabled: tasks.append(self._run_farcaster())
         if settings.sources.reddit_enabled: tasks.append(self._run_reddit())
         await asyncio.gather(*tasks)
 
+    def _ingest_post(self, post):
+        self.hype.update(post)
+        self.lifecycle.touch_many(post.symbols)
+
+    def _add_news(self, sym: str, item):
+        lst = self.news_cache[sym]
+        lst.append({"title": item.title, "url": str(item.url)})
+        del lst[:-NEWS_PER_SYMBOL]
+        self.lifecycle.touch(sym)
+
     async def _run_bluesky(self):
         async for post in stream_bluesky():
             if not is_source_enabled('bluesky'): continue
-            self.hype.update(post)
+            self._ingest_post(post)
 
     async def _run_farcaster(self):
         try:
             async for post in poll_farcaster(interval=20):
                 if not is_source_enabled('farcaster'): continue
-                self.hype.update(post)
+                self._ingest_post(post)
         except Exception as e: 
             try: await send_alert(f"❌ farcaster: {e}")
             except Exception: pass
@@ -58,7 +117,7 @@ class Orchestrator:
             subs = settings.sources.reddit_subs or ["CryptoCurrency","CryptoMarkets","solana","CryptoMoonShots"]
             async for post in poll_reddit_subs(subs=subs, interval=60):
                 if not is_source_enabled('reddit'): continue
-                self.hype.update(post)
+                self._ingest_post(post)
         except Exception as e: 
             try: await send_alert(f"❌ reddit: {e}")
             except Exception: pass
@@ -67,7 +126,7 @@ class Orchestrator:
         async for item in poll_rss(interval=60):
             if not is_source_enabled('rss'): continue
             for sym in item.symbols:
-                self.news_cache[sym].append({"title": item.title, "url": str(item.url)})
+                self._add_news(sym, item)
 
     async def _run_google_news(self):
         while True:
@@ -82,18 +141,19 @@ class Orchestrator:
                     if not is_source_enabled('google_news'): break
                     for sym in list(self.market_cache.keys()):
                         if sym.upper() in (item.title or "").upper():
-                            self.news_cache[sym].append({"title": item.title, "url": str(item.url)})
+                            self._add_news(sym, item)
             except Exception as e:
                 try: await send_alert(f"❌ google_news: {e}")
                 except Exception: pass
             await asyncio.sleep(10)
 
     async def _run_gecko(self):
+        """Discovery: трендовые пулы GeckoTerminal регистрируются в планировщике обновлений."""
         while True:
             try:
                 data = await trending_pools_solana(page=1)
                 pools = data.get("data", [])
-                for p in pools[:10]:
+                for p in pools[:settings.market.discovery_pools]:
                     attrs = p.get("attributes", {})
                     base = attrs.get("base_token", {}) or {}
                     symbol = (base.get("symbol") or "").upper() or (attrs.get("name","")[:6] or "UNK")
@@ -106,33 +166,201 @@ class Orchestrator:
                                 sol_pairs = [p for p in pairs if (p.get("chainId") == "solana" or str(p.get("chainId")).lower()=="solana")]
                                 best = (sol_pairs or pairs)[0]
                                 contract = (best.get("baseToken") or {}).get("address") or contract
-                        except Exception:
-                            pass
+                        except Exception as e:
+                            logger.debug(f"DexScreener search failed for {symbol}: {e}")
                     if not is_valid_mint(contract): continue
-                    liq = float(attrs.get("fdv_usd", 0) or 0)
-                    vol1h = float(attrs.get("volume_usd", 0) or 0)
-                    ret5m = None; spread_bps = None; price_change_1h = None; txns_h1 = None
-                    try:
-                        ds = await token_info_solana(contract)
-                        pairs = ds.get("pairs") or []
-                        if pairs:
-                            best = max(pairs, key=lambda x: float((x.get("liquidity") or {}).get("usd", 0) or 0))
-                            liq = float((best.get("liquidity") or {}).get("usd", liq) or liq)
-                            vol1h = float((best.get("volume") or {}).get("h1", vol1h) or vol1h)
-                            pc = best.get("priceChange") or {}
-                            ret5m = float(pc.get("m5", 0) or 0) / 100.0
-                            price_change_1h = float(pc.get("h1", 0) or 0) / 100.0
-                            tx = (best.get("txns") or {}).get("h1") or {}
-                            buys = int(tx.get("buys", 0) or 0); sells = int(tx.get("sells", 0) or 0)
-                            txns_h1 = buys + sells
-                            spread_bps = float(best.get("spread", best.get("priceSpread", 0)) or 0) * 100.0
-                    except Exception:
-                        pass
-                    self.market_cache[symbol] = MarketSnapshot(symbol=symbol, contract=contract, liq_usd=liq, vol_1h=vol1h,
-                        ret_5m=ret5m, price_change_1h=price_change_1h, spread_bps=spread_bps, txns_h1=txns_h1)
-            except Exception:
-                pass
-            await asyncio.sleep(30)
+                    self.refresh.track(symbol, contract, "tail")
+                    self.lifecycle.touch(symbol)
+                    if symbol not in self.market_cache:
+                        # Первичный снимок из GeckoTerminal; DexScreener уточнит его на ближайшем тике планировщика.
+                        # Ликвидность - резерв пула (reserve_in_usd), не FDV: по нему проходят risk gates
+                        vol = attrs.get("volume_usd")
+                        self.market_cache[symbol] = MarketSnapshot(symbol=symbol, contract=contract,
+                            liq_usd=_gecko_float(attrs.get("reserve_in_usd")) or 0.0,
+                            vol_1h=_gecko_float(vol.get("h1") if isinstance(vol, dict) else vol) or 0.0,
+                            price_usd=_gecko_float(attrs.get("base_token_price_usd")))
+            except Exception as e:
+                logger.warning(f"GeckoTerminal discovery error: {e}")
+            await asyncio.sleep(settings.market.discovery_interval_secs)
+
+    def _candidates(self, limit: int = 10) -> list[str]:
+        """Hype-кандидаты, ранжированные по числу упоминаний в окне."""
+        posts = self.hype.posts
+        return sorted(list(posts.keys()), key=lambda sym: len(posts.get(sym) or ()), reverse=True)[:limit]
+
+    async def _refresh_market(self, symbol: str, contract: str, tier: str = "tail") -> bool:
+        ds = await token_info_solana(contract, priority=REFRESH_PRIORITY.get(tier, "discovery"))
+        pairs = ds.get("pairs") or []
+        if not pairs: return False
+        prev = self.market_cache.get(symbol)
+        liq = prev.liq_usd if prev else 0.0; vol1h = prev.vol_1h if prev else 0.0
+        best = max(pairs, key=lambda x: float((x.get("liquidity") or {}).get("usd", 0) or 0))
+        liq = float((best.get("liquidity") or {}).get("usd", liq) or liq)
+        vol1h = float((best.get("volume") or {}).get("h1", vol1h) or vol1h)
+        pc = best.get("priceChange") or {}
+        ret5m = float(pc.get("m5", 0) or 0) / 100.0
+        price_change_1h = float(pc.get("h1", 0) or 0) / 100.0
+        tx = (best.get("txns") or {}).get("h1") or {}
+        buys = int(tx.get("buys", 0) or 0); sells = int(tx.get("sells", 0) or 0)
+        spread_bps = float(best.get("spread", best.get("priceSpread", 0)) or 0) * 100.0
+        price_usd = float(best["priceUsd"]) if best.get("priceUsd") else (prev.price_usd if prev else None)
+        self.market_cache[symbol] = MarketSnapshot(symbol=symbol, contract=contract, liq_usd=liq, vol_1h=vol1h,
+            ret_5m=ret5m, price_change_1h=price_change_1h, spread_bps=spread_bps, txns_h1=buys + sells,
+            price_usd=price_usd)
+        self.refresh.mark_refreshed(symbol)
+        return True
+
+    async def _run_market_refresh(self):
+        """Обновляет котировки по приоритетам (позиции -> hype-кандидаты -> хвост) в рамках бюджета DexScreener."""
+        last_prio = 0.0; last_report = time.monotonic()
+        while True:
+            try:
+                now = time.monotonic()
+                if now - last_prio >= 5.0:
+                    positions = {pos["symbol"]: pos["contract"] for pos in get_open_positions()}
+                    cands = {sym: None for sym in self._candidates(settings.market.candidate_top_k) if sym in self.refresh}
+                    self.refresh.set_priorities(positions, cands); last_prio = now
+                batch = self.refresh.next_batch(max_items=settings.market.refresh_concurrency)
+                if batch:
+                    results = await asyncio.gather(*(self._refresh_market(sym, contract, tier) for sym, contract, tier in batch),
+                                                   return_exceptions=True)
+                    for (sym, _, tier), r in zip(batch, results):
+                        if isinstance(r, Exception): logger.debug(f"Market refresh failed for {sym} ({tier}): {r}")
+                if now - last_report >= 300.0:
+                    logger.info(f"Market data staleness: {self.refresh.staleness()}")
+                    logger.info(f"Request coalescing: {singleflight.stats()}")
+                    if decision_cache is not None: logger.info(f"Decision cache: {decision_cache.stats()}")
+                    if settings.perplexity.stream: logger.info(f"LLM stream timings: {stream_stats()}")
+                    if settings.perplexity.hedge_enabled: logger.info(f"LLM hedging: {hedge_stats()}")
+                    logger.info(f"Decision cascade: {cascade_stats()}")
+                    logger.info(f"LLM prompt size: {prompt_stats()}")
+                    if settings.perplexity.batch_enabled: logger.info(f"Decision batches: {batch_sizer.stats()}")
+                    logger.info(f"Decision -> first tx submitted: {submit_latency_stats()}, split impact calibration: {split_calibration()}")
+                    logger.info(f"Tx broadcast paths: {broadcaster.stats()}")
+                    if settings.solana.rpc_url: logger.info(f"Tx confirmations: {confirmations.stats()}, reconciliation: {reconciler.stats()}")
+                    last_report = now
+            except Exception as e:
+                logger.error(f"Market refresh error: {e}")
+            await asyncio.sleep(settings.market.refresh_tick_secs)
+
+    def _prepare_candidate(self, sym: str) -> dict | None:
+        """Гейты и payload для кандидата; None - кандидат отсеян до LLM."""
+        hype_val, hype_meta = self.hype.hype_score(sym)
+        # Только свежие котировки (TTL) попадают в risk gates и market_score
+        mkt = self.market_cache.fresh(sym)
+        if not mkt: return None
+        bl, reason = is_blocklisted(sym, mkt.contract)
+        if bl: return None
+        fr, why = fails_risk_gates(mkt.liq_usd, mkt.txns_h1, mkt.spread_bps)
+        if fr: return None
+        nitems = self.news_cache.get(sym, [])
+        has_confirmed = any((d in it["url"]) for it in nitems for d in ["coindesk.com","cointelegraph.com","decrypt.co"])
+        nscore = news_score(has_confirmed, len(nitems))
+        mscore = market_score(mkt.liq_usd, mkt.vol_1h, mkt.ret_5m, mkt.price_change_1h, mkt.spread_bps, mkt.txns_h1)
+        dscore = decision_score(hype_val, mscore, nscore)
+        payload = build_payload(sym, mkt.contract, hype_val, hype_meta, nitems, mkt.model_dump(exclude={"fetched_at"}),
+                                max_news=settings.perplexity.news_max_items, token_budget=settings.perplexity.prompt_token_budget)
+        features = candidate_features(hype_val, hype_meta, mscore, nscore, mkt.liq_usd, mkt.vol_1h)
+        return {"symbol": sym, "mkt": mkt, "dscore": dscore, "payload": payload, "features": features}
+
+    async def _evaluate_batch(self, cands: list[dict], sem: asyncio.Semaphore) -> list[tuple[dict, object]]:
+        """Решения по группе кандидатов (один запрос model_fast на группу); None - отсеян или ошибка.
+        Дедлайн считается с постановки в очередь: ожидание слота sem входит в decision_timeout_secs."""
+        t0 = time.monotonic(); names = ",".join(c["symbol"] for c in cands)
+
+        async def run():
+            async with sem:
+                if len(cands) == 1: return [await decide(cands[0]["payload"], cands[0]["features"])]
+                return await decide_batch([(c["payload"], c["features"]) for c in cands])
+        try:
+            decs = await asyncio.wait_for(run(), settings.perplexity.decision_timeout_secs)
+        except asyncio.TimeoutError:
+            logger.warning(f"Decision for {names} timed out after {settings.perplexity.decision_timeout_secs}s")
+            return [(c, None) for c in cands]
+        except Exception as e:
+            logger.debug(f"Decision for {names} failed: {e}")
+            return [(c, None) for c in cands]
+        logger.debug(f"Decision for {names} in {time.monotonic() - t0:.2f}s")
+        return list(zip(cands, decs))
+
+    async def _evaluate_candidates(self, candidates: list[dict], handle):
+        """Решения по кандидатам группами параллельно; handle(cand, dec) вызывается по мере готовности."""
+        # Параллельно по ключам Perplexity: общая задержка ~ самый медленный вызов, а не сумма
+        sem = asyncio.Semaphore(max(1, min(ring.healthy_count(), settings.perplexity.max_concurrency)))
+        size = batch_sizer.size if settings.perplexity.batch_enabled else 1
+        groups = [candidates[i:i + size] for i in range(0, len(candidates), size)]
+        tasks = [asyncio.create_task(self._evaluate_batch(g, sem)) for g in groups]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                for cand, dec in await fut:
+                    if dec is None: continue
+                    await handle(cand, dec)
+        finally:
+            for t in tasks: t.cancel()
+
+    async def _handle_decision(self, cand: dict, dec):
+        decided_at = time.monotonic()
+        sym, mkt, dscore = cand["symbol"], cand["mkt"], cand["dscore"]
+        signal = to_trade_signal(dec, dscore)
+        # Журнал для офлайн обучения pre-filter: признаки кандидата + стал ли он торговым сигналом
+        log_signal({"symbol": sym, **cand["features"], "confidence": dec.confidence, "label": int(signal is not None)},
+                   fname_csv="decisions.csv", fname_parquet=None)
+        if not signal: return
+        # BUG FIX #66: Remove redundant import (already imported at line 17)
+        plan = to_execution_plan(dec, in_asset=settings.execution.default_input_token,
+                                 size_sol=get_size_sol(), size_usdc=get_size_usdc(),
+                                 anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+        log_signal({"symbol": sym, "decision_conf": dec.confidence, "decision_mag": dec.magnitude,
+                    "score": dscore, "action": dec.trade_proposal.action, "contract": plan.out_token,
+                    "amount_in": plan.amount_in, "slippage": plan.slippage_pct, "anti_mev": plan.anti_mev})
+        if get_dry_run(): return
+        # Portfolio risk checks
+        can_open, port_reason = can_open_new_position()
+        if not can_open:
+            try: await send_alert(f"⚠️ Portfolio limit: {port_reason}")
+            except Exception: pass
+            return
+        # Adjust position size if needed
+        # NOTE: For USDC input, we need approximate WSOL equivalent for risk checks
+        # BUG FIX #32: Use configurable rate instead of hardcoded value
+        proposed_size_wsol = get_size_sol() if settings.execution.default_input_token.upper() == "WSOL" else (get_size_usdc() / settings.execution.wsol_usdc_rate)
+        adjusted_size, size_warning = get_max_position_size(proposed_size_wsol)
+        if size_warning:
+            try: await send_alert(f"⚠️ {size_warning}")
+            except Exception: pass
+            # Recreate plan with adjusted size
+            if settings.execution.default_input_token.upper() == "WSOL":
+                plan = to_execution_plan(dec, in_asset=settings.execution.default_input_token,
+                                         size_sol=adjusted_size, size_usdc=get_size_usdc(),
+                                         anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+            else:
+                plan = to_execution_plan(dec, in_asset=settings.execution.default_input_token,
+                                         size_sol=get_size_sol(), size_usdc=adjusted_size * settings.execution.wsol_usdc_rate,
+                                         anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+        try:
+            res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""),
+                                    from_address=(settings.solana.address or ""), dry_run=False, decided_at=decided_at)
+            # After buy: aggregate realized qty & decimals and open/update position
+            qty = 0.0; decs = None
+            for x in res.get("results", []):
+                if x.get("realized_out") is not None:
+                    qty += float(x.get("realized_out") or 0.0)
+                if x.get("decimals") is not None:
+                    decs = int(x.get("decimals") or 0)
+            cost_wsol_added = float(res.get("total_in_wsol") or 0.0)
+            upsert_position_on_buy(symbol=sym, contract=plan.out_token, qty_added=qty, cost_wsol_added=cost_wsol_added,
+                                   max_hold_sec=plan.max_hold_sec, decimals=decs, entry_txns_h1=(mkt.txns_h1 or 0),
+                                   owner_address=(settings.solana.address or ""), kill_switch=plan.kill_switch)
+            try: await send_alert(f"✅ Buy {sym} opened/added qty={qty:.6f}")
+            except Exception: pass
+        except Exception as e:
+            # Record entry failure to circuit breaker - at minimum we lost gas fees
+            if settings.risk.circuit_breaker_enabled:
+                # Estimate gas loss: ~0.001 WSOL for failed transaction
+                estimated_gas_loss = -0.001
+                record_trade(estimated_gas_loss, plan.out_token)
+            try: await send_alert(f"❌ EXEC buy: {e}")
+            except Exception: pass
 
     async def _loop_decisions(self):
         while True:
@@ -145,378 +373,425 @@ class Orchestrator:
                     await asyncio.sleep(60)  # Wait 1 minute before next check
                     continue
 
-            candidates = list(self.hype.posts.keys())[:10]
-            for sym in candidates:
-                hype_val, hype_meta = self.hype.hype_score(sym)
-                mkt = self.market_cache.get(sym)
-                if not mkt: continue
-                bl, reason = is_blocklisted(sym, mkt.contract)
-                if bl: continue
-                fr, why = fails_risk_gates(mkt.liq_usd, mkt.txns_h1, mkt.spread_bps)
-                if fr: continue
-                nitems = self.news_cache.get(sym, [])
-                has_confirmed = any((d in it["url"]) for it in nitems for d in ["coindesk.com","cointelegraph.com","decrypt.co"])
-                nscore = news_score(has_confirmed, len(nitems))
-                mscore = market_score(mkt.liq_usd, mkt.vol_1h, mkt.ret_5m, mkt.price_change_1h, mkt.spread_bps, mkt.txns_h1)
-                dscore = decision_score(hype_val, mscore, nscore)
-                payload = {"symbol": sym, "contract": mkt.contract, "social": {"score":hype_val, **hype_meta},
-                           "news": nitems[:6], "market": mkt.model_dump(), "quick_filter": True}
+            candidates = [c for c in (self._prepare_candidate(sym) for sym in self._candidates(10)) if c]
+            if candidates: await self._evaluate_candidates(candidates, self._handle_decision)
+            await asyncio.sleep(15)
+
+    @staticmethod
+    def _record_exit_to_cb(invested_wsol: float, realized_wsol: float, sell_qty: float, total_qty: float, contract: str):
+        """Helper to record exit result to circuit breaker."""
+        if not settings.risk.circuit_breaker_enabled:
+            return
+        # Calculate P/L for this exit
+        invested_portion = invested_wsol * (sell_qty / max(1e-12, total_qty))
+        profit_loss = realized_wsol - invested_portion
+        record_trade(profit_loss, contract)
+
+    async def _quote_position(self, pos) -> float:
+        """Mark-to-market: ожидаемый выход в WSOL по sell-маршруту GMGN (0.0 - котировка не получена)."""
+        from .execution.gmgn_sol import WSOL, LAMPORTS, gmgn_get_route_sol
+        symbol = pos["symbol"]; contract = pos["contract"]
+        qty = float(pos["qty"] or 0.0)
+        decimals = int(pos["decimals"] or 9)
+        exp_wsol = 0.0
+        try:
+            # BUG FIX #47: Validate decimals before using in calculations
+            if decimals is None or decimals < 0 or decimals > 18:
+                decimals = 9  # Safe default for most Solana tokens
+            amt = int(qty * (10**decimals))
+            r = await gmgn_get_route_sol(contract, WSOL, amt, from_addr=(settings.solana.address or ""), slippage_pct=settings.execution.slippage_base_pct,
+                                         priority="exit")
+            q = (r.get("data") or {}).get("quote", {}) or {}
+            for k_ in ["outAmount","expectedOut","amountOut","out_amount"]:
+                if k_ in q:
+                    try: exp_wsol = float(q.get(k_)) / LAMPORTS; break
+                    except Exception: pass
+        except Exception as e:
+            try: await send_alert(f"⚠️ Quote error for {symbol}: {e}")
+            except Exception: pass
+        return exp_wsol
+
+    async def _run_positions(self):
+        """Супервизор: каждая открытая позиция обслуживается своей задачей-воркером."""
+        workers: dict[int, asyncio.Task] = {}; last_report = time.monotonic()
+        try:
+            while True:
                 try:
-                    dec = await decide(payload)
-                except Exception:
-                    continue
-                signal = to_trade_signal(dec, dscore)
-                if not signal: continue
-                # BUG FIX #66: Remove redundant import (already imported at line 17)
-                plan = to_execution_plan(dec, in_asset=settings.execution.default_input_token,
-                                         size_sol=get_size_sol(), size_usdc=get_size_usdc(),
-                                         anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                log_signal({"symbol": sym, "decision_conf": dec.confidence, "decision_mag": dec.magnitude,
-                            "score": dscore, "action": dec.trade_proposal.action, "contract": plan.out_token,
-                            "amount_in": plan.amount_in, "slippage": plan.slippage_pct, "anti_mev": plan.anti_mev})
-                if get_dry_run(): continue
-                # Portfolio risk checks
-                can_open, port_reason = can_open_new_position()
-                if not can_open:
-                    try: await send_alert(f"⚠️ Portfolio limit: {port_reason}")
+                    open_pos = {pos["id"]: pos for pos in get_open_positions() if float(pos["qty"] or 0.0) > 1e-12}
+                    self._amm_pi = get_recent_amm_pi_many([pos["contract"] for pos in open_pos.values()], minutes=60) if open_pos else {}
+                    self._sync_watchers({pos["contract"] for pos in open_pos.values()})
+                    for pid, task in list(workers.items()):
+                        if not task.done(): continue
+                        workers.pop(pid)  # история котировок забывается воркером при закрытии позиции
+                        if not task.cancelled() and task.exception():
+                            logger.error(f"Position worker {pid} failed: {task.exception()}")  # перезапускается ниже
+                    for pid in open_pos:
+                        if pid not in workers:
+                            workers[pid] = asyncio.create_task(self._position_worker(pid), name=f"position-{pid}")
+                    now = time.monotonic()
+                    if now - last_report >= 300.0:
+                        logger.info(f"Position workers: {len(workers)}, cadence: {self.pos_cadence.stats()}, budget: {self.pos_budget.status()}, "
+                                    f"pools: {pools.stats()}, detectors: {detectors.stats()}")
+                        last_report = now
+                except Exception as e:
+                    try: await send_alert(f"❌ positions: {e}")
                     except Exception: pass
+                await asyncio.sleep(settings.execution.position_supervisor_secs)
+        finally:
+            for task in workers.values(): task.cancel()
+
+    def _sync_watchers(self, contracts: set[str]):
+        """
+        Подписки PoolTracker и детекторов - на токены в открытых позициях
+        (vault'ы пула известны после первой сверенной сделки).
+        """
+        for contract in set(self._onchain_exits) - contracts: self._onchain_exits.pop(contract)
+        if settings.execution.pool_tracking:
+            for contract in pools.watched() - contracts: pools.unwatch(contract)
+            for contract, row in get_pool_vaults_many(sorted(contracts - pools.watched())).items():
+                pools.watch(contract, row["token_vault"], row["quote_vault"])
+        if settings.execution.onchain_detectors:
+            for contract in detectors.watched() - contracts: detectors.unwatch(contract)
+            for contract in contracts - detectors.watched(): detectors.watch(contract)
+
+    async def _position_worker(self, pid: int):
+        """
+        Котировка -> правила выхода -> ожидание; выход, когда позиция закрыта.
+        Пока пул отслеживается, цена выхода считается локально по резервам, а воркер будится
+        обновлениями пула, но не чаще раза в position_min_interval_secs; иначе - котировка GMGN
+        и пауза по волатильности и расстоянию до порогов.
+        Событие on-chain детектора будит воркер и закрывает позицию целиком без котировки.
+        """
+        contract = None; wake = asyncio.Event(); killed = asyncio.Event()
+
+        def on_exit_event(ev: ExitEvent):
+            self._onchain_exits.setdefault(ev.contract, ev); killed.set(); wake.set()
+        try:
+            while True:
+                pos = get_position(pid)
+                if not pos or pos["state"] != "open" or float(pos["qty"] or 0.0) <= 1e-12:
+                    self.pos_cadence.forget(pid); return
+                if contract is None:
+                    contract = pos["contract"]; pools.add_listener(contract, wake.set); detectors.add_handler(contract, on_exit_event)
+                wake.clear()
+                ev = self._onchain_exits.get(contract)
+                if ev is not None:
+                    try:
+                        await self._kill_exit(pos, ev)
+                    except Exception as e:
+                        try: await send_alert(f"❌ kill-switch exit {pos['symbol']} ({ev.reason}): {e}")
+                        except Exception: pass
+                        await asyncio.sleep(self.pos_cadence.min_secs)
                     continue
-                # Adjust position size if needed
-                # NOTE: For USDC input, we need approximate WSOL equivalent for risk checks
-                # BUG FIX #32: Use configurable rate instead of hardcoded value
-                proposed_size_wsol = get_size_sol() if settings.execution.default_input_token.upper() == "WSOL" else (get_size_usdc() / settings.execution.wsol_usdc_rate)
-                adjusted_size, size_warning = get_max_position_size(proposed_size_wsol)
-                if size_warning:
-                    try: await send_alert(f"⚠️ {size_warning}")
-                    except Exception: pass
-                    # Recreate plan with adjusted size
-                    if settings.execution.default_input_token.upper() == "WSOL":
-                        plan = to_execution_plan(dec, in_asset=settings.execution.default_input_token,
-                                                 size_sol=adjusted_size, size_usdc=get_size_usdc(),
-                                                 anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                    else:
-                        plan = to_execution_plan(dec, in_asset=settings.execution.default_input_token,
-                                                 size_sol=get_size_sol(), size_usdc=adjusted_size * settings.execution.wsol_usdc_rate,
-                                                 anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+                exp_wsol = pools.exit_quote(contract, float(pos["qty"] or 0.0))
+                if exp_wsol is None:
+                    await self.pos_budget.acquire("exit" if self.pos_cadence.urgent(pid) else "execution")
+                    async with self._mark_sem:
+                        exp_wsol = await self._quote_position(pos)
+                self.pos_cadence.observe(pid, exp_wsol)
+                distance = None; evaluated_at = time.monotonic()
                 try:
-                    res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""),
-                                            from_address=(settings.solana.address or ""), dry_run=False)
-                    # After buy: aggregate realized qty & decimals and open/update position
-                    qty = 0.0; decs = None
-                    for x in res.get("results", []):
-                        if x.get("realized_out") is not None:
-                            qty += float(x.get("realized_out") or 0.0)
-                        if x.get("decimals") is not None:
-                            decs = int(x.get("decimals") or 0)
-                    cost_wsol_added = float(res.get("total_in_wsol") or 0.0)
-                    upsert_position_on_buy(symbol=sym, contract=plan.out_token, qty_added=qty, cost_wsol_added=cost_wsol_added,
-                                           max_hold_sec=plan.max_hold_sec, decimals=decs, entry_txns_h1=(mkt.txns_h1 or 0),
-                                           owner_address=(settings.solana.address or ""), kill_switch=plan.kill_switch)
-                    try: await send_alert(f"✅ Buy {sym} opened/added qty={qty:.6f}")
-                    except Exception: pass
+                    distance = await self._evaluate_position(pos, exp_wsol, self._amm_pi.get(contract))
                 except Exception as e:
-                    # Record entry failure to circuit breaker - at minimum we lost gas fees
-                    if settings.risk.circuit_breaker_enabled:
-                        # Estimate gas loss: ~0.001 WSOL for failed transaction
-                        estimated_gas_loss = -0.001
-                        record_trade(estimated_gas_loss, plan.out_token)
-                    try: await send_alert(f"❌ EXEC buy: {e}")
+                    try: await send_alert(f"❌ position {pos['symbol']}: {e}")
                     except Exception: pass
-            await asyncio.sleep(15)
+                try: await asyncio.wait_for(wake.wait(), timeout=self.pos_cadence.next_interval(pid, distance))
+                except asyncio.TimeoutError: pass
+                # обновления пула склеиваются до одной проверки за position_min_interval_secs (каждая - запись в БД);
+                # событие детектора не ждет
+                rest = self.pos_cadence.min_secs - (time.monotonic() - evaluated_at)
+                if rest > 0 and not killed.is_set():
+                    try: await asyncio.wait_for(killed.wait(), timeout=rest)
+                    except asyncio.TimeoutError: pass
+        finally:
+            if contract is not None:
+                pools.remove_listener(contract, wake.set); detectors.remove_handler(contract, on_exit_event)
 
-    async def _run_positions(self):
-        from .execution.gmgn_sol import WSOL, LAMPORTS, gmgn_get_route_sol
+    @staticmethod
+    def _onchain_kill_switch(contract: str) -> bool:
+        """Kill-switch выходы по on-chain детекторам: включены, websocket подключен и токен под наблюдением."""
+        return settings.execution.onchain_detectors and detectors.covers(contract)
+
+    async def _kill_exit(self, pos, ev: ExitEvent):
+        """Полный выход по событию on-chain детектора (rug/допечатка/заморозка) - по рынку, без проверки котировки."""
+        symbol = pos["symbol"]; contract = pos["contract"]
+        qty = float(pos["qty"] or 0.0); invested = float(pos["invested_wsol"] or 0.0)
+        plan = to_exit_plan(symbol, contract, qty, int(pos["decimals"] or 9), out_asset=settings.execution.default_input_token,
+                            slippage_base_pct=settings.execution.slippage_base_pct,
+                            anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+        res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
+        realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
+        reduce_position(pos["id"], qty_sold=qty, expected_out_wsol=None, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None,
+                        tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason=f"kill_switch:{ev.reason}")
+        self._record_exit_to_cb(invested, realized, qty, qty, contract)
+        try: await send_alert(f"⛔ Kill-switch exit {symbol}: {ev.reason} at slot {ev.slot} ({ev.detail})")
+        except Exception: pass
 
-        def _record_exit_to_cb(invested_wsol: float, realized_wsol: float, sell_qty: float, total_qty: float, contract: str):
-            """Helper to record exit result to circuit breaker."""
-            if not settings.risk.circuit_breaker_enabled:
+    async def _evaluate_position(self, pos, exp_wsol: float, recent_min_pi: float | None) -> float | None:
+        """
+        Правила выхода (time stop, TP, trailing, downgrade, stress) по готовой котировке;
+        kill-switch выходы - по событиям on-chain детекторов в _position_worker, а пока они
+        не покрывают токен (выключены, websocket не подключен, токен не под наблюдением) - по kill_switch из решения LLM.
+        Возвращает относительное расстояние до ближайшего порога (None - был выход или нет котировки).
+        """
+        symbol = pos["symbol"]; contract = pos["contract"]
+        qty = float(pos["qty"] or 0.0)
+        invested = float(pos["invested_wsol"] or 0.0)
+        # LOGIC FIX #1: Get original invested from meta for TP threshold calculations
+        meta = {}
+        try:
+            meta = json.loads(pos["meta_json"] or "{}")
+        except Exception:
+            meta = {}
+        original_invested = float(meta.get("original_invested_wsol", invested))
+        decimals = int(pos["decimals"] or 9)
+        max_hold_sec = int(pos["max_hold_sec"] or 0)
+        opened_at = pos["opened_at"]
+        quote_failed = exp_wsol <= 0
+        # BUG FIX #28: Track quote failures and emergency exit after 5 consecutive failures
+        meta = {}
+        try:
+            meta = json.loads(pos["meta_json"] or "{}")
+        except Exception:
+            meta = {}
+
+        if quote_failed:
+            quote_failures = meta.get("quote_failures", 0) + 1
+            meta["quote_failures"] = quote_failures
+
+            # Emergency exit after 5 consecutive failures
+            if quote_failures >= 5:
+                update_position_meta(pos["id"], meta)
+                try:
+                    # Force close position with market order (no quote check)
+                    sell_qty = qty
+                    plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
+                                        slippage_base_pct=settings.execution.slippage_base_pct * 2,  # Double slippage for emergency
+                                        anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+                    res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
+                    realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
+                    reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=None, realized_out_wsol=realized,
+                                  slippage_pct=None, amm_pi_pct=None,
+                                  tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None),
+                                  reason="emergency_quote_failure")
+                    self._record_exit_to_cb(invested, realized, sell_qty, qty, contract)
+                    await send_alert(f"🚨 Emergency exit {symbol} after {quote_failures} quote failures")
+                except Exception as e:
+                    logger.error(f"Emergency exit failed for {symbol}: {e}")
                 return
-            # Calculate P/L for this exit
-            invested_portion = invested_wsol * (sell_qty / max(1e-12, total_qty))
-            profit_loss = realized_wsol - invested_portion
-            record_trade(profit_loss, contract)
 
-        while True:
+            # Not yet at emergency threshold, save and skip
+            update_position_meta(pos["id"], meta)
+            return
+        else:
+            # Quote succeeded, reset failure counter
+            if meta.get("quote_failures", 0) > 0:
+                meta["quote_failures"] = 0
+                update_position_meta(pos["id"], meta)
+
+        current_ret = (exp_wsol - invested) / max(1e-9, invested) if invested>0 else 0.0
+        # LOGIC FIX #1: Calculate TP thresholds relative to ORIGINAL investment
+        original_current_ret = (exp_wsol - original_invested) / max(1e-9, original_invested) if original_invested>0 else 0.0
+        # HWM update
+        hwm_wsol = float(pos["hwm_wsol"] or 0.0)
+        new_hwm_wsol = max(hwm_wsol, exp_wsol)
+        high_ret = (new_hwm_wsol - original_invested) / max(1e-9, original_invested) if original_invested>0 else 0.0
+        steps = int(max(0.0, high_ret) // 0.05)
+        trail_pct = max(0.08, 0.12 - 0.02 * steps)
+        drawdown = (new_hwm_wsol - exp_wsol) / max(1e-9, new_hwm_wsol) if new_hwm_wsol>0 else 0.0
+        tp1_done = bool(pos["tp1_done"]); tp2_done = bool(pos["tp2_done"])
+        # Market snapshot (устаревший снимок не используется для stress-проверок)
+        m = self.market_cache.fresh(symbol)
+
+        # Pre-calculate market stress conditions
+        stress_spread = m and m.spread_bps is not None and m.spread_bps > 1.5 * settings.risk.max_spread_bps
+        stress_txns = m and m.txns_h1 is not None and int(pos["entry_txns_h1"] or 0) > 0 and m.txns_h1 < 0.5 * int(pos["entry_txns_h1"])
+        recent_min_pi = recent_min_pi or 0.0
+        stress_amm = recent_min_pi < -8.0
+
+        # Hype downgrade - OPTIMIZED: Only check every 5 minutes to reduce LLM costs
+        from datetime import datetime as _dt, timezone as _tz
+        last_check_ts = pos["last_check_ts"] if pos["last_check_ts"] else None
+        should_check_downgrade = True
+        if last_check_ts:
             try:
-                open_pos = get_open_positions()
-                for pos in open_pos:
-                    symbol = pos["symbol"]; contract = pos["contract"]
-                    qty = float(pos["qty"] or 0.0)
-                    if qty <= 1e-12: continue
-                    invested = float(pos["invested_wsol"] or 0.0)
-                    # LOGIC FIX #1: Get original invested from meta for TP threshold calculations
-                    meta = {}
-                    try:
-                        meta = json.loads(pos["meta_json"] or "{}")
-                    except Exception:
-                        meta = {}
-                    original_invested = float(meta.get("original_invested_wsol", invested))
-                    decimals = int(pos["decimals"] or 9)
-                    max_hold_sec = int(pos["max_hold_sec"] or 0)
-                    opened_at = pos["opened_at"]
-                    # Mark: quote token->WSOL
-                    exp_wsol = 0.0
-                    quote_failed = False
-                    try:
-                        # BUG FIX #47: Validate decimals before using in calculations
-                        if decimals is None or decimals < 0 or decimals > 18:
-                            decimals = 9  # Safe default for most Solana tokens
-                        amt = int(qty * (10**decimals))
-                        r = await gmgn_get_route_sol(contract, WSOL, amt, from_addr=(settings.solana.address or ""), slippage_pct=settings.execution.slippage_base_pct)
-                        q = (r.get("data") or {}).get("quote", {}) or {}
-                        for k_ in ["outAmount","expectedOut","amountOut","out_amount"]:
-                            if k_ in q:
-                                try: exp_wsol = float(q.get(k_)) / LAMPORTS; break
-                                except Exception: pass
-                        if exp_wsol <= 0:
-                            quote_failed = True
-                    except Exception as e:
-                        quote_failed = True
-                        try: await send_alert(f"⚠️ Quote error for {symbol}: {e}")
-                        except Exception: pass
+                last_check = _dt.fromisoformat(last_check_ts)
+                # BUG FIX #22: Replace deprecated utcnow() with now(timezone.utc)
+                if (_dt.now(_tz.utc) - last_check).total_seconds() < 300:  # 5 minutes
+                    should_check_downgrade = False
+            except Exception:
+                pass
 
-                    # BUG FIX #28: Track quote failures and emergency exit after 5 consecutive failures
-                    meta = {}
-                    try:
-                        meta = json.loads(pos["meta_json"] or "{}")
-                    except Exception:
-                        meta = {}
-
-                    if quote_failed:
-                        quote_failures = meta.get("quote_failures", 0) + 1
-                        meta["quote_failures"] = quote_failures
-
-                        # Emergency exit after 5 consecutive failures
-                        if quote_failures >= 5:
-                            update_position_meta(pos["id"], meta)
-                            try:
-                                # Force close position with market order (no quote check)
-                                sell_qty = qty
-                                plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
-                                                    slippage_base_pct=settings.execution.slippage_base_pct * 2,  # Double slippage for emergency
-                                                    anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                                res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
-                                realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
-                                reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=None, realized_out_wsol=realized,
-                                              slippage_pct=None, amm_pi_pct=None,
-                                              tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None),
-                                              reason="emergency_quote_failure")
-                                _record_exit_to_cb(invested, realized, sell_qty, qty, contract)
-                                await send_alert(f"🚨 Emergency exit {symbol} after {quote_failures} quote failures")
-                            except Exception as e:
-                                logger.error(f"Emergency exit failed for {symbol}: {e}")
-                            continue
-
-                        # Not yet at emergency threshold, save and skip
-                        update_position_meta(pos["id"], meta)
-                        continue
-                    else:
-                        # Quote succeeded, reset failure counter
-                        if meta.get("quote_failures", 0) > 0:
-                            meta["quote_failures"] = 0
-                            update_position_meta(pos["id"], meta)
-
-                    current_ret = (exp_wsol - invested) / max(1e-9, invested) if invested>0 else 0.0
-                    # LOGIC FIX #1: Calculate TP thresholds relative to ORIGINAL investment
-                    original_current_ret = (exp_wsol - original_invested) / max(1e-9, original_invested) if original_invested>0 else 0.0
-                    # HWM update
-                    hwm_wsol = float(pos["hwm_wsol"] or 0.0)
-                    new_hwm_wsol = max(hwm_wsol, exp_wsol)
-                    high_ret = (new_hwm_wsol - original_invested) / max(1e-9, original_invested) if original_invested>0 else 0.0
-                    steps = int(max(0.0, high_ret) // 0.05)
-                    trail_pct = max(0.08, 0.12 - 0.02 * steps)
-                    drawdown = (new_hwm_wsol - exp_wsol) / max(1e-9, new_hwm_wsol) if new_hwm_wsol>0 else 0.0
-                    tp1_done = bool(pos["tp1_done"]); tp2_done = bool(pos["tp2_done"])
-                    # Market snapshot
-                    m = self.market_cache.get(symbol)
-
-                    # Pre-calculate market stress conditions
-                    stress_spread = m and m.spread_bps is not None and m.spread_bps > 1.5 * settings.risk.max_spread_bps
-                    stress_txns = m and m.txns_h1 is not None and int(pos["entry_txns_h1"] or 0) > 0 and m.txns_h1 < 0.5 * int(pos["entry_txns_h1"])
-                    recent_min_pi = get_recent_amm_pi(contract, minutes=60) or 0.0
-                    stress_amm = recent_min_pi < -8.0
-
-                    # Hype downgrade - OPTIMIZED: Only check every 5 minutes to reduce LLM costs
-                    from datetime import datetime as _dt, timezone as _tz
-                    last_check_ts = pos["last_check_ts"] if pos["last_check_ts"] else None
-                    should_check_downgrade = True
-                    if last_check_ts:
-                        try:
-                            last_check = _dt.fromisoformat(last_check_ts)
-                            # BUG FIX #22: Replace deprecated utcnow() with now(timezone.utc)
-                            if (_dt.now(_tz.utc) - last_check).total_seconds() < 300:  # 5 minutes
-                                should_check_downgrade = False
-                        except Exception:
-                            pass
-
-                    downgrade = False
-                    if should_check_downgrade:
-                        # BUG FIX #24: Update last_check_ts BEFORE LLM call to prevent race condition
-                        mark_position_check(pos["id"], None, None, None, None)  # Updates last_check_ts
-
-                        hype_val, hype_meta = self.hype.hype_score(symbol)
-                        z_sum = (hype_meta.get("z_m",0)+hype_meta.get("z_a",0)+hype_meta.get("z_e",0))
-                        nitems = self.news_cache.get(symbol, [])
-                        has_confirmed = any((d in it["url"]) for it in nitems for d in ["coindesk.com","cointelegraph.com","decrypt.co"])
-                        nscore = news_score(has_confirmed, len(nitems))
-                        mscore = market_score(m.liq_usd if m else 0.0, m.vol_1h if m else 0.0, m.ret_5m if m else 0.0, m.price_change_1h if m else 0.0, m.spread_bps if m else None, m.txns_h1 if m else None)
-                        dscore = decision_score(hype_val, mscore, nscore)
-                        try:
-                            payload = {"symbol": symbol, "contract": contract, "social": {"score":hype_val, **hype_meta}, "news": nitems[:6], "market": m.model_dump() if m else {}, "quick_filter": True}
-                            dec2 = await decide(payload)
-                            if (dscore < 0.0 or dec2.direction == "down" or dec2.trade_proposal.action in ("flat","short")) and (z_sum < 0):
-                                downgrade = True
-                        except Exception:
-                            pass
-                    # Load kill switches
-                    kills = set()
-                    try:
-                        meta = json.loads(pos["meta_json"] or "{}"); kills = set([k.lower() for k in meta.get("kill_switch", [])])
-                    except Exception:
-                        kills = set()
-                    # --- Exits
-                    # Kill-switch -> full
-                    if any(k in kills for k in ("rug","lp_pull","honeypot","dev_minted_more")):
-                        sell_qty = qty
-                        plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
-                                            slippage_base_pct=settings.execution.slippage_base_pct,
-                                            anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                        res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
-                        realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
-                        reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="kill_switch")
-                        _record_exit_to_cb(invested, realized, sell_qty, qty, contract)
-                        try: await send_alert(f"⛔ Kill-switch exit {symbol}")
-                        except Exception: pass
-                        continue
-                    # Time stop
-                    if max_hold_sec and opened_at:
-                        from datetime import datetime as _dt, timezone as _tz
-                        t0 = _dt.fromisoformat(opened_at)
-                        # BUG FIX #22: Replace deprecated utcnow() with now(timezone.utc)
-                        if (_dt.now(_tz.utc) - t0).total_seconds() >= max_hold_sec:
-                            sell_qty = qty
-                            plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
-                                                slippage_base_pct=settings.execution.slippage_base_pct,
-                                                anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                            res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
-                            realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
-                            reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="time_stop")
-                            _record_exit_to_cb(invested, realized, sell_qty, qty, contract)
-                            try: await send_alert(f"⏰ Time-stop exit {symbol}")
-                            except Exception: pass
-                            continue
-                    # TP ladder
-                    # LOGIC FIX #1: Use original_current_ret for threshold checks
-                    if not tp1_done and original_current_ret >= 0.15:
-                        # BUG FIX #65: Mark tp1_done BEFORE executing to prevent race condition
-                        mark_position_check(pos["id"], None, None, True, None)
-                        tp1_done = True
-
-                        sell_qty = qty * 0.30
-                        expected_out_portion = exp_wsol * (sell_qty / qty)  # Correct proportion
-                        plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
-                                            slippage_base_pct=settings.execution.slippage_base_pct,
-                                            anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                        res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
-                        realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
-                        reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=expected_out_portion, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="tp1")
-                        # BUG FIX #16: Update local variables after partial exit
-                        # CRITICAL: Calculate invested_portion BEFORE updating qty
-                        qty_before_exit = qty
-                        invested_portion = invested * (sell_qty / qty_before_exit)  # Invested for sold portion
-                        qty = qty - sell_qty
-                        exp_wsol = exp_wsol - expected_out_portion  # Update exp_wsol for remaining qty
-                        invested = invested - invested_portion  # Update invested for remaining
-                        # BUG FIX #31: Prevent negative values from rounding errors
-                        qty = max(0.0, qty)
-                        exp_wsol = max(0.0, exp_wsol)
-                        invested = max(0.0, invested)
-                        current_ret = (exp_wsol - invested) / max(1e-9, invested) if invested > 0 else 0.0  # Recalculate
-                        _record_exit_to_cb(invested, realized, sell_qty, qty_before_exit, contract)  # Record to CB with qty BEFORE exit
-                        try: await send_alert(f"🎯 TP1 exit 30% {symbol}")
-                        except Exception: pass
-                    # LOGIC FIX #1: Use original_current_ret for threshold checks
-                    if not tp2_done and original_current_ret >= 0.35:
-                        # BUG FIX #65: Mark tp2_done BEFORE executing to prevent race condition
-                        mark_position_check(pos["id"], None, None, None, True)
-                        tp2_done = True
-
-                        sell_qty = qty * 0.30  # 30% of REMAINING qty
-                        # BUG FIX #10: Use correct proportion calculation (same as TP1)
-                        expected_out_portion = exp_wsol * (sell_qty / qty)
-                        plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
-                                            slippage_base_pct=settings.execution.slippage_base_pct,
-                                            anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                        res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
-                        realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
-                        reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=expected_out_portion, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="tp2")
-                        # BUG FIX #16: Update local variables after partial exit
-                        # CRITICAL: Calculate invested_portion BEFORE updating qty
-                        qty_before_exit = qty
-                        invested_portion = invested * (sell_qty / qty_before_exit)  # Invested for sold portion
-                        qty = qty - sell_qty
-                        exp_wsol = exp_wsol - expected_out_portion  # Update exp_wsol for remaining qty
-                        invested = invested - invested_portion  # Update invested for remaining
-                        # BUG FIX #31: Prevent negative values from rounding errors
-                        qty = max(0.0, qty)
-                        exp_wsol = max(0.0, exp_wsol)
-                        invested = max(0.0, invested)
-                        current_ret = (exp_wsol - invested) / max(1e-9, invested) if invested > 0 else 0.0  # Recalculate
-                        _record_exit_to_cb(invested, realized, sell_qty, qty_before_exit, contract)  # Record to CB with qty BEFORE exit
-                        try: await send_alert(f"🎯 TP2 exit 30% {symbol}")
-                        except Exception: pass
-                    # Trailing stop (remaining)
-                    if new_hwm_wsol > 0 and drawdown >= trail_pct:
-                        sell_qty = qty
-                        plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
-                                            slippage_base_pct=settings.execution.slippage_base_pct,
-                                            anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                        res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
-                        realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
-                        reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="trailing_stop")
-                        _record_exit_to_cb(invested, realized, sell_qty, qty, contract)
-                        try: await send_alert(f"🪓 Trailing stop exit {symbol}")
-                        except Exception: pass
-                        continue
-                    # Downgrade exit (half/full)
-                    if downgrade:
-                        if current_ret <= 0.0 or dscore < -0.5:
-                            sell_qty = qty
-                            reason = "downgrade_full"
-                        else:
-                            sell_qty = qty * 0.5
-                            reason = "downgrade_half"
-                        plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
-                                            slippage_base_pct=settings.execution.slippage_base_pct,
-                                            anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                        res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
-                        realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
-                        reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol*(sell_qty/qty), realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason=reason)
-                        _record_exit_to_cb(invested, realized, sell_qty, qty, contract)
-                        try: await send_alert(f"📉 Downgrade exit {symbol} ({reason})")
-                        except Exception: pass
-                        # continue to next pos
-                        continue
-                    # Market stress (spread/txns/amm) - Use pre-calculated conditions
-                    if stress_spread or stress_txns or stress_amm:
-                        sell_qty = qty
-                        reason = "stress_spread" if stress_spread else ("stress_txns" if stress_txns else "stress_amm_pi")
-                        plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
-                                            slippage_base_pct=settings.execution.slippage_base_pct,
-                                            anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
-                        res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
-                        realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
-                        reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason=reason)
-                        _record_exit_to_cb(invested, realized, sell_qty, qty, contract)
-                        try: await send_alert(f"⚠️ Market-stress exit {symbol} ({reason})")
-                        except Exception: pass
-                        continue  # Skip to next position after stress exit
-                    # persist marks/state
-                    mark_position_check(pos["id"], new_hwm_wsol, high_ret, tp1_done, tp2_done)
-            except Exception as e:
-                try: await send_alert(f"❌ positions: {e}")
+        downgrade = False
+        if should_check_downgrade:
+            # BUG FIX #24: Update last_check_ts BEFORE LLM call to prevent race condition
+            mark_position_check(pos["id"], None, None, None, None)  # Updates last_check_ts
+
+            hype_val, hype_meta = self.hype.hype_score(symbol)
+            z_sum = (hype_meta.get("z_m",0)+hype_meta.get("z_a",0)+hype_meta.get("z_e",0))
+            nitems = self.news_cache.get(symbol, [])
+            has_confirmed = any((d in it["url"]) for it in nitems for d in ["coindesk.com","cointelegraph.com","decrypt.co"])
+            nscore = news_score(has_confirmed, len(nitems))
+            mscore = market_score(m.liq_usd if m else 0.0, m.vol_1h if m else 0.0, m.ret_5m if m else 0.0, m.price_change_1h if m else 0.0, m.spread_bps if m else None, m.txns_h1 if m else None)
+            dscore = decision_score(hype_val, mscore, nscore)
+            try:
+                payload = build_payload(symbol, contract, hype_val, hype_meta, nitems, m.model_dump(exclude={"fetched_at"}) if m else {},
+                                        max_news=settings.perplexity.news_max_items, token_budget=settings.perplexity.prompt_token_budget)
+                dec2 = await decide(payload)
+                if (dscore < 0.0 or dec2.direction == "down" or dec2.trade_proposal.action in ("flat","short")) and (z_sum < 0):
+                    downgrade = True
+            except Exception:
+                pass
+        # Kill-switch -> full: пока on-chain детекторы не покрывают токен (нет websocket, переподключение,
+        # токен еще не под наблюдением) - по списку kill_switch из решения LLM
+        if not self._onchain_kill_switch(contract):
+            kills = set()
+            try:
+                kills = set([k.lower() for k in json.loads(pos["meta_json"] or "{}").get("kill_switch", [])])
+            except Exception:
+                kills = set()
+            if any(k in kills for k in ("rug","lp_pull","honeypot","dev_minted_more")):
+                sell_qty = qty
+                plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
+                                    slippage_base_pct=settings.execution.slippage_base_pct,
+                                    anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+                res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
+                realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
+                reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="kill_switch")
+                self._record_exit_to_cb(invested, realized, sell_qty, qty, contract)
+                try: await send_alert(f"⛔ Kill-switch exit {symbol}")
                 except Exception: pass
-            await asyncio.sleep(15)
+                return
+        # Time stop
+        if max_hold_sec and opened_at:
+            from datetime import datetime as _dt, timezone as _tz
+            t0 = _dt.fromisoformat(opened_at)
+            # BUG FIX #22: Replace deprecated utcnow() with now(timezone.utc)
+            if (_dt.now(_tz.utc) - t0).total_seconds() >= max_hold_sec:
+                sell_qty = qty
+                plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
+                                    slippage_base_pct=settings.execution.slippage_base_pct,
+                                    anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+                res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
+                realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
+                reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="time_stop")
+                self._record_exit_to_cb(invested, realized, sell_qty, qty, contract)
+                try: await send_alert(f"⏰ Time-stop exit {symbol}")
+                except Exception: pass
+                return
+        # TP ladder
+        # LOGIC FIX #1: Use original_current_ret for threshold checks
+        if not tp1_done and original_current_ret >= 0.15:
+            # BUG FIX #65: Mark tp1_done BEFORE executing to prevent race condition
+            mark_position_check(pos["id"], None, None, True, None)
+            tp1_done = True
+
+            sell_qty = qty * 0.30
+            expected_out_portion = exp_wsol * (sell_qty / qty)  # Correct proportion
+            plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
+                                slippage_base_pct=settings.execution.slippage_base_pct,
+                                anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+            res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
+            realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
+            reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=expected_out_portion, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="tp1")
+            # BUG FIX #16: Update local variables after partial exit
+            # CRITICAL: Calculate invested_portion BEFORE updating qty
+            qty_before_exit = qty
+            invested_portion = invested * (sell_qty / qty_before_exit)  # Invested for sold portion
+            qty = qty - sell_qty
+            exp_wsol = exp_wsol - expected_out_portion  # Update exp_wsol for remaining qty
+            invested = invested - invested_portion  # Update invested for remaining
+            # BUG FIX #31: Prevent negative values from rounding errors
+            qty = max(0.0, qty)
+            exp_wsol = max(0.0, exp_wsol)
+            invested = max(0.0, invested)
+            current_ret = (exp_wsol - invested) / max(1e-9, invested) if invested > 0 else 0.0  # Recalculate
+            self._record_exit_to_cb(invested, realized, sell_qty, qty_before_exit, contract)  # Record to CB with qty BEFORE exit
+            try: await send_alert(f"🎯 TP1 exit 30% {symbol}")
+            except Exception: pass
+        # LOGIC FIX #1: Use original_current_ret for threshold checks
+        if not tp2_done and original_current_ret >= 0.35:
+            # BUG FIX #65: Mark tp2_done BEFORE executing to prevent race condition
+            mark_position_check(pos["id"], None, None, None, True)
+            tp2_done = True
+
+            sell_qty = qty * 0.30  # 30% of REMAINING qty
+            # BUG FIX #10: Use correct proportion calculation (same as TP1)
+            expected_out_portion = exp_wsol * (sell_qty / qty)
+            plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
+                                slippage_base_pct=settings.execution.slippage_base_pct,
+                                anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+            res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
+            realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
+            reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=expected_out_portion, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="tp2")
+            # BUG FIX #16: Update local variables after partial exit
+            # CRITICAL: Calculate invested_portion BEFORE updating qty
+            qty_before_exit = qty
+            invested_portion = invested * (sell_qty / qty_before_exit)  # Invested for sold portion
+            qty = qty - sell_qty
+            exp_wsol = exp_wsol - expected_out_portion  # Update exp_wsol for remaining qty
+            invested = invested - invested_portion  # Update invested for remaining
+            # BUG FIX #31: Prevent negative values from rounding errors
+            qty = max(0.0, qty)
+            exp_wsol = max(0.0, exp_wsol)
+            invested = max(0.0, invested)
+            current_ret = (exp_wsol - invested) / max(1e-9, invested) if invested > 0 else 0.0  # Recalculate
+            self._record_exit_to_cb(invested, realized, sell_qty, qty_before_exit, contract)  # Record to CB with qty BEFORE exit
+            try: await send_alert(f"🎯 TP2 exit 30% {symbol}")
+            except Exception: pass
+        # Trailing stop (remaining)
+        if new_hwm_wsol > 0 and drawdown >= trail_pct:
+            sell_qty = qty
+            plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
+                                slippage_base_pct=settings.execution.slippage_base_pct,
+                                anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+            res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
+            realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
+            reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason="trailing_stop")
+            self._record_exit_to_cb(invested, realized, sell_qty, qty, contract)
+            try: await send_alert(f"🪓 Trailing stop exit {symbol}")
+            except Exception: pass
+            return
+        # Downgrade exit (half/full)
+        if downgrade:
+            if current_ret <= 0.0 or dscore < -0.5:
+                sell_qty = qty
+                reason = "downgrade_full"
+            else:
+                sell_qty = qty * 0.5
+                reason = "downgrade_half"
+            plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
+                                slippage_base_pct=settings.execution.slippage_base_pct,
+                                anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+            res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
+            realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
+            reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol*(sell_qty/qty), realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason=reason)
+            self._record_exit_to_cb(invested, realized, sell_qty, qty, contract)
+            try: await send_alert(f"📉 Downgrade exit {symbol} ({reason})")
+            except Exception: pass
+            # continue to next pos
+            return
+        # Market stress (spread/txns/amm) - Use pre-calculated conditions
+        if stress_spread or stress_txns or stress_amm:
+            sell_qty = qty
+            reason = "stress_spread" if stress_spread else ("stress_txns" if stress_txns else "stress_amm_pi")
+            plan = to_exit_plan(symbol, contract, sell_qty, decimals, out_asset=settings.execution.default_input_token,
+                                slippage_base_pct=settings.execution.slippage_base_pct,
+                                anti_mev=settings.execution.gmgn_anti_mev, priority_fee_sol=settings.execution.sol_priority_fee_sol)
+            res = await execute_sol(plan, payer_b58=(settings.solana.private_key_b58 or ""), from_address=(settings.solana.address or ""), dry_run=False)
+            realized = sum((x.get("realized_out") or 0) for x in res.get("results", []))
+            reduce_position(pos["id"], qty_sold=sell_qty, expected_out_wsol=exp_wsol, realized_out_wsol=realized, slippage_pct=None, amm_pi_pct=None, tx=(res.get("results",[{}])[0].get("tx") if res.get("results") else None), reason=reason)
+            self._record_exit_to_cb(invested, realized, sell_qty, qty, contract)
+            try: await send_alert(f"⚠️ Market-stress exit {symbol} ({reason})")
+            except Exception: pass
+            return  # Skip to next position after stress exit
+        # persist marks/state
+        mark_position_check(pos["id"], new_hwm_wsol, high_ret, tp1_done, tp2_done)
+        # Расстояние до ближайшего порога (trailing stop, TP1/TP2) задает частоту следующей проверки
+        gaps = [trail_pct - drawdown] if new_hwm_wsol > 0 else []
+        if not tp1_done: gaps.append(0.15 - original_current_ret)
+        if not tp2_done: gaps.append(0.35 - original_current_ret)
+        return min(gaps) if gaps else None
 
     async def _save_hype_state(self):
         """Периодически сохраняет состояние hype aggregator."""
@@ -533,24 +808,18 @@ class Orchestrator:
                     pass
 
     async def _cleanup_caches(self):
-        """BUG FIX #36: Периодически очищает старые записи из кешей для предотвращения утечки памяти."""
+        """Вытесняет неактивные символы из всех per-symbol кешей (hype, market, news) через timing wheel."""
         while True:
             try:
-                await asyncio.sleep(3600)  # Очищаем каждый час
-                # Оставляем только последние 100 символов в market_cache
-                if len(self.market_cache) > 100:
-                    # Удаляем старые записи, оставляем 100 последних
-                    sorted_keys = sorted(self.market_cache.keys())
-                    for key in sorted_keys[:-100]:
-                        del self.market_cache[key]
-                    logger.info(f"Cleaned market_cache, kept 100 most recent entries")
-
-                # Очищаем news_cache для символов без открытых позиций
+                await asyncio.sleep(settings.features.lifecycle_tick_secs)
+                # Символы открытых позиций не вытесняются (и остаются под учетом после закрытия)
                 open_symbols = {pos["symbol"] for pos in get_open_positions()}
-                symbols_to_remove = [sym for sym in self.news_cache.keys() if sym not in open_symbols and len(self.news_cache[sym]) > 50]
-                for sym in symbols_to_remove:
-                    del self.news_cache[sym]
-                if symbols_to_remove:
-                    logger.info(f"Cleaned news_cache, removed {len(symbols_to_remove)} stale entries")
+                self.lifecycle.set_pinned(open_symbols)
+                self.lifecycle.touch_many(open_symbols)
+                evicted = self.lifecycle.advance()
+                if evicted:
+                    logger.info(f"Lifecycle evicted {len(evicted)} inactive symbols, live={self.lifecycle.live_count}")
+                # Снимки старше market.max_age_secs не хранятся даже для живых символов
+                self.market_cache.prune()
             except Exception as e:
                 logger.error(f"Cache cleanup error: {e}")
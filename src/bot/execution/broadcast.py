@@ -0,0 +1,123 @@
+"""
+Broadcaster - отправка одной подписанной транзакции сразу несколькими путями.
+
+Пути: "gmgn" (tx proxy GMGN), "rpc" (solana.rpc_url) и именованные узлы
+solana.send_endpoints (sendTransaction). Набор путей задается отдельно для
+покупок и выходов (execution.broadcast_buy_paths / broadcast_exit_paths);
+с anti-MEV транзакция уходит только через GMGN (RPC пути его не поддерживают).
+Транзакция уходит всеми путями параллельно; результат - по первому
+подтверждению приема (ack), остальные отправки завершаются в фоне - это та же
+транзакция с той же подписью, в сеть она попадет один раз. Повторная отправка
+той же подписи (ретрай) не рассылается заново, а получает результат первой.
+По путям копится статистика: ack, ошибки, победы и landing latency победителя.
+"""
+from __future__ import annotations
+import asyncio, base64, time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+from solders.transaction import VersionedTransaction
+from ..config import settings
+from ..utils.logging import logger
+from .gmgn_sol import gmgn_send_tx_sol
+from .rpc import rpc_call
+
+
+def tx_signature(signed_b64: str) -> Optional[str]:
+    """Подпись (id) транзакции - первая подпись; None, если транзакцию не разобрать."""
+    try: return str(VersionedTransaction.from_bytes(base64.b64decode(signed_b64)).signatures[0])
+    except Exception: return None
+
+
+class Broadcaster:
+    def __init__(self, clock: Callable[[], float] = time.monotonic, dedupe_size: int = 1000):
+        self._clock = clock
+        self._recent: OrderedDict[str, asyncio.Future] = OrderedDict()  # подпись -> результат первой рассылки
+        self._dedupe_size = int(dedupe_size)
+        self._stats: dict[str, dict] = {}
+        self.deduped = 0
+
+    def _path_stats(self, name: str) -> dict:
+        return self._stats.setdefault(name, {"acks": 0, "errors": 0, "wins": 0, "ack_ms": deque(maxlen=200), "landing_ms": deque(maxlen=200)})
+
+    def paths_for(self, side: str, anti_mev: bool = False) -> list[str]:
+        """Включенные и настроенные пути стороны; без единого рабочего - GMGN.
+        sendTransaction через RPC не защищен от MEV: при anti_mev - только GMGN, если не разрешено явно."""
+        wanted = settings.execution.broadcast_buy_paths if side == "buy" else settings.execution.broadcast_exit_paths
+        if anti_mev and not settings.execution.broadcast_public_with_anti_mev: wanted = [p for p in wanted if p == "gmgn"]
+        out = []
+        for name in wanted:
+            if name == "gmgn" or (name == "rpc" and settings.solana.rpc_url) or name in settings.solana.send_endpoints:
+                if name not in out: out.append(name)
+            else:
+                logger.debug(f"Broadcast path {name} is not configured - skipped")
+        return out or ["gmgn"]
+
+    async def _send_one(self, name: str, signed_b64: str, anti_mev: bool, priority: str) -> Optional[str]:
+        if name == "gmgn":
+            sent = await gmgn_send_tx_sol(signed_b64, anti_mev=anti_mev, priority=priority)
+            return (sent.get("data") or {}).get("hash")
+        url = settings.solana.rpc_url if name == "rpc" else settings.solana.send_endpoints[name]
+        # preflight уже сделан при построении маршрута; ретраи отправки - у нас, не у узла
+        return await rpc_call("sendTransaction", [signed_b64, {"encoding": "base64", "skipPreflight": True, "maxRetries": 0}],
+                              priority=priority, url=url)
+
+    async def _timed(self, name: str, signed_b64: str, anti_mev: bool, priority: str) -> tuple[str, Optional[str]]:
+        t0 = self._clock(); st = self._path_stats(name)
+        try:
+            h = await self._send_one(name, signed_b64, anti_mev, priority)
+            if not h: raise RuntimeError(f"{name} returned no signature")  # прием не подтвержден - гонка продолжается
+        except Exception:
+            st["errors"] += 1; raise
+        st["acks"] += 1; st["ack_ms"].append(round(1000 * (self._clock() - t0)))
+        return name, h
+
+    async def send(self, signed_b64: str, *, side: str, anti_mev: bool = False, priority: str = "execution") -> dict:
+        """Ответ в формате GMGN ({"data": {"hash"}}) + "path" - путь, первым принявший транзакцию."""
+        sig = tx_signature(signed_b64)
+        if sig is not None and sig in self._recent:
+            prev = self._recent[sig]
+            if not prev.done() or prev.exception() is None:
+                self.deduped += 1
+                return await asyncio.shield(prev)
+        fut = asyncio.get_running_loop().create_future()
+        if sig is not None:
+            self._recent[sig] = fut
+            while len(self._recent) > self._dedupe_size: self._recent.popitem(last=False)
+        tasks = [asyncio.create_task(self._timed(p, signed_b64, anti_mev, priority)) for p in self.paths_for(side, anti_mev)]
+        errors = []
+        try:
+            for done in asyncio.as_completed(tasks):
+                try:
+                    name, h = await done
+                except Exception as e:
+                    errors.append(str(e)); continue
+                if sig is not None and h != sig: logger.warning(f"Broadcast path {name} returned {h} for {sig}")
+                self._path_stats(name)["wins"] += 1
+                res = {"data": {"hash": sig or h}, "path": name}
+                fut.set_result(res)
+                return res
+            err = RuntimeError(f"broadcast failed on all paths: {'; '.join(errors)}")
+            fut.set_exception(err); fut.exception()  # ретрай той же подписи разрешен
+            raise err
+        except BaseException as e:
+            # отмена или сбой посреди гонки: ожидающие ту же подпись получают ошибку, ретрай разошлет заново
+            if not fut.done():
+                fut.set_exception(RuntimeError(f"broadcast interrupted: {e!r}")); fut.exception()
+                if sig is not None and self._recent.get(sig) is fut: self._recent.pop(sig)
+            raise
+        finally:
+            for t in tasks:  # остальные пути дорабатывают в фоне; их ошибки уже учтены в статистике
+                t.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def record_landing(self, path: Optional[str], landing_ms: Optional[int]):
+        """Время от отправки до подтверждения транзакции, выигранной путем path."""
+        if path and landing_ms is not None: self._path_stats(path)["landing_ms"].append(int(landing_ms))
+
+    def stats(self) -> dict:
+        def p50(v): return sorted(v)[len(v) // 2] if v else None
+        return {"deduped": self.deduped, **{name: {"acks": st["acks"], "errors": st["errors"], "wins": st["wins"],
+                                                   "ack_p50_ms": p50(st["ack_ms"]), "landing_p50_ms": p50(st["landing_ms"])}
+                                            for name, st in self._stats.items()}}
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,115 @@
+"""
+Confirmation Tracker - общее отслеживание подтверждения всех отправленных транзакций.
+
+Все ожидающие подписи раз в interval_secs проверяются одним JSON-RPC batch
+запросом (getBlockHeight + getSignatureStatuses по 256 подписей), поэтому
+нагрузка на RPC не растет с числом транзакций в полете. Подпись, которой нет
+в сети после lastValidBlockHeight, считается истекшей. Каждая транзакция
+получает свой future; время от отправки до подтверждения - landing latency.
+Без solana.rpc_url используется GMGN get_transaction_status.
+"""
+from __future__ import annotations
+import asyncio, time
+from collections import deque
+from typing import Callable, Optional
+from ..config import settings
+from ..utils.logging import logger
+from .rpc import RPCError, rpc_batch
+
+MAX_SIGNATURES_PER_CALL = 256  # лимит getSignatureStatuses
+_COMMITMENT_RANK = {"processed": 0, "confirmed": 1, "finalized": 2}
+
+
+class ConfirmationTracker:
+    def __init__(self, interval_secs: float = 0.4, commitment: str = "confirmed", timeout_secs: float = 90.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.interval_secs = float(interval_secs)
+        self.commitment = commitment
+        self.timeout_secs = float(timeout_secs)
+        self._clock = clock
+        self._pending: dict[str, dict] = {}  # signature -> {"fut", "last_valid", "sent_at"}
+        self._task: Optional[asyncio.Task] = None
+        self._landing: deque = deque(maxlen=500)
+        self.counts = {"confirmed": 0, "failed": 0, "expired": 0, "timeout": 0}
+        self.polls = 0; self.rpc_errors = 0
+
+    def track(self, signature: str, last_valid_height: int | None) -> asyncio.Future:
+        """Future с итогом транзакции: {"success", "state", "err", "slot", "landing_ms"}."""
+        it = self._pending.get(signature)
+        if it is not None and not it["fut"].done(): return it["fut"]
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._task.get_loop() is not loop:
+            # Новый event loop (перезапуск/тесты): ожидания старого loop недействительны
+            self._pending = {k: v for k, v in self._pending.items() if v["fut"].get_loop() is loop}
+        fut = loop.create_future()
+        self._pending[signature] = {"fut": fut, "last_valid": last_valid_height, "sent_at": self._clock()}
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run(), name="confirmations")
+        return fut
+
+    async def wait(self, signature: str, last_valid_height: int | None) -> dict:
+        return await asyncio.shield(self.track(signature, last_valid_height))
+
+    def _resolve(self, signature: str, state: str, **extra):
+        it = self._pending.pop(signature, None)
+        if it is None or it["fut"].done(): return
+        landing_ms = round(1000 * (self._clock() - it["sent_at"]))
+        if state == "confirmed": self._landing.append(landing_ms)
+        self.counts[state] += 1
+        it["fut"].set_result({"success": state == "confirmed", "state": state, "landing_ms": landing_ms, **extra})
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.interval_secs)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                self.rpc_errors += 1
+                logger.debug(f"Confirmation poll failed: {e}")
+            now = self._clock()
+            for sig, it in list(self._pending.items()):
+                if now - it["sent_at"] > self.timeout_secs:  # RPC недоступен или нет lastValidBlockHeight
+                    self._resolve(sig, "timeout", err=None, slot=None)
+
+    async def poll_once(self):
+        """Один batch запрос на все ожидающие подписи."""
+        sigs = [s for s, it in self._pending.items() if not it["fut"].done()]
+        if not sigs: return
+        chunks = [sigs[i:i + MAX_SIGNATURES_PER_CALL] for i in range(0, len(sigs), MAX_SIGNATURES_PER_CALL)]
+        calls = [("getBlockHeight", [{"commitment": "confirmed"}])]
+        calls += [("getSignatureStatuses", [chunk, {"searchTransactionHistory": False}]) for chunk in chunks]
+        self.polls += 1
+        res = await rpc_batch(calls, priority="exit")
+        height = res[0] if isinstance(res[0], int) else None
+        need = _COMMITMENT_RANK.get(self.commitment, 1)
+        for chunk, r in zip(chunks, res[1:]):
+            if isinstance(r, RPCError): self.rpc_errors += 1; continue
+            values = (r or {}).get("value") or []
+            for sig, st in zip(chunk, values):
+                if st is None:
+                    last_valid = self._pending.get(sig, {}).get("last_valid")
+                    if height is not None and last_valid is not None and height > int(last_valid):
+                        self._resolve(sig, "expired", err=None, slot=None)
+                    continue
+                if st.get("err") is not None:
+                    self._resolve(sig, "failed", err=st.get("err"), slot=st.get("slot"))
+                elif _COMMITMENT_RANK.get(st.get("confirmationStatus") or "processed", 0) >= need:
+                    self._resolve(sig, "confirmed", err=None, slot=st.get("slot"))
+
+    def stats(self) -> dict:
+        v = sorted(self._landing)
+        out = {"pending": len(self._pending), "polls": self.polls, "rpc_errors": self.rpc_errors, **self.counts}
+        if v: out |= {"landing_p50_ms": v[len(v) // 2], "landing_p90_ms": v[min(len(v) - 1, int(0.9 * len(v)))]}
+        return out
+
+
+tracker = ConfirmationTracker(interval_secs=settings.solana.confirm_interval_secs, commitment=settings.solana.confirm_commitment,
+                              timeout_secs=settings.solana.confirm_timeout_secs)
+
+
+async def confirm_tx(signature: str, last_valid_height: int | None, *, priority: str = "execution") -> dict:
+    """Статус транзакции в формате GMGN ({"data": {"success": ...}}): через трекер или GMGN без RPC."""
+    if not settings.solana.rpc_url:
+        from .gmgn_sol import gmgn_poll_status
+        return await gmgn_poll_status(signature, last_valid_height, priority=priority)
+    return {"data": await tracker.wait(signature, last_valid_height)}
@@ -0,0 +1,165 @@
+"""
+On-chain kill-switch детекторы - события выхода по тому, что реально произошло в сети.
+
+По каждому токену в открытых позициях через общий SubscriptionHub:
+  - accountSubscribe на mint: рост supply - допечатка (dev_minted_more);
+  - logsSubscribe (mentions mint): инструкция FreezeAccount - заморозка
+    держателей freeze authority (honeypot);
+  - резервы пула из PoolTracker: согласованный снимок (обе стороны в одном
+    слоте), где WSOL резерв упал на lp_drop_pct и токен тоже убыл - изъятие
+    ликвидности (lp_pull); своп двигает резервы в разные стороны.
+Событие сразу передается обработчикам (воркерам позиций); задержка обнаружения
+считается от времени блока (getBlockTime слота, секундная точность) уже после.
+"""
+from __future__ import annotations
+import asyncio, time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+from ..config import settings
+from ..utils.logging import logger
+from .pool_tracker import PoolTracker, pools
+from .rpc import rpc_call
+from .subscriptions import SubscriptionHub, subscriptions
+
+REASONS = ("lp_pull", "dev_minted_more", "honeypot")
+
+
+@dataclass
+class ExitEvent:
+    contract: str
+    reason: str  # lp_pull | dev_minted_more | honeypot
+    slot: int
+    detail: str
+    signature: Optional[str] = None
+    detected_at: float = 0.0  # unix time обнаружения
+    latency_ms: Optional[int] = None  # от времени блока до обнаружения
+
+
+def _supply(value: dict | None) -> Optional[int]:
+    try: return int(value["data"]["parsed"]["info"]["supply"])
+    except Exception: return None
+
+
+class OnchainDetectors:
+    def __init__(self, pools: PoolTracker, lp_drop_pct: float = 30.0, commitment: str = "confirmed",
+                 hub: SubscriptionHub | None = None, wall_clock: Callable[[], float] = time.time):
+        self.pools = pools
+        self.lp_drop = float(lp_drop_pct) / 100.0
+        self.commitment = commitment
+        self.hub = hub if hub is not None else subscriptions
+        self._wall = wall_clock
+        self._watched: dict[str, Callable[[], None]] = {}  # contract -> слушатель пула
+        self._supply: dict[str, tuple[int, int]] = {}  # contract -> (supply, slot)
+        self._pool_state: dict[str, tuple[float, float, int]] = {}
+        self._handlers: dict[str, set[Callable[[ExitEvent], None]]] = {}
+        self._fired: dict[str, set[str]] = {}
+        self._latency: deque = deque(maxlen=200)
+        self.counts = {r: 0 for r in REASONS}
+        self.hub.on_connect(self._snapshot_all)
+
+    def watch(self, contract: str):
+        if contract in self._watched: return
+        listener = lambda c=contract: self._on_pool(c)
+        self._watched[contract] = listener
+        self.pools.add_listener(contract, listener)
+        self.hub.subscribe(f"account:{contract}", "accountSubscribe", [contract, {"encoding": "jsonParsed", "commitment": self.commitment}],
+                           lambda res, c=contract: self._on_mint(c, res))
+        self.hub.subscribe(f"logs:{contract}", "logsSubscribe", [{"mentions": [contract]}, {"commitment": self.commitment}],
+                           lambda res, c=contract: self._on_logs(c, res))
+        if self.hub.connected:
+            try: asyncio.get_running_loop().create_task(self._snapshot([contract]))
+            except RuntimeError: pass
+
+    def unwatch(self, contract: str):
+        listener = self._watched.pop(contract, None)
+        if listener is None: return
+        self.pools.remove_listener(contract, listener)
+        self.hub.unsubscribe(f"account:{contract}"); self.hub.unsubscribe(f"logs:{contract}")
+        for d in (self._supply, self._pool_state, self._fired): d.pop(contract, None)
+
+    def watched(self) -> set[str]:
+        return set(self._watched)
+
+    def covers(self, contract: str) -> bool:
+        """События по contract сейчас приходят: websocket подключен и токен под наблюдением."""
+        return self.hub.connected and contract in self._watched
+
+    def add_handler(self, contract: str, cb: Callable[[ExitEvent], None]):
+        self._handlers.setdefault(contract, set()).add(cb)
+
+    def remove_handler(self, contract: str, cb: Callable[[ExitEvent], None]):
+        cbs = self._handlers.get(contract)
+        if cbs is not None:
+            cbs.discard(cb)
+            if not cbs: self._handlers.pop(contract, None)
+
+    def _emit(self, contract: str, reason: str, slot: int, detail: str, signature: Optional[str] = None):
+        fired = self._fired.setdefault(contract, set())
+        if reason in fired: return
+        fired.add(reason); self.counts[reason] += 1
+        ev = ExitEvent(contract=contract, reason=reason, slot=slot, detail=detail, signature=signature, detected_at=self._wall())
+        logger.warning(f"On-chain {reason} for {contract} at slot {slot}: {detail}")
+        for cb in list(self._handlers.get(contract, ())):
+            try: cb(ev)
+            except Exception as e: logger.error(f"Exit handler failed for {contract}: {e}")
+        try: asyncio.get_running_loop().create_task(self._measure(ev))
+        except RuntimeError: pass
+
+    async def _measure(self, ev: ExitEvent):
+        if not settings.solana.rpc_url: return
+        try:
+            block_time = await rpc_call("getBlockTime", [ev.slot], priority="exit")
+        except Exception as e:
+            logger.debug(f"getBlockTime {ev.slot} failed: {e}"); return
+        if block_time is None: return
+        ev.latency_ms = max(0, round(1000 * (ev.detected_at - float(block_time))))
+        self._latency.append(ev.latency_ms)
+        logger.info(f"On-chain {ev.reason} for {ev.contract}: detected {ev.latency_ms} ms after block time")
+
+    def _on_mint(self, contract: str, res: dict):
+        slot = int((res.get("context") or {}).get("slot") or 0); supply = _supply(res.get("value"))
+        if supply is None: return
+        prev = self._supply.get(contract)
+        if prev is not None and slot < prev[1]: return  # снимок старше уведомления
+        self._supply[contract] = (supply, slot)
+        if prev is not None and supply > prev[0]:
+            self._emit(contract, "dev_minted_more", slot, f"supply {prev[0]} -> {supply}")
+
+    def _on_logs(self, contract: str, res: dict):
+        value = res.get("value") or {}
+        if value.get("err") is not None: return
+        if any("Instruction: FreezeAccount" in line for line in value.get("logs") or []):
+            self._emit(contract, "honeypot", int((res.get("context") or {}).get("slot") or 0), "FreezeAccount", value.get("signature"))
+
+    def _on_pool(self, contract: str):
+        state = self.pools.state(contract)
+        if state is None: return
+        prev = self._pool_state.get(contract); self._pool_state[contract] = state
+        if prev is None or state[2] <= prev[2]: return
+        rt0, rw0, _ = prev; rt, rw, slot = state
+        if rw <= rw0 * (1 - self.lp_drop) and rt < rt0:
+            self._emit(contract, "lp_pull", slot, f"WSOL reserve {rw0:.4g} -> {rw:.4g}, token reserve {rt0:.4g} -> {rt:.4g}")
+
+    async def _snapshot(self, contracts: list[str]):
+        """Исходный supply минтов - без него первое изменение не с чем сравнить."""
+        if not settings.solana.rpc_url or not contracts: return
+        try:
+            res = await rpc_call("getMultipleAccounts", [contracts, {"encoding": "jsonParsed", "commitment": self.commitment}], priority="exit")
+        except Exception as e:
+            logger.debug(f"Mint snapshot failed: {e}"); return
+        ctx = (res or {}).get("context") or {}
+        for contract, value in zip(contracts, (res or {}).get("value") or []):
+            self._on_mint(contract, {"context": ctx, "value": value})
+
+    async def _snapshot_all(self):
+        await self._snapshot(list(self._watched))
+
+    def stats(self) -> dict:
+        out = {"watched": len(self._watched), **self.counts}
+        v = sorted(self._latency)
+        if v: out |= {"latency_p50_ms": v[len(v) // 2], "latency_max_ms": v[-1]}
+        return out
+
+
+detectors = OnchainDetectors(pools, lp_drop_pct=settings.execution.lp_drop_pct, commitment=settings.solana.confirm_commitment)
@@ -1,40 +1,93 @@
 from ..models import ExecutionPlan
-from .gmgn_sol import gmgn_get_route_sol, sol_sign_tx_base64, gmgn_send_tx_sol, gmgn_poll_status
+from .gmgn_sol import gmgn_get_route_sol, sol_sign_tx_base64, WSOL, LAMPORTS
+from .broadcast import broadcaster
+from .confirm import confirm_tx
+from .rpc import token_decimals
+from .settlement import owner_balances, remember_pool, slippage_pct
+from .split_planner import SplitPlan, estimate_reserve, plan_splits, record_realized
 from ..config import settings
 from ..utils.alerts import send_alert
-from ..utils.db import save_quote, save_trade
+from ..utils.db import get_recent_pool_samples, save_quote, save_trade
 from ..utils.amm_decode import estimate_pool_price_impact
 from ..utils.logging import logger
-import httpx, math
+from ..utils.ratelimit import limited_request
+from collections import deque
+import asyncio, httpx, math, time
+_BASE_FEE_SOL = 0.000005  # базовая комиссия за подпись, сверх priority fee
+_submit_latencies: deque = deque(maxlen=200)  # решение -> первая отправленная транзакция, сек
+def submit_latency_stats() -> dict:
+    if not _submit_latencies: return {"trades": 0}
+    v = sorted(_submit_latencies)
+    return {"trades": len(v), "p50_ms": round(1000 * v[len(v) // 2]), "p90_ms": round(1000 * v[min(len(v) - 1, int(0.9 * len(v)))]),
+            "max_ms": round(1000 * v[-1])}
+def _quote_out(q: dict) -> float | None:
+    for k_ in ["outAmount","expectedOut","amountOut","out_amount"]:
+        if k_ in q:
+            try: return float(q[k_])
+            except Exception: pass
+    return None
+def _split_recovery() -> float:
+    """Восстановление пула между сплитами при текущем режиме отправки: sequential ждет подтверждения
+    (split_recovery), concurrent не ждет вовсе, staggered - пропорционально паузе split_stagger_secs."""
+    conf = settings.execution
+    if conf.split_submit_mode == "concurrent": return 0.0
+    if conf.split_submit_mode == "staggered": return conf.split_recovery * min(1.0, conf.split_stagger_secs / conf.split_recovery_secs)
+    return conf.split_recovery
+def _plan_amm_splits(plan: ExecutionPlan, q0: dict, pi: float) -> SplitPlan:
+    """Сплиты по оценке резервов пула (котировка + недавние декоды) с учетом комиссии каждой транзакции."""
+    amount = int(plan.amount_in)
+    contract = plan.out_token if plan.side == "buy" else plan.in_token
+    try: samples = get_recent_pool_samples(contract, plan.side, minutes=settings.execution.split_reserve_lookback_mins)
+    except Exception as e:
+        logger.debug(f"Pool samples unavailable for {contract}: {e}"); samples = []
+    fee_lamports = ((plan.priority_fee_sol if plan.priority_fee_sol is not None else settings.execution.sol_priority_fee_sol)
+                    + _BASE_FEE_SOL) * LAMPORTS
+    if plan.in_token == WSOL: fee_in = fee_lamports
+    else:
+        out0 = _quote_out(q0)  # продажа: комиссия в SOL переводится в токен по курсу котировки
+        fee_in = fee_lamports * amount / out0 if out0 else math.inf
+    # без восстановления пула между сплитами их суммарный impact равен одному свопу - делить незачем
+    return plan_splits(amount, estimate_reserve(amount, pi, samples), fee_in, settings.execution.max_splits, _split_recovery())
+def _route_fresh(route: dict, fetched_at: float) -> bool:
+    """Маршрут можно подписывать: есть транзакция и blockhash еще заведомо действителен (~60-90 с, берем с запасом)."""
+    raw = (route.get("data") or {}).get("raw_tx") or {}
+    return bool(raw.get("swapTransaction")) and raw.get("lastValidBlockHeight") is not None and \
+        time.monotonic() - fetched_at <= settings.execution.route_reuse_max_age_secs
 async def _fetch_solana_tx(sig: str) -> dict | None:
     url = settings.solana.rpc_url
     if not url: return None
     payload = {"jsonrpc":"2.0","id":1,"method":"getTransaction","params":[sig,{"encoding":"jsonParsed","maxSupportedTransactionVersion":0}]}
     try:
         async with httpx.AsyncClient(timeout=20) as cli:
-            r = await cli.post(url, json=payload); r.raise_for_status(); return r.json().get("result")
+            r = await limited_request("solana_rpc", lambda: cli.post(url, json=payload), priority="execution")
+            r.raise_for_status(); return r.json().get("result")
     except Exception: return None
-def _extract_owner_balances(meta: dict, owner: str, mint: str) -> tuple[float,float,int]:
-    pre = meta.get("preTokenBalances") or []; post = meta.get("postTokenBalances") or []
-    def pick(balances):
-        for b in balances:
-            try:
-                if b.get("owner") == owner and b.get("mint") == mint:
-                    ui = b.get("uiTokenAmount") or {}; return float(ui.get("uiAmount", 0) or 0), int(ui.get("decimals", 0) or 0)
-            except Exception: continue
-        return 0.0, 0
-    a0, dec0 = pick(pre); a1, dec1 = pick(post); return a0, a1, max(dec0, dec1)
-async def execute_sol(plan: ExecutionPlan, *, payer_b58: str, from_address: str, dry_run: bool = True) -> dict:
-    # initial route for price impact & potential split calc
-    route0 = await gmgn_get_route_sol(plan.in_token, plan.out_token, int(plan.amount_in), from_address,
-                                      plan.slippage_pct or settings.execution.slippage_base_pct,
-                                      is_anti_mev=plan.anti_mev, fee_sol=plan.priority_fee_sol)
+async def execute_sol(plan: ExecutionPlan, *, payer_b58: str, from_address: str, dry_run: bool = True,
+                      decided_at: float | None = None) -> dict:
+    """decided_at - time.monotonic() момента решения (по умолчанию - вызов) для замера до первой отправки."""
+    decided_at = time.monotonic() if decided_at is None else decided_at
+    # Выходы обслуживаются rate limiter'ом раньше покупок
+    prio = "exit" if plan.side == "sell" else "execution"
+
+    async def split_route(amt: int) -> tuple[dict, float]:
+        # Маршрут сплита подписывается и отправляется - не склеиваем с чужими запросами
+        r = await gmgn_get_route_sol(plan.in_token, plan.out_token, int(amt), from_address,
+                                     plan.slippage_pct or settings.execution.slippage_base_pct,
+                                     is_anti_mev=plan.anti_mev, fee_sol=plan.priority_fee_sol, priority=prio, coalesce=False)
+        return r, time.monotonic()
+    # initial route for price impact & potential split calc (без сплита он же и подписывается)
+    route0, route0_at = await split_route(int(plan.amount_in))
     q0 = route0.get("data",{}).get("quote",{}) or {}
     pi = float(q0.get("priceImpact", 0) or q0.get("price_impact", 0) or 0)
-    splits = [int(plan.amount_in)]
+    splits = [int(plan.amount_in)]; predicted = [None]
+    if settings.execution.split_planner == "amm":
+        sp = _plan_amm_splits(plan, q0, pi); splits = sp.sizes; predicted = sp.predicted_pi_pct
+        if len(splits) > 1:
+            logger.info(f"{plan.side} {plan.symbol or plan.out_token}: {len(splits)} splits {splits}, reserve≈{sp.reserve:.4g}, "
+                        f"predicted pool pi {[round(x, 2) for x in predicted]}%, impact cost {sp.impact_cost:.4g} + fees {sp.fee_cost:.4g}")
     # BUG FIX #45: Validate splits to prevent invalid or negative values
     # BUG FIX #60: Prevent division by zero in split calculations
-    if pi > settings.execution.split_threshold_price_impact_pct and settings.execution.max_splits > 1:
+    elif pi > settings.execution.split_threshold_price_impact_pct and settings.execution.max_splits > 1:
         threshold = max(0.1, settings.execution.split_threshold_price_impact_pct)  # Prevent division by zero
         k = min(settings.execution.max_splits, max(2, math.ceil(pi / threshold)))
         k = max(1, k)  # Ensure k is at least 1
@@ -43,21 +96,33 @@ async def execute_sol(plan: ExecutionPlan, *, payer_b58: str, from_address: str,
         if part > 0:
             last_split = int(plan.amount_in) - part*(k-1)
             if last_split > 0:
-                splits = [part]*(k-1) + [last_split]
+                splits = [part]*(k-1) + [last_split]; predicted = [None]*k
             else:
                 # Fallback: use single trade if splits don't work
                 splits = [int(plan.amount_in)]
+    # Маршруты сплитов: без сплита - route0 (пока blockhash свежий), иначе все сразу параллельно
+    if len(splits) == 1 and splits[0] == int(plan.amount_in) and _route_fresh(route0, route0_at):
+        routes = [(route0, route0_at)]
+    else:
+        routes = await asyncio.gather(*(split_route(amt) for amt in splits), return_exceptions=True)
+        if all(isinstance(x, Exception) for x in routes): raise routes[0]
     results = []; total_in_wsol = 0.0; failed_splits = []  # BUG FIX #8: Track failed splits
-    for idx, amt in enumerate(splits, start=1):
-        r = await gmgn_get_route_sol(plan.in_token, plan.out_token, int(amt), from_address,
-                                     plan.slippage_pct or settings.execution.slippage_base_pct,
-                                     is_anti_mev=plan.anti_mev, fee_sol=plan.priority_fee_sol)
+    reconcile_async = settings.execution.reconcile_async and bool(settings.solana.rpc_url)
+    first_submit_ms = None
+
+    async def run_split(idx: int, amt: int):
+        """Маршрут -> подпись -> отправка -> подтверждение -> сверка балансов одного сплита, независимо от остальных."""
+        nonlocal total_in_wsol, first_submit_ms
+        route = routes[idx-1]
+        if isinstance(route, Exception):
+            failed_splits.append((idx, str(route)))
+            results.append({"error": str(route), "split": idx, "expected_out": None})
+            return
+        r, fetched_at = route
+        if not dry_run and idx > 1 and time.monotonic() - fetched_at > settings.execution.route_reuse_max_age_secs:
+            r, fetched_at = await split_route(amt)  # предыдущие сплиты подтверждались слишком долго
         d = r.get("data",{}); unsigned = d.get("raw_tx",{}).get("swapTransaction"); last_h = d.get("raw_tx",{}).get("lastValidBlockHeight")
-        q = d.get("quote",{}); exp_out = None
-        for k_ in ["outAmount","expectedOut","amountOut","out_amount"]:
-            if k_ in q:
-                try: exp_out = float(q[k_]); break
-                except Exception: pass
+        q = d.get("quote",{}); exp_out = _quote_out(q); pred_pi = predicted[idx-1]
         pi_local = float(q.get("priceImpact", q.get("price_impact", 0)) or 0)
         # persist quote
         quote_id = save_quote(symbol=(plan.symbol or plan.out_token), contract=(plan.out_token if plan.side=='buy' else plan.in_token),
@@ -65,55 +130,75 @@ async def execute_sol(plan: ExecutionPlan, *, payer_b58: str, from_address: str,
                               slippage=plan.slippage_pct, anti_mev=plan.anti_mev, priority_fee=plan.priority_fee_sol,
                               quote=q, price_impact=pi_local, expected_out=exp_out, route_json=d)
         if dry_run:
-            results.append({"dry_run": True, "split": idx, "quote_id": quote_id, "quote": q, "last_valid_height": last_h, "expected_out": exp_out})
-            continue
+            results.append({"dry_run": True, "split": idx, "quote_id": quote_id, "quote": q, "last_valid_height": last_h, "expected_out": exp_out,
+                            "predicted_pi_pct": pred_pi})
+            return
         # sign & send
         try:
             signed_b64 = sol_sign_tx_base64(unsigned, payer_b58)
-            sent = await gmgn_send_tx_sol(signed_b64, anti_mev=plan.anti_mev)
-            txsig = sent.get("data",{}).get("hash")
-            status = await gmgn_poll_status(txsig, last_h)
-            realized = None; dec = 0; amm_pi = None
+            sent = await broadcaster.send(signed_b64, side=plan.side, anti_mev=plan.anti_mev, priority=prio)
+            txsig = sent.get("data",{}).get("hash"); path = sent.get("path")
+            if first_submit_ms is None:
+                elapsed = time.monotonic() - decided_at; _submit_latencies.append(elapsed)
+                first_submit_ms = round(1000 * elapsed)
+                logger.info(f"{plan.side} {plan.symbol or plan.out_token}: decision -> first tx submitted in {first_submit_ms} ms")
+            status = await confirm_tx(txsig, last_h, priority=prio)
+            if isinstance(status.get("data"), dict): broadcaster.record_landing(path, status["data"].get("landing_ms"))
+            realized = None; dec = None; amm_pi = None; provisional = False
             tx_successful = status.get("data", {}).get("success") if isinstance(status.get("data"), dict) else False
-            try:
-                txres = await _fetch_solana_tx(txsig)
-                if txres and txres.get("meta"):
-                    # realized_out measured on out_token (buy: acquired token; sell: WSOL received)
-                    a0,a1,dec = _extract_owner_balances(txres["meta"], from_address, plan.out_token)
-                    # BUG FIX #12: Don't mask negative realized_out, but log warning
-                    realized = a1 - a0
-                    if realized < 0:
-                        try:
-                            await send_alert(f"⚠️ Negative realized_out: {realized} for tx {txsig}")
-                        except Exception: pass
-                        realized = 0.0  # Still cap at zero for downstream logic
-                    amm_pi, _det = estimate_pool_price_impact(txres["meta"], trader_owner=from_address)
+            if reconcile_async:
+                # Балансы сверит фоновый Reconciler по getTransaction; пока - оценка по котировке
+                if tx_successful or (status.get("data") or {}).get("state") == "timeout":
+                    provisional = True  # без котировки или при таймауте realized_out заполнит только сверка
+                    # decimals нужны позиции при любом исходе - иначе количество для выхода не пересчитать
+                    try: dec = await token_decimals(plan.out_token)
+                    except Exception as e: logger.warning(f"Decimals unavailable for {plan.out_token}: {e}")
+                    if tx_successful and exp_out is not None and dec is not None: realized = exp_out / 10**dec
                 else:
-                    # BUG FIX #67: If tx succeeded but balance extraction failed, mark for reconciliation
+                    realized = 0.0  # Transaction failed, zero is correct
+            else:
+                try:
+                    txres = await _fetch_solana_tx(txsig)
+                    if txres and txres.get("meta"):
+                        # realized_out measured on out_token (buy: acquired token; sell: WSOL received)
+                        a0,a1,dec = owner_balances(txres["meta"], from_address, plan.out_token)
+                        # BUG FIX #12: Don't mask negative realized_out, but log warning
+                        realized = a1 - a0
+                        if realized < 0:
+                            try:
+                                await send_alert(f"⚠️ Negative realized_out: {realized} for tx {txsig}")
+                            except Exception: pass
+                            realized = 0.0  # Still cap at zero for downstream logic
+                        amm_pi, _det = estimate_pool_price_impact(txres["meta"], trader_owner=from_address)
+                        record_realized(f"{txsig} split {idx}", pred_pi, amm_pi)
+                        remember_pool(txres, from_address, plan.out_token if plan.side == "buy" else plan.in_token)
+                    else:
+                        # BUG FIX #67: If tx succeeded but balance extraction failed, mark for reconciliation
+                        if tx_successful:
+                            try:
+                                await send_alert(f"⚠️ TX {txsig} succeeded but balance unknown - manual reconciliation needed")
+                            except Exception: pass
+                            realized = None  # Use None to indicate unknown (not zero)
+                        else:
+                            # Transaction failed, zero is correct
+                            realized = 0.0
+                except Exception as e:
+                    # BUG FIX #67: Only set to 0 if tx actually failed, otherwise mark for reconciliation
+                    logger.error(f"Failed to get tx details for {txsig}: {e}")
                     if tx_successful:
                         try:
-                            await send_alert(f"⚠️ TX {txsig} succeeded but balance unknown - manual reconciliation needed")
+                            await send_alert(f"⚠️ TX {txsig} succeeded but balance extraction failed: {e} - manual reconciliation needed")
                         except Exception: pass
-                        realized = None  # Use None to indicate unknown (not zero)
+                        realized = None  # Unknown balance, needs reconciliation
                     else:
-                        # Transaction failed, zero is correct
-                        realized = 0.0
-            except Exception as e:
-                # BUG FIX #67: Only set to 0 if tx actually failed, otherwise mark for reconciliation
-                logger.error(f"Failed to get tx details for {txsig}: {e}")
-                if tx_successful:
-                    try:
-                        await send_alert(f"⚠️ TX {txsig} succeeded but balance extraction failed: {e} - manual reconciliation needed")
-                    except Exception: pass
-                    realized = None  # Unknown balance, needs reconciliation
-                else:
-                    realized = 0.0  # Transaction failed, zero is correct
-            slip_pct = None
-            if exp_out is not None and realized is not None:
-                try: slip_pct = (exp_out - realized) / max(1e-9, exp_out) * 100.0
-                except Exception: pass
-            save_trade(quote_id=quote_id, tx=txsig, split=idx, status=status.get("data"), realized_out=realized, slippage_pct=slip_pct, amm_pi_pct=amm_pi, side=plan.side, contract=(plan.out_token if plan.side=='buy' else plan.in_token))
-            results.append({"tx": txsig, "status": status.get("data"), "split": idx, "expected_out": exp_out, "realized_out": realized, "slippage_pct": slip_pct, "amm_pi_pct": amm_pi, "decimals": dec})
+                        realized = 0.0  # Transaction failed, zero is correct
+            slip_pct = None if provisional else slippage_pct(exp_out, realized, dec)
+            save_trade(quote_id=quote_id, tx=txsig, split=idx, status=status.get("data"), realized_out=None if provisional else realized,
+                       slippage_pct=slip_pct, amm_pi_pct=amm_pi, side=plan.side, contract=(plan.out_token if plan.side=='buy' else plan.in_token),
+                       expected_out=exp_out, provisional_out=realized if provisional else None, reconciled=not provisional,
+                       owner=from_address, out_token=plan.out_token, predicted_pi_pct=pred_pi)
+            results.append({"tx": txsig, "status": status.get("data"), "split": idx, "expected_out": exp_out, "realized_out": realized, "slippage_pct": slip_pct, "amm_pi_pct": amm_pi, "decimals": dec,
+                            "provisional": provisional, "predicted_pi_pct": pred_pi, "broadcast_path": path})
             # BUG FIX #7: Use WSOL constant instead of hardcoded substring check
             from .gmgn_sol import WSOL, LAMPORTS
             if plan.in_token == WSOL:
@@ -123,10 +208,31 @@ async def execute_sol(plan: ExecutionPlan, *, payer_b58: str, from_address: str,
             failed_splits.append((idx, str(e)))
             results.append({"error": str(e), "split": idx, "expected_out": exp_out})
 
+    mode = settings.execution.split_submit_mode if len(splits) > 1 and not dry_run else "sequential"
+    if mode == "sequential":
+        for idx, amt in enumerate(splits, start=1):
+            await run_split(idx, amt)
+    else:
+        # concurrent - все сплиты сразу; staggered - каждый следующий через split_stagger_secs
+        stagger = settings.execution.split_stagger_secs if mode == "staggered" else 0.0
+
+        async def delayed(idx: int, amt: int):
+            if stagger > 0 and idx > 1: await asyncio.sleep(stagger * (idx - 1))
+            await run_split(idx, amt)
+        # ошибка одного сплита (повторный маршрут, запись котировки) не отменяет остальные
+        outcomes = await asyncio.gather(*(delayed(idx, amt) for idx, amt in enumerate(splits, start=1)), return_exceptions=True)
+        for idx, res in enumerate(outcomes, start=1):
+            if isinstance(res, BaseException):
+                logger.error(f"Split {idx} of {plan.symbol or plan.out_token} failed: {res!r}")
+                failed_splits.append((idx, str(res)))
+                results.append({"error": str(res) or type(res).__name__, "split": idx, "expected_out": None})
+    results.sort(key=lambda x: x["split"])
+
     # BUG FIX #8: Alert if some splits failed
     if failed_splits and len(failed_splits) < len(splits):
         try:
             await send_alert(f"⚠️ Partial split failure: {len(failed_splits)}/{len(splits)} splits failed for {plan.symbol or plan.out_token}")
         except Exception: pass
 
-    return {"results": results, "splits": len(splits), "pi0": pi, "total_in_wsol": total_in_wsol, "failed_splits": len(failed_splits)}
+    return {"results": results, "splits": len(splits), "split_sizes": splits, "pi0": pi, "total_in_wsol": total_in_wsol, "failed_splits": len(failed_splits),
+            "decision_to_submit_ms": first_submit_ms}
@@ -0,0 +1,130 @@
+"""
+Pool Tracker - резервы AMM пулов открытых позиций по подписке на vault-аккаунты.
+
+Vault-аккаунты пула (токен и WSOL) берутся из декода нашего свопа
+(таблица pool_vaults). Трекер подписывается через общий SubscriptionHub
+(accountSubscribe, jsonParsed) на vault'ы токенов в позициях, снимок резервов
+берет через getMultipleAccounts и на каждое обновление пересчитывает локальную цену выхода по constant-product:
+    out = R_wsol * q' / (R_token + q'),  q' = q * (1 - fee).
+Подписчики (воркеры позиций) будятся на каждое обновление пула - trailing stop
+и TP проверяются с задержкой обновления, а не по расписанию котировок GMGN.
+Цена считается только по согласованному снимку (обе стороны в одном слоте):
+уведомления vault'ов приходят по одному, и между ними резервы - половина свопа.
+После разрыва соединения резервы считаются неизвестными до повторной подписки.
+"""
+from __future__ import annotations
+import asyncio, time
+from typing import Callable, Optional
+from ..config import settings
+from ..utils.logging import logger
+from .rpc import rpc_call
+from .subscriptions import SubscriptionHub, subscriptions
+
+
+def _ui_amount(value: dict | None) -> Optional[float]:
+    try:
+        info = value["data"]["parsed"]["info"]["tokenAmount"]
+        return float(info.get("uiAmountString") or info.get("uiAmount") or 0)
+    except Exception:
+        return None
+
+
+class PoolTracker:
+    def __init__(self, fee_pct: float = 0.25, commitment: str = "confirmed", hub: SubscriptionHub | None = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.fee = float(fee_pct) / 100.0
+        self.commitment = commitment
+        self.hub = hub if hub is not None else subscriptions
+        self._clock = clock
+        self._pools: dict[str, dict] = {}  # contract -> {"vaults": {side: vault}, "reserve": {side: R}, "slot": {side: slot}, "updated"}
+        self._by_vault: dict[str, tuple[str, str]] = {}  # vault -> (contract, "token" | "wsol")
+        self._listeners: dict[str, set[Callable[[], None]]] = {}
+        self.counts = {"updates": 0, "snapshots": 0}
+        self.hub.on_connect(self._snapshot_all); self.hub.on_disconnect(self._invalidate)
+
+    def watch(self, contract: str, token_vault: str, wsol_vault: str):
+        if contract in self._pools: return
+        self._pools[contract] = {"vaults": {"token": token_vault, "wsol": wsol_vault}, "reserve": {}, "slot": {}, "updated": None}
+        for side, vault in (("token", token_vault), ("wsol", wsol_vault)):
+            self._by_vault[vault] = (contract, side)
+            self.hub.subscribe(f"account:{vault}", "accountSubscribe", [vault, {"encoding": "jsonParsed", "commitment": self.commitment}],
+                               lambda res, v=vault: self.apply(v, int((res.get("context") or {}).get("slot") or 0), res.get("value")))
+        if self.hub.connected:
+            try: asyncio.get_running_loop().create_task(self._snapshot([token_vault, wsol_vault]))
+            except RuntimeError: pass
+
+    def unwatch(self, contract: str):
+        pool = self._pools.pop(contract, None)
+        if pool is None: return
+        for vault in pool["vaults"].values():
+            self._by_vault.pop(vault, None); self.hub.unsubscribe(f"account:{vault}")
+
+    def watched(self) -> set[str]:
+        return set(self._pools)
+
+    def add_listener(self, contract: str, cb: Callable[[], None]):
+        self._listeners.setdefault(contract, set()).add(cb)
+
+    def remove_listener(self, contract: str, cb: Callable[[], None]):
+        cbs = self._listeners.get(contract)
+        if cbs is not None:
+            cbs.discard(cb)
+            if not cbs: self._listeners.pop(contract, None)
+
+    def reserves(self, contract: str) -> Optional[tuple[float, float]]:
+        """(R_token, R_wsol) в целых единицах; None - пул не отслеживается или резервы неизвестны."""
+        pool = self._pools.get(contract)
+        if pool is None: return None
+        rt = pool["reserve"].get("token"); rw = pool["reserve"].get("wsol")
+        return (rt, rw) if rt and rw and rt > 0 and rw > 0 else None
+
+    def exit_quote(self, contract: str, qty: float) -> Optional[float]:
+        """Ожидаемый выход в WSOL при продаже qty токенов в пул; None - локальной цены нет
+        или своп применен наполовину (стороны пула из разных слотов)."""
+        st = self.state(contract)
+        if st is None or qty <= 0: return None
+        rt, rw, _ = st; q = qty * (1 - self.fee)
+        return rw * q / (rt + q)
+
+    def apply(self, vault: str, slot: int, value: dict | None):
+        """Новое состояние vault-аккаунта (уведомление подписки или снимок)."""
+        key = self._by_vault.get(vault)
+        amount = _ui_amount(value)
+        if key is None or amount is None: return
+        contract, side = key; pool = self._pools[contract]
+        if slot < pool["slot"].get(side, -1): return  # снимок старше уже пришедшего уведомления
+        pool["reserve"][side] = amount; pool["slot"][side] = slot; pool["updated"] = self._clock()
+        self.counts["updates"] += 1
+        if self.state(contract) is None: return  # вторая сторона свопа еще не пришла
+        for cb in list(self._listeners.get(contract, ())):
+            try: cb()
+            except Exception as e: logger.debug(f"Pool listener failed for {contract}: {e}")
+
+    def state(self, contract: str) -> Optional[tuple[float, float, int]]:
+        """(R_token, R_wsol, slot), если обе стороны пула обновлены в одном слоте - согласованный снимок."""
+        pool = self._pools.get(contract); res = self.reserves(contract)
+        if res is None or pool["slot"].get("token") != pool["slot"].get("wsol"): return None
+        return res[0], res[1], pool["slot"]["token"]
+
+    def _invalidate(self):
+        for pool in self._pools.values(): pool["reserve"].clear(); pool["slot"].clear()
+
+    async def _snapshot(self, vaults: list[str]):
+        if not settings.solana.rpc_url or not vaults: return
+        try:
+            res = await rpc_call("getMultipleAccounts", [vaults, {"encoding": "jsonParsed", "commitment": self.commitment}], priority="exit")
+        except Exception as e:
+            logger.debug(f"Pool snapshot failed: {e}"); return
+        self.counts["snapshots"] += 1
+        slot = int(((res or {}).get("context") or {}).get("slot") or 0)
+        for vault, value in zip(vaults, (res or {}).get("value") or []): self.apply(vault, slot, value)
+
+    async def _snapshot_all(self):
+        await self._snapshot(list(self._by_vault))
+
+    def stats(self) -> dict:
+        live = sum(1 for c in self._pools if self.reserves(c) is not None)
+        return {"pools": len(self._pools), "live": live, "connected": self.hub.connected, **self.counts}
+
+
+pools = PoolTracker(fee_pct=settings.execution.pool_fee_pct, commitment=settings.solana.confirm_commitment)
@@ -0,0 +1,115 @@
+"""
+Reconciler - фоновая сверка сделок по getTransaction.
+
+Горячий путь исполнения не ждет getTransaction: сделка сохраняется с
+reconciled=0 и предварительной оценкой по котировке. Воркер пачками
+забирает несверенные подписи из таблицы trades, запрашивает их одним
+JSON-RPC batch запросом и заполняет realized_out, slippage_pct и amm_pi_pct;
+для покупок количество открытой позиции поправляется на разницу факт - оценка,
+для продаж - realized_out выхода позиции и P/L сделки в circuit breaker.
+Неудачные попытки повторяются с экспоненциальной паузой; после
+max_attempts сделка помечается reconciled=-1 для ручной сверки.
+"""
+from __future__ import annotations
+import asyncio, time
+from typing import Callable
+from ..config import settings
+from ..utils.alerts import send_alert
+from ..utils.amm_decode import estimate_pool_price_impact
+from ..utils.circuit_breaker import amend_trade
+from ..utils.db import adjust_exit_realized, adjust_position_qty, get_unreconciled_trades, update_trade_reconciled
+from ..utils.logging import logger
+from .rpc import RPCError, rpc_batch
+from .settlement import owner_balances, remember_pool, slippage_pct
+from .split_planner import record_realized
+
+_TX_OPTS = {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0, "commitment": "confirmed"}
+
+
+class Reconciler:
+    def __init__(self, interval_secs: float = 2.0, batch_size: int = 20, max_attempts: int = 8,
+                 base_backoff_secs: float = 1.0, max_backoff_secs: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.interval_secs = float(interval_secs); self.batch_size = max(1, int(batch_size))
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_backoff_secs = float(base_backoff_secs); self.max_backoff_secs = float(max_backoff_secs)
+        self._clock = clock
+        self._retry: dict[int, tuple[int, float]] = {}  # trade id -> (попыток, следующая не раньше)
+        self.counts = {"reconciled": 0, "retried": 0, "given_up": 0, "batches": 0}
+
+    def _due(self, rows) -> list:
+        now = self._clock()
+        return [r for r in rows if self._retry.get(r["id"], (0, 0.0))[1] <= now][:self.batch_size]
+
+    async def _backoff(self, row, reason: str):
+        attempts = self._retry.get(row["id"], (0, 0.0))[0] + 1
+        if attempts >= self.max_attempts:
+            self._retry.pop(row["id"], None); self.counts["given_up"] += 1
+            update_trade_reconciled(row["id"], None, None, None, ok=False)
+            try: await send_alert(f"⚠️ TX {row['tx']} not reconciled after {attempts} attempts ({reason}) - manual reconciliation needed")
+            except Exception: pass
+            return
+        self.counts["retried"] += 1
+        delay = min(self.max_backoff_secs, self.base_backoff_secs * 2 ** (attempts - 1))
+        self._retry[row["id"]] = (attempts, self._clock() + delay)
+
+    async def _apply(self, row, tx: dict) -> bool:
+        """False - сверку пока не применить (позиция по покупке не открыта или выход по продаже не записан), сделка повторится позже."""
+        meta = tx["meta"]
+        owner = row["owner"] or (settings.solana.address or "")
+        a0, a1, dec = owner_balances(meta, owner, row["out_token"] or row["contract"])
+        realized = a1 - a0
+        if realized < 0:
+            try: await send_alert(f"⚠️ Negative realized_out: {realized} for tx {row['tx']}")
+            except Exception: pass
+            realized = 0.0
+        delta = realized - float(row["provisional_out"] or 0.0)
+        # позиция открывается и выход записывается после исполнения всех сплитов - до этого поправлять нечего
+        if row["side"] == "buy" and abs(delta) > 1e-12 and not adjust_position_qty(row["contract"], delta):
+            await self._backoff(row, "position not opened yet"); return False
+        if row["side"] == "sell" and abs(delta) > 1e-12:
+            if not adjust_exit_realized(row["contract"], row["tx"], row["ts"], delta):
+                await self._backoff(row, "exit not recorded yet"); return False
+            if settings.risk.circuit_breaker_enabled: amend_trade(delta, row["contract"])
+        amm_pi, _det = estimate_pool_price_impact(meta, trader_owner=owner)
+        record_realized(f"{row['tx']} split {row['split']}", row["predicted_pi_pct"], amm_pi)
+        remember_pool(tx, owner, row["contract"])
+        update_trade_reconciled(row["id"], realized, slippage_pct(row["expected_out"], realized, dec), amm_pi)
+        self._retry.pop(row["id"], None); self.counts["reconciled"] += 1
+        return True
+
+    async def run_once(self) -> int:
+        """Одна пачка несверенных сделок; возвращает число сверенных."""
+        due = self._due(get_unreconciled_trades(limit=self.batch_size * 5))
+        if not due: return 0
+        self.counts["batches"] += 1
+        try:
+            res = await rpc_batch([("getTransaction", [r["tx"], _TX_OPTS]) for r in due], priority="discovery")
+        except Exception as e:
+            for r in due: await self._backoff(r, str(e))
+            return 0
+        done = 0
+        for row, tx in zip(due, res):
+            if isinstance(tx, RPCError) or not tx or not tx.get("meta"):
+                await self._backoff(row, str(tx) if isinstance(tx, RPCError) else "not available yet")
+                continue
+            try:
+                done += await self._apply(row, tx)
+            except Exception as e:
+                logger.error(f"Reconciliation failed for {row['tx']}: {e}")
+                await self._backoff(row, str(e))
+        return done
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Reconciler error: {e}")
+            await asyncio.sleep(self.interval_secs)
+
+    def stats(self) -> dict:
+        return {**self.counts, "backing_off": len(self._retry)}
+
+
+reconciler = Reconciler(interval_secs=settings.execution.reconcile_interval_secs, batch_size=settings.execution.reconcile_batch_size,
+                        max_attempts=settings.execution.reconcile_max_attempts)
@@ -0,0 +1,57 @@
+"""
+Solana JSON-RPC - одиночные и пакетные (batch) вызовы через общий rate limiter solana_rpc.
+"""
+from __future__ import annotations
+import httpx
+from typing import Any
+from ..config import settings
+from ..utils.ratelimit import limited_request
+
+
+class RPCError(RuntimeError):
+    pass
+
+
+def _url() -> str:
+    url = settings.solana.rpc_url
+    if not url: raise RPCError("solana.rpc_url is not configured")
+    return url
+
+
+async def rpc_batch(calls: list[tuple[str, list]], *, priority: str = "execution", timeout: float = 20,
+                    url: str | None = None) -> list[Any]:
+    """
+    Несколько вызовов одним HTTP запросом (JSON-RPC batch). Результаты - в порядке calls;
+    ошибка отдельного вызова возвращается как экземпляр RPCError на его месте. url - другой узел вместо solana.rpc_url.
+    """
+    if not calls: return []
+    payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)]
+    async with httpx.AsyncClient(timeout=timeout) as cli:
+        r = await limited_request("solana_rpc", lambda: cli.post(url or _url(), json=payload), priority=priority)
+        r.raise_for_status(); data = r.json()
+    if isinstance(data, dict): data = [data]  # некоторые узлы отвечают на batch одним объектом ошибки
+    by_id = {x.get("id"): x for x in data if isinstance(x, dict)}
+    out: list[Any] = []
+    for i in range(len(calls)):
+        x = by_id.get(i)
+        if x is None: out.append(RPCError("missing response"))
+        elif x.get("error") is not None: out.append(RPCError(str(x["error"].get("message") if isinstance(x["error"], dict) else x["error"])))
+        else: out.append(x.get("result"))
+    return out
+
+
+async def rpc_call(method: str, params: list, *, priority: str = "execution", timeout: float = 20, url: str | None = None) -> Any:
+    res = (await rpc_batch([(method, params)], priority=priority, timeout=timeout, url=url))[0]
+    if isinstance(res, RPCError): raise res
+    return res
+
+
+_DECIMALS: dict[str, int] = {"So11111111111111111111111111111111111111112": 9}  # WSOL
+
+
+async def token_decimals(mint: str) -> int:
+    """Decimals токена (getTokenSupply), кешируются навсегда - у минта они не меняются."""
+    if mint not in _DECIMALS:
+        res = await rpc_call("getTokenSupply", [mint], priority="execution")
+        _DECIMALS[mint] = int(((res or {}).get("value") or {}).get("decimals"))
+    return _DECIMALS[mint]
@@ -0,0 +1,39 @@
+"""
+Settlement - итог свопа по транзакции: изменение баланса владельца, проскальзывание
+против котировки и vault-аккаунты пула. Общее для синхронной сверки в executor
+и фонового Reconciler.
+"""
+from __future__ import annotations
+from ..utils.amm_decode import find_pool_vaults
+from ..utils.db import save_pool_vaults
+from ..utils.logging import logger
+from .gmgn_sol import WSOL
+
+
+def slippage_pct(expected_raw: float | None, realized_ui: float | None, decimals: int | None) -> float | None:
+    """Проскальзывание, %: outAmount котировки - в минимальных единицах, realized - в целых токенах."""
+    if expected_raw is None or realized_ui is None or expected_raw <= 0: return None
+    expected_ui = expected_raw / 10**(decimals or 0)
+    return (expected_ui - realized_ui) / max(1e-12, expected_ui) * 100.0
+
+
+def owner_balances(meta: dict, owner: str, mint: str) -> tuple[float, float, int]:
+    """Баланс mint у owner до и после транзакции (в целых токенах) и decimals; 0 - баланса нет."""
+    pre = meta.get("preTokenBalances") or []; post = meta.get("postTokenBalances") or []
+    def pick(balances):
+        for b in balances:
+            try:
+                if b.get("owner") == owner and b.get("mint") == mint:
+                    ui = b.get("uiTokenAmount") or {}; return float(ui.get("uiAmount", 0) or 0), int(ui.get("decimals", 0) or 0)
+            except Exception: continue
+        return 0.0, 0
+    a0, dec0 = pick(pre); a1, dec1 = pick(post); return a0, a1, max(dec0, dec1)
+
+
+def remember_pool(tx: dict, owner: str, contract: str):
+    """Vault-аккаунты пула contract/WSOL из нашего свопа - PoolTracker подпишется на них, пока позиция открыта."""
+    try:
+        v = find_pool_vaults(tx, owner, contract, WSOL)
+        if v: save_pool_vaults(contract, v["token_vault"], v["quote_vault"], v["authority"])
+    except Exception as e:
+        logger.debug(f"Pool vaults not decoded for {contract}: {e}")
@@ -0,0 +1,102 @@
+"""
+Split Planner - число и размеры сплитов по модели constant-product пула.
+
+Резерв входного токена A оценивается по priceImpact котировки маршрута
+(исполнение x против резерва A: pi = x / (A + x)) и по недавним декодам пула
+из сделок той же стороны (amm_pi_pct - сдвиг цены пула: 1 - (A / (A + x))^2);
+берется медиана оценок. Для k = 1..max_splits и геометрических размеров
+x_j ~ r^j симулируются последовательные свопы, между которыми пул
+восстанавливается арбитражем на долю recovery; выбирается план с минимальной
+суммой потерь на impact и комиссий за транзакции. Прогноз сдвига цены каждого
+сплита сохраняется со сделкой и сравнивается с фактическим для калибровки.
+"""
+from __future__ import annotations
+import math, statistics
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+from ..utils.logging import logger
+
+_RATIOS = (0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.25, 1.5)  # отношение размеров соседних сплитов
+_calibration: deque = deque(maxlen=500)  # (прогноз, факт) сдвига цены пула, %
+
+
+@dataclass
+class SplitPlan:
+    sizes: list[int]
+    predicted_pi_pct: list[Optional[float]] = field(default_factory=list)
+    reserve: Optional[float] = None  # оценка резерва входного токена, минимальные единицы
+    impact_cost: float = 0.0  # потери на impact, во входных единицах
+    fee_cost: float = 0.0
+
+
+def reserve_from_quote(amount_in: float, pi_pct: float) -> Optional[float]:
+    p = abs(pi_pct) / 100.0
+    if amount_in <= 0 or not 0 < p < 1: return None
+    return amount_in * (1 - p) / p
+
+
+def reserve_from_decode(amount_in: float, amm_pi_pct: float) -> Optional[float]:
+    p = abs(amm_pi_pct) / 100.0
+    if amount_in <= 0 or not 0 < p < 1: return None
+    s = math.sqrt(1 - p)
+    return amount_in * s / (1 - s)
+
+
+def estimate_reserve(amount_in: float, quote_pi_pct: float, samples: Iterable[tuple[float, float]] = ()) -> Optional[float]:
+    """Медиана оценок резерва по котировке и декодам (in_amount, amm_pi_pct); None - оценить не по чему."""
+    ests = [reserve_from_quote(amount_in, quote_pi_pct)] + [reserve_from_decode(x, pi) for x, pi in samples]
+    ests = [e for e in ests if e]
+    return statistics.median(ests) if ests else None
+
+
+def predicted_pi_pct(reserve: float, amount: float) -> float:
+    """Сдвиг цены пула от свопа amount против резерва reserve, %."""
+    return (1 - (reserve / (reserve + amount)) ** 2) * 100.0
+
+
+def simulate(reserve: float, sizes: list[int], recovery: float) -> tuple[float, list[float]]:
+    """Потери на impact (во входных единицах) и прогноз сдвига цены по сплитам; пул нормирован к цене 1."""
+    k2 = reserve * reserve; a = reserve; loss = 0.0; preds = []
+    for x in sizes:
+        preds.append(predicted_pi_pct(a, x))
+        y = (k2 / a) * x / (a + x)
+        loss += x - y
+        a += x
+        a -= recovery * (a - reserve)  # арбитраж возвращает цену к исходной
+    return loss, preds
+
+
+def geometric_sizes(amount_in: int, k: int, ratio: float) -> list[int]:
+    w = [ratio ** j for j in range(k)]; tot = sum(w)
+    sizes = [int(amount_in * wj / tot) for wj in w[:-1]]
+    return sizes + [amount_in - sum(sizes)]
+
+
+def plan_splits(amount_in: int, reserve: Optional[float], fee_in: float, max_splits: int, recovery: float) -> SplitPlan:
+    """План с минимумом impact + k * fee_in; без оценки резерва - одна транзакция."""
+    if reserve is None or reserve <= 0:
+        return SplitPlan(sizes=[amount_in], predicted_pi_pct=[None])
+    best: Optional[SplitPlan] = None
+    for k in range(1, max(1, max_splits) + 1):
+        for ratio in (_RATIOS if k > 1 else (1.0,)):
+            sizes = geometric_sizes(amount_in, k, ratio)
+            if min(sizes) <= 0: continue
+            loss, preds = simulate(reserve, sizes, recovery)
+            if best is None or loss + k * fee_in < best.impact_cost + best.fee_cost - 1e-9:
+                best = SplitPlan(sizes=sizes, predicted_pi_pct=preds, reserve=reserve, impact_cost=loss, fee_cost=k * fee_in)
+    return best or SplitPlan(sizes=[amount_in], predicted_pi_pct=[None], reserve=reserve)
+
+
+def record_realized(label: str, predicted: Optional[float], realized: Optional[float]):
+    """Факт сдвига цены пула (amm_pi_pct) против прогноза сплита."""
+    if predicted is None or realized is None: return
+    _calibration.append((float(predicted), abs(float(realized))))
+    logger.info(f"Split pool impact {label}: predicted {predicted:.2f}%, realized {abs(float(realized)):.2f}%")
+
+
+def calibration_stats() -> dict:
+    if not _calibration: return {"samples": 0}
+    n = len(_calibration)
+    err = [r - p for p, r in _calibration]
+    return {"samples": n, "bias_pct": round(sum(err) / n, 3), "mean_abs_err_pct": round(sum(abs(e) for e in err) / n, 3)}
@@ -0,0 +1,127 @@
+"""
+Solana RPC subscriptions - одно websocket соединение на все подписки (accountSubscribe, logsSubscribe, ...).
+
+Потребители объявляют желаемые подписки по ключу с обработчиком уведомлений;
+хаб сам приводит фактические подписки к желаемым (subscribe/unsubscribe),
+после разрыва переподключается с экспоненциальной паузой и подписывается заново.
+Хуки on_connect вызываются после (пере)подписки, on_disconnect - после разрыва:
+состояние, полученное из подписок, в этот момент уже неактуально.
+"""
+from __future__ import annotations
+import asyncio, itertools, json
+from typing import Awaitable, Callable, Optional
+import websockets
+from ..config import settings
+from ..utils.logging import logger
+
+
+def ws_url() -> Optional[str]:
+    """solana.ws_url или rpc_url со схемой ws(s)://."""
+    if settings.solana.ws_url: return settings.solana.ws_url
+    url = settings.solana.rpc_url
+    if not url: return None
+    return "wss://" + url[len("https://"):] if url.startswith("https://") else "ws://" + url[len("http://"):] if url.startswith("http://") else None
+
+
+class SubscriptionHub:
+    def __init__(self):
+        self._wanted: dict[str, tuple[str, list, Callable[[dict], None]]] = {}  # ключ -> (метод, параметры, обработчик)
+        self._subs: dict[int, str] = {}  # id подписки -> ключ
+        self._requests: dict[int, str] = {}  # id запроса *Subscribe -> ключ
+        self._ids = itertools.count(1)
+        self._dirty = asyncio.Event()
+        self._on_connect: list[Callable[[], Awaitable[None]]] = []
+        self._on_disconnect: list[Callable[[], None]] = []
+        self.connected = False
+        self.counts = {"notifications": 0, "reconnects": 0}
+
+    def subscribe(self, key: str, method: str, params: list, handler: Callable[[dict], None]):
+        """handler получает result уведомления ({"context": {"slot"}, "value": ...})."""
+        self._wanted[key] = (method, params, handler); self._dirty.set()
+
+    def unsubscribe(self, key: str):
+        if self._wanted.pop(key, None) is not None: self._dirty.set()
+
+    def wanted(self) -> set[str]:
+        return set(self._wanted)
+
+    def on_connect(self, hook: Callable[[], Awaitable[None]]):
+        self._on_connect.append(hook)
+
+    def on_disconnect(self, hook: Callable[[], None]):
+        self._on_disconnect.append(hook)
+
+    def _handle(self, msg: dict):
+        if str(msg.get("method") or "").endswith("Notification"):
+            p = msg.get("params") or {}
+            key = self._subs.get(p.get("subscription"))
+            it = self._wanted.get(key) if key else None
+            if it is None: return
+            self.counts["notifications"] += 1
+            try: it[2](p.get("result") or {})
+            except Exception as e: logger.error(f"Subscription handler {key} failed: {e}")
+        elif msg.get("id") in self._requests:
+            key = self._requests.pop(msg["id"])
+            if msg.get("error") is not None: logger.error(f"Subscription {key} failed: {msg['error']}")
+            else:
+                self._subs[int(msg["result"])] = key
+                if key not in self._wanted: self._dirty.set()  # отменена, пока ждали ответ - отпишемся
+
+    async def _sync(self, ws):
+        """Подписки приводятся к желаемому набору."""
+        active = set(self._subs.values()) | set(self._requests.values())
+        for key, (method, params, _h) in list(self._wanted.items()):
+            if key in active: continue
+            rid = next(self._ids); self._requests[rid] = key
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": rid, "method": method, "params": params}))
+        for sid, key in list(self._subs.items()):
+            if key in self._wanted: continue
+            self._subs.pop(sid)
+            method = key.split(":", 1)[0] + "Unsubscribe"
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": [sid]}))
+
+    async def _sync_loop(self, ws):
+        first = True
+        while True:
+            await self._dirty.wait(); self._dirty.clear()
+            await self._sync(ws)
+            if first:
+                first = False
+                for hook in self._on_connect:
+                    try: await hook()
+                    except Exception as e: logger.debug(f"Subscription on_connect hook failed: {e}")
+
+    async def run(self, url: Optional[str] = None):
+        url = url or ws_url()
+        if not url:
+            logger.warning("Solana subscriptions disabled: no solana ws_url/rpc_url"); return
+        self._dirty = asyncio.Event()  # событие текущего event loop
+        backoff = 1
+        while True:
+            try:
+                async with websockets.connect(url, ping_interval=20) as ws:
+                    self.connected = True; backoff = 1; self._dirty.set()
+                    syncer = asyncio.create_task(self._sync_loop(ws))
+                    try:
+                        async for raw in ws:
+                            try: self._handle(json.loads(raw))
+                            except Exception as e: logger.debug(f"Subscription message skipped: {e}")
+                            if syncer.done(): syncer.result()  # ошибка отправки подписок - переподключение
+                    finally:
+                        syncer.cancel(); self.connected = False
+                        self._subs.clear(); self._requests.clear()
+                        for hook in self._on_disconnect:
+                            try: hook()
+                            except Exception as e: logger.debug(f"Subscription on_disconnect hook failed: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Solana websocket error: {e}. Reconnecting in {min(30, backoff)}s...")
+            self.counts["reconnects"] += 1
+            await asyncio.sleep(min(30, backoff)); backoff *= 2
+
+    def stats(self) -> dict:
+        return {"wanted": len(self._wanted), "active": len(self._subs), "connected": self.connected, **self.counts}
+
+
+subscriptions = SubscriptionHub()
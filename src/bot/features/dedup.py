@@ -0,0 +1,111 @@
+"""
+Near-duplicate детектор социальных постов (SimHash + LSH banding).
+
+Copy-paste шилл-кампании разносят один и тот же текст по Bluesky/Reddit/Farcaster.
+Индекс хранит 64-битные SimHash отпечатки постов за hype window и находит
+кандидатов через banding: при расстоянии Хэмминга <= max_distance хотя бы одна
+из (max_distance + 1) полос совпадает точно. Размер индекса жестко ограничен
+max_entries (самые старые записи вытесняются первыми).
+"""
+from __future__ import annotations
+import hashlib, re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+_URL = re.compile(r"https?://\S+")
+_TOKEN = re.compile(r"[\w$#@]+", re.U)
+# Приблизительная стоимость одной записи индекса (ключ, отпечаток, ts, ссылки в полосах)
+ENTRY_BYTES_APPROX = 320
+
+def tokenize(text: str | None) -> list[str]:
+    return _TOKEN.findall(_URL.sub(" ", (text or "").lower()))
+
+def _h64(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(tokens: list[str], shingle: int = 2) -> int:
+    """64-битный SimHash по словесным шинглам."""
+    if len(tokens) <= shingle:
+        grams = [" ".join(tokens)]
+    else:
+        grams = [" ".join(tokens[i:i+shingle]) for i in range(len(tokens) - shingle + 1)]
+    acc = [0] * 64
+    for g in grams:
+        h = _h64(g)
+        for b in range(64):
+            acc[b] += 1 if (h >> b) & 1 else -1
+    fp = 0
+    for b in range(64):
+        if acc[b] > 0: fp |= (1 << b)
+    return fp
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class NearDupIndex:
+    def __init__(self, window_secs: int = 900, max_entries: int = 20000, max_distance: int = 3,
+                 min_tokens: int = 6):
+        self.window = timedelta(seconds=window_secs)
+        self.max_entries = max(1, int(max_entries))
+        self.max_distance = max(0, int(max_distance))
+        self.min_tokens = min_tokens
+        # pigeonhole: max_distance+1 полос гарантируют точное совпадение хотя бы одной
+        self.bands = min(16, self.max_distance + 1)
+        self._band_bits = 64 // self.bands
+        self._entries: OrderedDict[str, tuple[int, datetime]] = OrderedDict()  # порядок = возраст
+        self._buckets: list[dict[int, set[str]]] = [{} for _ in range(self.bands)]
+        self.checked = 0
+        self.duplicates = 0
+        self.evicted = 0
+
+    def __len__(self) -> int: return len(self._entries)
+
+    def _band_keys(self, fp: int) -> list[int]:
+        mask = (1 << self._band_bits) - 1
+        return [(fp >> (i * self._band_bits)) & mask for i in range(self.bands)]
+
+    def _remove(self, key: str):
+        fp, _ = self._entries.pop(key)
+        for i, bk in enumerate(self._band_keys(fp)):
+            bucket = self._buckets[i].get(bk)
+            if bucket is None: continue
+            bucket.discard(key)
+            if not bucket: del self._buckets[i][bk]
+
+    def _evict(self, now: datetime):
+        while self._entries:
+            key, (_, ts) = next(iter(self._entries.items()))
+            if now - ts <= self.window and len(self._entries) <= self.max_entries: break
+            self._remove(key); self.evicted += 1
+
+    def check(self, key: str, text: str | None, now: datetime) -> Optional[str]:
+        """
+        Проверяет пост на near-duplicate.
+
+        Returns:
+            Ключ канонического поста, если text является дубликатом; иначе None
+            (и пост индексируется как новый канонический).
+        """
+        toks = tokenize(text)
+        # Короткие посты ("$BTC to the moon") слишком бедны для отпечатка кампании
+        if len(toks) < self.min_tokens: return None
+        self.checked += 1
+        fp = simhash(toks)
+        self._evict(now)
+        for i, bk in enumerate(self._band_keys(fp)):
+            for cand in self._buckets[i].get(bk, ()):
+                if cand != key and hamming(fp, self._entries[cand][0]) <= self.max_distance:
+                    self.duplicates += 1
+                    return cand
+        if key in self._entries: self._remove(key)
+        self._entries[key] = (fp, now)
+        for i, bk in enumerate(self._band_keys(fp)):
+            self._buckets[i].setdefault(bk, set()).add(key)
+        self._evict(now)
+        return None
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries,
+                "approx_bytes": len(self._entries) * ENTRY_BYTES_APPROX,
+                "checked": self.checked, "duplicates": self.duplicates, "evicted": self.evicted}
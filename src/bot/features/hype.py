@@ -3,6 +3,7 @@ from math import sqrt
 from datetime import datetime, timedelta, timezone
 from ..models import SocialPost
 from ..utils import authors
+from .dedup import NearDupIndex
 import re, os, pickle, threading
 from ..config import settings
 RED_FLAGS = re.compile(r"\b(airdrop|giveaway|presale|100x|insider|signal)\b", re.I)
@@ -15,6 +16,8 @@ class RollingStats:
         v = sum((y-m)**2 for y in self.buf)/len(self.buf)
         s = sqrt(v) if v>0 else 1.0
         return (x - m)/s
+def _post_key(post: SocialPost) -> str:
+    return f"{post.platform}:{post.post_id}"
 class HypeAggregator:
     def __init__(self, window_secs=900, auto_load=True):
         self._lock = threading.Lock()  # Thread-safe lock for concurrent updates
@@ -24,6 +27,11 @@ class HypeAggregator:
         self.stats_authors  = defaultdict(RollingStats)
         self.stats_author_weight = defaultdict(RollingStats)
         self.stats_eng      = defaultdict(RollingStats)
+        # canonical post key -> количество схлопнутых near-duplicate копий, по символам
+        self.dup_counts = defaultdict(dict)
+        f = settings.features
+        self.dedup = NearDupIndex(window_secs=window_secs, max_entries=f.dedup_max_entries,
+                                  max_distance=f.dedup_max_distance, min_tokens=f.dedup_min_tokens) if f.dedup_enabled else None
         self._state_path = os.path.join(settings.logging.out_dir, "hype_state.pkl")
         if auto_load:
             self.load_state()
@@ -31,9 +39,16 @@ class HypeAggregator:
         with self._lock:
             # BUG FIX #6: Use datetime.now(timezone.utc) instead of deprecated utcnow()
             now = datetime.now(timezone.utc)
+            canon = self.dedup.check(_post_key(post), post.text, now) if self.dedup is not None else None
             for sym in post.symbols:
-                self.posts[sym].append((now, post))
+                if canon is not None and any(_post_key(p) == canon for _,p in self.posts[sym]):
+                    dups = self.dup_counts[sym]; dups[canon] = dups.get(canon, 0) + 1
+                else:
+                    self.posts[sym].append((now, post))
                 self.posts[sym] = [(t,p) for (t,p) in self.posts[sym] if now - t <= self.window]
+                if sym in self.dup_counts:
+                    live = {_post_key(p) for _,p in self.posts[sym]}
+                    self.dup_counts[sym] = {k: n for k, n in self.dup_counts[sym].items() if k in live}
     def hype_score(self, symbol: str):
         with self._lock:
             window_posts = self.posts.get(symbol, [])
@@ -46,12 +61,25 @@ class HypeAggregator:
                 m = p.engagement or {}; denom = max(1, (p.author_followers or 0))
                 eng += (m.get("likes",0)+m.get("score",0)+m.get("replies",0)+m.get("num_comments",0)) / denom
             red_flag = any(RED_FLAGS.search(p.text or "") for _,p in window_posts)
+            dups = self.dup_counts.get(symbol) or {}
+            duplicates = sum(dups.get(_post_key(p), 0) for _,p in window_posts)
             z_m = self.stats_mentions[symbol].z(mentions); self.stats_mentions[symbol].push(mentions)
             z_a = self.stats_authors[symbol].z(unique_authors); self.stats_authors[symbol].push(unique_authors)
             z_aw = self.stats_author_weight[symbol].z(wsum); self.stats_author_weight[symbol].push(wsum)
             z_e = self.stats_eng[symbol].z(eng); self.stats_eng[symbol].push(eng)
             score = z_m + 0.35*z_a + 0.15*z_aw + 0.30*z_e - (0.6 if red_flag else 0.0)
-            return score, {"mentions":mentions,"unique_authors":unique_authors,"author_weight_sum":wsum,"eng_approx":eng,"red_flag":red_flag,"z_m":z_m,"z_a":z_a,"z_aw":z_aw,"z_e":z_e}
+            return score, {"mentions":mentions,"unique_authors":unique_authors,"author_weight_sum":wsum,"eng_approx":eng,"red_flag":red_flag,"duplicates":duplicates,"z_m":z_m,"z_a":z_a,"z_aw":z_aw,"z_e":z_e}
+
+    def evict_symbol(self, symbol: str):
+        """Удаляет все данные символа (посты, rolling stats, дубликаты)."""
+        with self._lock:
+            for d in (self.posts, self.stats_mentions, self.stats_authors, self.stats_author_weight,
+                      self.stats_eng, self.dup_counts):
+                d.pop(symbol, None)
+
+    def symbols(self) -> set:
+        with self._lock:
+            return set(self.posts) | set(self.stats_mentions)
 
     def save_state(self):
         """Сохраняет текущее состояние HypeAggregator в файл."""
@@ -66,6 +94,7 @@ class HypeAggregator:
                     "stats_authors": {k: list(v.buf) for k, v in self.stats_authors.items()},
                     "stats_author_weight": {k: list(v.buf) for k, v in self.stats_author_weight.items()},
                     "stats_eng": {k: list(v.buf) for k, v in self.stats_eng.items()},
+                    "dup_counts": {k: dict(v) for k, v in self.dup_counts.items() if v},
                     # BUG FIX #6: Use datetime.now(timezone.utc) instead of deprecated utcnow()
                     "saved_at": datetime.now(timezone.utc).isoformat()
                 }
@@ -118,6 +147,16 @@ class HypeAggregator:
                         filtered = [(t, p) for (t, p) in posts_list if now - t <= self.window]
                         if filtered:
                             self.posts[sym] = filtered
+                    # Перестраиваем near-duplicate индекс по восстановленным постам
+                    if self.dedup is not None:
+                        restored = sorted(((t, p) for lst in self.posts.values() for (t, p) in lst), key=lambda x: x[0])
+                        for t, p in restored:
+                            self.dedup.check(_post_key(p), p.text, t)
+
+                if "dup_counts" in state:
+                    for sym, counts in state["dup_counts"].items():
+                        if sym in self.posts:
+                            self.dup_counts[sym] = dict(counts)
 
                 # Восстанавливаем rolling stats
                 if "stats_mentions" in state:
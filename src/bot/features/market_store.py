@@ -0,0 +1,131 @@
+"""
+Market Store - кеш MarketSnapshot с временем получения, TTL свежести и LRU вытеснением.
+
+Для каждого токена хранится небольшое NumPy кольцо последних снимков
+(ts, price_usd, liq_usd, vol_1h), чтобы доходность и тренд ликвидности
+считались локально, без дополнительных запросов к API.
+"""
+from __future__ import annotations
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional
+import numpy as np
+from ..models import MarketSnapshot
+
+_TS, _PRICE, _LIQ, _VOL = range(4)
+
+
+class _Ring:
+    def __init__(self, size: int):
+        self.buf = np.full((max(2, size), 4), np.nan)
+        self.n = 0; self.i = 0
+
+    def push(self, ts: float, price: float | None, liq: float | None, vol: float | None):
+        self.buf[self.i] = (ts, np.nan if price is None else price, np.nan if liq is None else liq,
+                            np.nan if vol is None else vol)
+        self.i = (self.i + 1) % len(self.buf); self.n = min(self.n + 1, len(self.buf))
+
+    def view(self) -> np.ndarray:
+        """Снимки в хронологическом порядке (старые -> новые)."""
+        if self.n < len(self.buf): return self.buf[:self.n]
+        return np.concatenate((self.buf[self.i:], self.buf[:self.i]))
+
+
+class MarketStore:
+    def __init__(self, ttl_secs: float = 90.0, max_symbols: int = 200, max_age_secs: float = 3600.0,
+                 history_len: int = 64, clock: Callable[[], float] = time.time):
+        self.ttl = float(ttl_secs)
+        self.max_symbols = max(1, int(max_symbols))
+        self.max_age = float(max_age_secs)
+        self.history_len = history_len
+        self._clock = clock
+        self._snaps: OrderedDict[str, MarketSnapshot] = OrderedDict()  # LRU: последний - самый свежий
+        self._rings: dict[str, _Ring] = {}
+        self.stale_rejects = 0
+
+    # --- dict-like интерфейс (совместим с прежним market_cache: dict[str, MarketSnapshot])
+    def __setitem__(self, symbol: str, snap: MarketSnapshot): self.put(symbol, snap)
+    def __contains__(self, symbol: object) -> bool: return symbol in self._snaps
+    def __len__(self) -> int: return len(self._snaps)
+    def __iter__(self) -> Iterator[str]: return iter(list(self._snaps))
+    def keys(self) -> list[str]: return list(self._snaps)
+
+    def get(self, symbol: str, default: MarketSnapshot | None = None) -> MarketSnapshot | None:
+        """Последний снимок независимо от возраста."""
+        snap = self._snaps.get(symbol)
+        if snap is None: return default
+        self._snaps.move_to_end(symbol)
+        return snap
+
+    def pop(self, symbol: str, default: MarketSnapshot | None = None) -> MarketSnapshot | None:
+        self._rings.pop(symbol, None)
+        return self._snaps.pop(symbol, default)
+
+    def put(self, symbol: str, snap: MarketSnapshot) -> MarketSnapshot:
+        now = self._clock()
+        if snap.fetched_at is None:
+            snap = snap.model_copy(update={"fetched_at": now})
+        self._snaps[symbol] = snap; self._snaps.move_to_end(symbol)
+        ring = self._rings.get(symbol)
+        if ring is None:
+            ring = self._rings[symbol] = _Ring(self.history_len)
+        ring.push(snap.fetched_at, snap.price_usd, snap.liq_usd, snap.vol_1h)
+        while len(self._snaps) > self.max_symbols:
+            old, _ = self._snaps.popitem(last=False); self._rings.pop(old, None)
+        return snap
+
+    # --- свежесть
+    def age(self, symbol: str) -> Optional[float]:
+        snap = self._snaps.get(symbol)
+        if snap is None or snap.fetched_at is None: return None
+        return max(0.0, self._clock() - snap.fetched_at)
+
+    def fresh(self, symbol: str, max_age: float | None = None) -> MarketSnapshot | None:
+        """Снимок, только если он не старше TTL; иначе None (устаревшие данные не используются)."""
+        snap = self.get(symbol)
+        if snap is None: return None
+        age = self.age(symbol)
+        if age is None or age > (self.ttl if max_age is None else max_age):
+            self.stale_rejects += 1
+            return None
+        return snap
+
+    def prune(self) -> list[str]:
+        """Удаляет снимки старше max_age_secs."""
+        now = self._clock()
+        old = [s for s, snap in self._snaps.items() if snap.fetched_at is None or now - snap.fetched_at > self.max_age]
+        for s in old: self.pop(s)
+        return old
+
+    # --- локальные производные по кольцу снимков
+    def history(self, symbol: str) -> np.ndarray:
+        ring = self._rings.get(symbol)
+        return ring.view() if ring else np.empty((0, 4))
+
+    def local_return(self, symbol: str, window_secs: float) -> Optional[float]:
+        """Доходность по price_usd за последние window_secs (по ближайшему снимку не позже начала окна)."""
+        h = self.history(symbol)
+        h = h[~np.isnan(h[:, _PRICE])]
+        if len(h) < 2: return None
+        t_last = h[-1, _TS]
+        older = h[h[:, _TS] <= t_last - window_secs]
+        base = older[-1] if len(older) else h[0]
+        if base[_PRICE] <= 0 or base[_TS] == t_last: return None
+        return float(h[-1, _PRICE] / base[_PRICE] - 1.0)
+
+    def liquidity_trend(self, symbol: str, window_secs: float) -> Optional[float]:
+        """Наклон ликвидности (МНК) за окно как доля от средней ликвидности в час."""
+        h = self.history(symbol)
+        h = h[~np.isnan(h[:, _LIQ])]
+        if len(h): h = h[h[:, _TS] >= h[-1, _TS] - window_secs]
+        if len(h) < 2 or np.ptp(h[:, _TS]) <= 0: return None
+        mean = float(np.mean(h[:, _LIQ]))
+        if mean <= 0: return None
+        slope = np.polyfit(h[:, _TS] - h[0, _TS], h[:, _LIQ], 1)[0]
+        return float(slope * 3600.0 / mean)
+
+    def status(self) -> dict:
+        ages = [a for a in (self.age(s) for s in self._snaps) if a is not None]
+        return {"symbols": len(self._snaps), "max_symbols": self.max_symbols, "ttl_secs": self.ttl,
+                "fresh": sum(1 for a in ages if a <= self.ttl), "stale_rejects": self.stale_rejects,
+                "max_age_secs": max(ages) if ages else None}
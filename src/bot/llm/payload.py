@@ -0,0 +1,115 @@
+"""
+Payload Builder - компактный и ограниченный по токенам payload решения для LLM.
+
+Новости дедуплицируются по URL и заголовку, числа округляются до значащих
+цифр, пустые поля выбрасываются, сериализация - без пробелов. Если оценка
+токенов выше бюджета, payload ужимается по шагам: меньше новостей, короче
+заголовки, без второстепенных полей.
+"""
+from __future__ import annotations
+import json, math, re
+from collections import deque
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+_CHARS_PER_TOKEN = 3.5  # консервативно для JSON с числами и не-ASCII текстом
+SIG_DIGITS = 4
+# Второстепенные поля - выбрасываются первыми при превышении бюджета
+_SOCIAL_OPTIONAL = ("author_weight_sum", "eng_approx", "duplicates", "unique_authors")
+_MARKET_OPTIONAL = ("network", "price_usd", "spread_bps", "ret_5m")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+def dumps(payload: Any) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _round(v: float) -> float | int:
+    if not math.isfinite(v): return 0
+    r = float(f"{v:.{SIG_DIGITS}g}")
+    return int(r) if r.is_integer() and abs(r) < 1e15 else r
+
+
+def prune(obj: Any) -> Any:
+    """Рекурсивно: None и пустые контейнеры удаляются, float округляются."""
+    if isinstance(obj, dict):
+        out = {k: prune(v) for k, v in obj.items()}
+        return {k: v for k, v in out.items() if v is not None and v != {} and v != []}
+    if isinstance(obj, (list, tuple)):
+        return [x for x in (prune(v) for v in obj) if x is not None and x != {} and x != []]
+    if isinstance(obj, bool): return obj
+    if isinstance(obj, float): return _round(obj)
+    return obj
+
+
+def _url_key(url: str) -> str:
+    p = urlsplit(str(url).strip())
+    return f"{p.netloc.lower().removeprefix('www.')}{p.path.rstrip('/')}"
+
+
+def _title_key(title: str) -> str:
+    return re.sub(r"\W+", " ", str(title).lower()).strip()
+
+
+def compact_news(items: list[dict], max_items: int) -> list[dict]:
+    """Новости без дубликатов по URL (без query/fragment) и по нормализованному заголовку."""
+    seen_urls, seen_titles, out = set(), set(), []
+    for it in items:
+        url = it.get("url"); title = it.get("title") or ""
+        uk = _url_key(url) if url else None; tk = _title_key(title)
+        if (uk and uk in seen_urls) or (tk and tk in seen_titles): continue
+        if uk: seen_urls.add(uk)
+        if tk: seen_titles.add(tk)
+        out.append({"title": title.strip(), "url": str(url)} if url else {"title": title.strip()})
+        if len(out) >= max_items: break
+    return out
+
+
+def build_payload(symbol: str, contract: Optional[str], hype_val: float, hype_meta: dict, news: list[dict],
+                  market: Optional[dict], *, quick_filter: bool = True, max_news: int = 6,
+                  token_budget: Optional[int] = None) -> dict:
+    """Payload решения (symbol, contract, social, news, market) в пределах token_budget."""
+    # symbol/contract уже есть на верхнем уровне - в market не дублируются
+    market = {k: v for k, v in (market or {}).items() if k not in ("symbol", "contract")}
+    payload = prune({"symbol": symbol, "contract": contract, "social": {"score": hype_val, **hype_meta},
+                     "news": compact_news(news, max_news), "market": market, "quick_filter": quick_filter})
+    if token_budget:
+        payload = fit_budget(payload, token_budget)
+    return payload
+
+
+def fit_budget(payload: dict, budget: int) -> dict:
+    """Ужимает payload до budget токенов; symbol/contract/z-scores/ключевые рыночные поля сохраняются."""
+    if estimate_tokens(dumps(payload)) <= budget: return payload
+    p = json.loads(json.dumps(payload))
+    news = p.get("news") or []
+    for it in news:
+        if len(it.get("title", "")) > 80: it["title"] = it["title"][:77] + "..."
+    while news and estimate_tokens(dumps(p)) > budget:
+        news.pop()
+    if not news: p.pop("news", None)
+    for section, fields in (("social", _SOCIAL_OPTIONAL), ("market", _MARKET_OPTIONAL)):
+        for f in fields:
+            if estimate_tokens(dumps(p)) <= budget: return p
+            (p.get(section) or {}).pop(f, None)
+    return p
+
+
+# --- Статистика размера промптов
+_prompt_tokens: deque = deque(maxlen=500)
+
+
+def record_prompt(system: str, user: str) -> int:
+    tokens = estimate_tokens(system) + estimate_tokens(user)
+    _prompt_tokens.append(tokens)
+    return tokens
+
+
+def prompt_stats() -> dict:
+    if not _prompt_tokens: return {"requests": 0}
+    t = sorted(_prompt_tokens)
+    return {"requests": len(t), "avg_tokens": round(sum(t) / len(t), 1), "p50_tokens": t[len(t) // 2],
+            "p95_tokens": t[min(len(t) - 1, int(0.95 * len(t)))], "max_tokens": t[-1]}
@@ -1,26 +1,56 @@
 from __future__ import annotations
-import os, json, time, httpx, threading
-from typing import Optional, Dict, Any
+import os, json, time, httpx, threading, asyncio
+from collections import deque
+from typing import Optional, Dict, Any, Awaitable, Callable, TypeVar
 from ..utils.keys import load_keys
 from ..config import settings
+from ..utils.ratelimit import acquire as rl_acquire
+from ..utils.logging import logger
 STATE_PATH = os.path.join(settings.logging.out_dir, "pplx_keys.json")
 os.makedirs(settings.logging.out_dir, exist_ok=True)
+T = TypeVar("T")
 def _now() -> float: return time.time()
 class PPLXKeyRing:
-    def __init__(self):
+    """
+    Кольцо ключей Perplexity. Состояние живет в памяти и сбрасывается на диск
+    не чаще раза в key_state_flush_secs (и при shutdown). Выбор ключа - наименее
+    загруженный: меньше запросов в полете, затем лучшая недавняя задержка (EWMA),
+    с потолком key_max_rps запросов в секунду на ключ.
+    """
+    def __init__(self, path: str | None = None, max_rps: float | None = None, flush_secs: float | None = None):
         self._lock = threading.Lock()  # Thread-safe lock
+        self.path = path or STATE_PATH
+        self.max_rps = settings.perplexity.key_max_rps if max_rps is None else max_rps
+        self.flush_secs = settings.perplexity.key_state_flush_secs if flush_secs is None else flush_secs
+        # Окно учета RPS: для дробных лимитов (0.5 rps) окно растягивается до одного запроса
+        self._window = max(1.0, 1.0 / self.max_rps) if self.max_rps > 0 else 1.0
+        self._cap = max(1, int(self.max_rps * self._window))
+        self._dirty = False; self._last_flush = _now()
+        self._rt: Dict[str, Dict[str, Any]] = {}  # runtime: inflight, ewma задержки, окно запросов (не персистится)
         self._load_state(); self._reload_keys_file()
     def _load_state(self):
-        try: self.state = json.load(open(STATE_PATH, "r", encoding="utf-8"))
+        try: self.state = json.load(open(self.path, "r", encoding="utf-8"))
         except Exception: self.state = {"current_idx": 0, "keys": []}
     def _save_state(self):
         # BUG FIX #56: Use atomic write to prevent file corruption
         try:
-            temp_path = STATE_PATH + ".tmp"
+            temp_path = self.path + ".tmp"
             with open(temp_path, "w", encoding="utf-8") as f:
                 json.dump(self.state, f)
-            os.replace(temp_path, STATE_PATH)  # Atomic on POSIX systems
+            os.replace(temp_path, self.path)  # Atomic on POSIX systems
         except Exception: pass
+        self._dirty = False; self._last_flush = _now()
+    def _changed(self):
+        """Помечает состояние измененным; запись на диск - не чаще раза в flush_secs."""
+        self._dirty = True
+        if _now() - self._last_flush >= self.flush_secs: self._save_state()
+    def flush(self):
+        with self._lock:
+            if self._dirty: self._save_state()
+    def _runtime(self, key: str) -> Dict[str, Any]:
+        rt = self._rt.get(key)
+        if rt is None: rt = self._rt[key] = {"inflight": 0, "ewma_ms": None, "recent": deque(), "requests": 0}
+        return rt
     def _reload_keys_file(self):
         keys = load_keys("perplexity"); prev = {k.get("key"): k for k in self.state.get("keys", [])}
         arr = []
@@ -34,38 +64,83 @@ class PPLXKeyRing:
             print(f"[WARN] Perplexity key ring: current_idx {self.state.get('current_idx', 0)} out of bounds, resetting to 0")
             self.state["current_idx"] = 0
         self._save_state()
-    def reload(self): self._reload_keys_file()
+    def reload(self):
+        with self._lock: self._reload_keys_file()
     def status(self) -> Dict[str, Any]:
-        return {"keys":[{"idx":i,"disabled":it.get("disabled", False),"cooldown_until":it.get("cooldown_until",0),
-                         "cooldown_secs_left":max(0, int((it.get("cooldown_until",0) or 0) - _now())),
-                         "ok":it.get("ok",0), "err":it.get("err",0), "last_error":it.get("last_error")} for i,it in enumerate(self.state.get("keys", []))],
-                "current_idx": self.state.get("current_idx", 0), "count": len(self.state.get("keys", []))}
+        with self._lock:
+            now = _now(); out = []
+            for i, it in enumerate(self.state.get("keys", [])):
+                rt = self._runtime(it["key"]); self._trim(rt, now)
+                out.append({"idx":i,"healthy":self._healthy(it, now),"disabled":it.get("disabled", False),"cooldown_until":it.get("cooldown_until",0),
+                            "cooldown_secs_left":max(0, int((it.get("cooldown_until",0) or 0) - now)),
+                            "ok":it.get("ok",0), "err":it.get("err",0), "last_error":it.get("last_error"),
+                            "inflight": rt["inflight"], "requests": rt["requests"], "recent_requests": len(rt["recent"]),
+                            "ewma_latency_ms": None if rt["ewma_ms"] is None else round(rt["ewma_ms"], 1)})
+            return {"keys": out, "current_idx": self.state.get("current_idx", 0), "count": len(out),
+                    "healthy": sum(1 for k in out if k["healthy"]), "rps_window_secs": self._window,
+                    "inflight": sum(k["inflight"] for k in out)}
+    def _trim(self, rt: Dict[str, Any], now: float):
+        while rt["recent"] and now - rt["recent"][0] >= self._window: rt["recent"].popleft()
+    def _healthy(self, it: Dict[str, Any], now: float) -> bool:
+        return not it.get("disabled") and now >= float(it.get("cooldown_until",0) or 0)
+    def healthy_count(self) -> int:
+        """Ключи, доступные прямо сейчас (не отключены и не в cooldown)."""
+        with self._lock:
+            now = _now()
+            return sum(1 for it in self.state.get("keys", []) if self._healthy(it, now))
+    def _pick(self, now: float, exclude=()) -> tuple[Optional[int], float]:
+        """(индекс наименее загруженного ключа, 0) или (None, сколько ждать до освобождения RPS лимита)."""
+        best = None; best_rank = None; wait = None
+        for idx, it in enumerate(self.state.get("keys", [])):
+            if it["key"] in exclude or not self._healthy(it, now): continue
+            rt = self._runtime(it["key"]); self._trim(rt, now)
+            if self.max_rps > 0 and len(rt["recent"]) >= self._cap:
+                w = self._window - (now - rt["recent"][0]); wait = w if wait is None else min(wait, w); continue
+            rank = (rt["inflight"], rt["ewma_ms"] if rt["ewma_ms"] is not None else 0.0, (idx - self.state.get("current_idx", 0)) % len(self.state["keys"]))
+            if best_rank is None or rank < best_rank: best, best_rank = idx, rank
+        return best, (0.0 if best is not None else (max(0.0, wait) if wait is not None else 0.0))
+    def acquire(self, exclude=()) -> tuple[Optional[str], float]:
+        """
+        Занимает наименее загруженный ключ: (key, 0.0).
+        Если здоровые ключи есть, но все уперлись в RPS потолок - (None, секунд до освобождения);
+        если здоровых ключей нет - (None, 0.0).
+        """
+        with self._lock:
+            now = _now(); idx, wait = self._pick(now, exclude)
+            if idx is None: return None, wait
+            it = self.state["keys"][idx]; rt = self._runtime(it["key"])
+            rt["inflight"] += 1; rt["requests"] += 1; rt["recent"].append(now)
+            self.state["current_idx"] = (idx + 1) % len(self.state["keys"])  # при равной загрузке - по кругу
+            return it["key"], 0.0
+    def release(self, key: str):
+        with self._lock:
+            rt = self._runtime(key); rt["inflight"] = max(0, rt["inflight"] - 1)
     def next_key(self) -> Optional[str]:
+        """Лучший ключ без учета в inflight (для совместимости; запросы должны использовать acquire/release)."""
         with self._lock:
-            keys = self.state.get("keys", []);
-            if not keys: return None
-            n = len(keys); start = self.state.get("current_idx", 0)
-            for step in range(n):
-                idx = (start + step) % n; it = keys[idx]
-                if it.get("disabled"): continue
-                if _now() < float(it.get("cooldown_until",0) or 0): continue
-                self.state["current_idx"] = idx; self._save_state(); return it["key"]
-            return None
+            idx, _ = self._pick(_now())
+            return None if idx is None else self.state["keys"][idx]["key"]
     def rotate(self) -> Optional[str]:
         with self._lock:
             keys = self.state.get("keys", []);
             if not keys: return None
-            self.state["current_idx"] = (self.state.get("current_idx", 0) + 1) % len(keys); self._save_state()
+            self.state["current_idx"] = (self.state.get("current_idx", 0) + 1) % len(keys); self._changed()
             return keys[self.state["current_idx"]]["key"]
-    def mark_success(self, key: str):
+    def _observe_latency(self, key: str, latency_s: float | None):
+        if latency_s is None: return
+        rt = self._runtime(key); ms = latency_s * 1000.0
+        rt["ewma_ms"] = ms if rt["ewma_ms"] is None else 0.8 * rt["ewma_ms"] + 0.2 * ms
+    def mark_success(self, key: str, latency_s: float | None = None):
         with self._lock:
+            self._observe_latency(key, latency_s)
             for it in self.state.get("keys", []):
                 if it["key"] == key:
                     it["ok"] = int(it.get("ok", 0)) + 1
                     if _now() >= float(it.get("cooldown_until",0) or 0): it["cooldown_until"] = 0
-                    self._save_state(); return
-    def mark_error(self, key: str, status: int, message: str | None):
+                    self._changed(); return
+    def mark_error(self, key: str, status: int, message: str | None, latency_s: float | None = None):
         with self._lock:
+            self._observe_latency(key, latency_s)
             cd = 10
             if status == 429: cd = 60
             elif status == 401: cd = 24*3600
@@ -76,38 +151,178 @@ class PPLXKeyRing:
                     it["err"] = int(it.get("err", 0)) + 1
                     it["last_error"] = {"status": status, "message": message, "ts": _now()}
                     it["cooldown_until"] = max(_now() + cd, float(it.get("cooldown_until",0) or 0))
-                    self._save_state(); return
+                    # Длинный cooldown (мертвый ключ) сохраняем сразу, чтобы он пережил рестарт
+                    if cd >= 24*3600: self._save_state()
+                    else: self._changed()
+                    return
 ring = PPLXKeyRing()
-PPLX_URL = "https://api.perplexity.ai/chat/completions"
-async def pplx_chat(model: str, system: str, user: str, temperature: float = 0.2) -> dict:
+PPLX_URL = settings.perplexity.base_url.rstrip("/") + "/chat/completions"
+class _KeyFailure(Exception):
+    """Ответ API с ошибкой, относящейся к ключу (429/401/402/5xx): ключ уходит в cooldown."""
+    def __init__(self, status: int, message: str | None):
+        super().__init__(f"{status}: {message}"); self.status = status; self.message = message
+def _error_message(r: httpx.Response) -> str:
+    try:
+        j = r.json(); return (j.get("error") or {}).get("message") or j.get("message") or str(j)
+    except Exception:
+        return r.text
+def _body(model: str, system: str, user: str, temperature: float) -> dict:
+    return {"model": model, "messages":[{"role":"system","content":system},{"role":"user","content":user}], "temperature": temperature}
+def _headers(key: str, accept: str = "application/json") -> dict:
+    return {"Authorization": f"Bearer {key}", "Accept": accept}
+async def _with_key(call: Callable[[httpx.AsyncClient, str], Awaitable[Any]], exclude=(), max_attempts: int = 10) -> Any:
+    """Выполняет call(cli, key) на наименее загруженном ключе, переключаясь на другой при ошибке ключа."""
     tried=set()
-    max_attempts = 10  # BUG FIX #11: Prevent infinite loop
+    # BUG FIX #11: Prevent infinite loop (max_attempts)
     attempts = 0
     while attempts < max_attempts:
-        attempts += 1
-        key = ring.next_key()
+        key, wait = ring.acquire(exclude)
         if not key:
+            if wait > 0:
+                # Ключи здоровы, но уперлись в RPS потолок - ждем, попытка не тратится
+                await asyncio.sleep(wait); continue
+            attempts += 1
             # All keys in cooldown - wait a bit before retrying
             if attempts < max_attempts:
-                import asyncio
                 await asyncio.sleep(2)  # Wait 2 seconds before retry
                 continue
             raise RuntimeError("Perplexity: no available API keys after cooldown")
-        if key in tried and len(tried) >= max(1, len(ring.state.get("keys", []))): raise RuntimeError("Perplexity: all keys tried and failed")
+        attempts += 1
+        if key in tried and len(tried) >= max(1, len(ring.state.get("keys", []))):
+            ring.release(key); raise RuntimeError("Perplexity: all keys tried and failed")
         tried.add(key)
-        body = {"model": model, "messages":[{"role":"system","content":system},{"role":"user","content":user}], "temperature": temperature}
+        t0 = time.monotonic()
         try:
             async with httpx.AsyncClient(timeout=60) as cli:
-                r = await cli.post(PPLX_URL, json=body, headers={"Authorization": f"Bearer {key}", "Accept":"application/json"})
-                if r.status_code == 200:
-                    ring.mark_success(key); return r.json()
-                else:
-                    try:
-                        j = r.json(); msg = (j.get("error") or {}).get("message") or j.get("message") or str(j)
-                    except Exception:
-                        msg = r.text
-                    ring.mark_error(key, r.status_code, msg); continue
+                # 429 здесь per-key: обрабатывается cooldown'ом ключа, provider bucket только дозирует поток
+                await rl_acquire("perplexity", "execution")
+                res = await call(cli, key)
+            ring.mark_success(key, time.monotonic() - t0); return res
+        except _KeyFailure as e:
+            ring.mark_error(key, e.status, e.message, time.monotonic() - t0); continue
         except httpx.RequestError as e:
             ring.mark_error(key, 599, str(e)); continue
+        finally:
+            ring.release(key)
     # If we exhausted all attempts
     raise RuntimeError(f"Perplexity: max attempts ({max_attempts}) reached, no successful response")
+# --- Hedging: дубль запроса на другом ключе, если первый не ответил к перцентильному дедлайну
+_latencies: deque = deque(maxlen=200)  # задержки успешных вызовов, с
+_hedge_log: deque = deque(maxlen=200)  # был ли вызов захеджирован (для бюджета)
+_hedge_counts = {"calls": 0, "hedged": 0, "hedge_won": 0, "primary_won": 0, "skipped_budget": 0, "skipped_no_key": 0}
+def hedge_delay() -> float:
+    conf = settings.perplexity
+    if len(_latencies) < 20: return conf.hedge_default_delay_secs
+    lat = sorted(_latencies)
+    return max(conf.hedge_min_delay_secs, lat[min(len(lat) - 1, int(conf.hedge_percentile * len(lat)))])
+def hedge_stats() -> Dict[str, Any]:
+    return _hedge_counts | {"hedged_fraction": round(sum(_hedge_log) / len(_hedge_log), 3) if _hedge_log else 0.0,
+                            "deadline_ms": round(1000 * hedge_delay(), 1)}
+async def _hedged(call: Callable[[httpx.AsyncClient, str], Awaitable[Any]]) -> Any:
+    """Первый валидный ответ побеждает, проигравший запрос отменяется."""
+    conf = settings.perplexity
+    if not conf.hedge_enabled: return await _with_key(call)
+    _hedge_counts["calls"] += 1
+    in_use: set = set()
+    async def tracked(cli: httpx.AsyncClient, key: str):
+        in_use.add(key); return await call(cli, key)
+    t0 = time.monotonic()
+    primary = asyncio.ensure_future(_with_key(tracked))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay())
+        hedged = False
+        if not done:
+            if _hedge_log and sum(_hedge_log) / len(_hedge_log) >= conf.hedge_max_fraction:
+                _hedge_counts["skipped_budget"] += 1
+            elif ring.healthy_count() < 2:
+                _hedge_counts["skipped_no_key"] += 1
+            else:
+                hedged = True; _hedge_counts["hedged"] += 1
+                # Дубль только на другом ключе и без ретраев: это страховка хвоста, а не повтор
+                tasks.add(asyncio.ensure_future(_with_key(call, exclude=in_use, max_attempts=1)))
+        _hedge_log.append(hedged)
+        pending = tasks; error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is not None:
+                    if t is primary: error = t.exception()
+                    continue
+                _latencies.append(time.monotonic() - t0)
+                if hedged: _hedge_counts["primary_won" if t is primary else "hedge_won"] += 1
+                return t.result()
+        raise error or primary.exception()
+    finally:
+        for t in tasks:
+            if not t.done(): t.cancel()
+async def pplx_chat(model: str, system: str, user: str, temperature: float = 0.2) -> dict:
+    body = _body(model, system, user, temperature)
+    async def call(cli: httpx.AsyncClient, key: str) -> dict:
+        r = await cli.post(PPLX_URL, json=body, headers=_headers(key))
+        if r.status_code != 200: raise _KeyFailure(r.status_code, _error_message(r))
+        return r.json()
+    return await _hedged(call)
+
+# --- Streaming (SSE): решение возвращается, как только закрылся валидный JSON объект
+class JSONObjectScanner:
+    """Инкрементальный поиск JSON объектов верхнего уровня в потоке текста (учитывает строки и экранирование)."""
+    def __init__(self):
+        self._buf: list[str] = []; self._depth = 0; self._in_str = False; self._esc = False
+    def feed(self, chunk: str) -> list[str]:
+        done = []
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == "{": self._buf = [ch]; self._depth = 1
+                continue
+            self._buf.append(ch)
+            if self._in_str:
+                if self._esc: self._esc = False
+                elif ch == "\\": self._esc = True
+                elif ch == '"': self._in_str = False
+            elif ch == '"': self._in_str = True
+            elif ch == "{": self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0: done.append("".join(self._buf)); self._buf = []
+        return done
+_stream_timings: deque = deque(maxlen=500)  # (ttft_s, time_to_decision_s, early)
+def stream_stats() -> Dict[str, Any]:
+    """Медианы time-to-first-token и time-to-decision по последним потоковым вызовам."""
+    if not _stream_timings: return {"calls": 0}
+    ttft = sorted(t[0] for t in _stream_timings if t[0] is not None); ttd = sorted(t[1] for t in _stream_timings)
+    return {"calls": len(_stream_timings), "early_pct": round(100.0 * sum(1 for t in _stream_timings if t[2]) / len(_stream_timings), 1),
+            "ttft_p50_ms": round(1000 * ttft[len(ttft) // 2], 1) if ttft else None,
+            "ttd_p50_ms": round(1000 * ttd[len(ttd) // 2], 1)}
+async def pplx_stream_json(model: str, system: str, user: str, parse: Callable[[str], T], temperature: float = 0.2) -> T:
+    """
+    Потоковый запрос: дельты контента идут в JSONObjectScanner, первый объект, который
+    принимает parse(), возвращается сразу - хвост ответа (пояснения, citations) не дочитывается.
+    """
+    body = _body(model, system, user, temperature) | {"stream": True}
+    async def call(cli: httpx.AsyncClient, key: str) -> T:
+        t0 = time.monotonic(); ttft = None; text = []; scanner = JSONObjectScanner()
+        async with cli.stream("POST", PPLX_URL, json=body, headers=_headers(key, "text/event-stream")) as r:
+            if r.status_code != 200:
+                await r.aread(); raise _KeyFailure(r.status_code, _error_message(r))
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"): continue
+                data = line[5:].strip()
+                if data == "[DONE]": break
+                try: choice = (json.loads(data).get("choices") or [{}])[0]
+                except Exception: continue
+                delta = (choice.get("delta") or {}).get("content") or (choice.get("message") or {}).get("content") or ""
+                if not delta: continue
+                if ttft is None: ttft = time.monotonic() - t0
+                text.append(delta)
+                for obj in scanner.feed(delta):
+                    try: res = parse(obj)
+                    except Exception: continue
+                    ttd = time.monotonic() - t0; _stream_timings.append((ttft, ttd, True))
+                    logger.debug(f"Perplexity stream: ttft={ttft * 1000:.0f}ms decision={ttd * 1000:.0f}ms")
+                    return res
+        # Поток закончился без валидного объекта - последняя попытка по всему тексту
+        res = parse("".join(text))
+        _stream_timings.append((ttft, time.monotonic() - t0, False))
+        return res
+    return await _hedged(call)
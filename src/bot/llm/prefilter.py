@@ -0,0 +1,114 @@
+"""
+Pre-filter - дешевый локальный классификатор перед вызовом LLM.
+
+Логистическая регрессия над уже посчитанными признаками кандидата
+(hype z-scores, market_score, news_score, ликвидность/объем). Обучается
+офлайн по журналу решений decisions.csv (label = решение LLM стало торговым
+сигналом) и отсекает очевидные не-сделки. Без файла модели пропускает всех.
+
+Обучение:
+    python -m bot.llm.prefilter --log data/decisions.csv --out data/prefilter.json
+"""
+from __future__ import annotations
+import argparse, json, math, os, time
+from typing import Iterable, Optional
+import numpy as np
+
+FEATURES = ("hype", "z_m", "z_a", "z_aw", "z_e", "red_flag", "mentions", "mscore", "nscore", "log_liq", "log_vol")
+
+
+def candidate_features(hype_val: float, hype_meta: dict, mscore: float, nscore: float, liq_usd: float | None,
+                       vol_1h: float | None) -> dict:
+    """Признаки кандидата в фиксированном наборе FEATURES (все - float)."""
+    return {"hype": float(hype_val), "z_m": float(hype_meta.get("z_m") or 0.0), "z_a": float(hype_meta.get("z_a") or 0.0),
+            "z_aw": float(hype_meta.get("z_aw") or 0.0), "z_e": float(hype_meta.get("z_e") or 0.0),
+            "red_flag": 1.0 if hype_meta.get("red_flag") else 0.0, "mentions": float(hype_meta.get("mentions") or 0),
+            "mscore": float(mscore), "nscore": float(nscore),
+            "log_liq": math.log10(1.0 + max(0.0, liq_usd or 0.0)), "log_vol": math.log10(1.0 + max(0.0, vol_1h or 0.0))}
+
+
+class PreFilter:
+    def __init__(self, weights: Iterable[float], bias: float, mean: Iterable[float], std: Iterable[float],
+                 threshold: float, meta: Optional[dict] = None):
+        self.w = np.asarray(list(weights), dtype=float); self.b = float(bias)
+        self.mean = np.asarray(list(mean), dtype=float); self.std = np.asarray(list(std), dtype=float)
+        self.threshold = float(threshold); self.meta = meta or {}
+
+    def _x(self, features: dict) -> np.ndarray:
+        return (np.array([float(features.get(f, 0.0) or 0.0) for f in FEATURES]) - self.mean) / self.std
+
+    def predict(self, features: dict) -> float:
+        """Вероятность, что LLM выдаст торговый сигнал."""
+        z = float(self._x(features) @ self.w + self.b)
+        return 1.0 / (1.0 + math.exp(-max(-50.0, min(50.0, z))))
+
+    def accept(self, features: dict) -> bool:
+        return self.predict(features) >= self.threshold
+
+    def to_dict(self) -> dict:
+        return {"features": list(FEATURES), "weights": self.w.tolist(), "bias": self.b, "mean": self.mean.tolist(),
+                "std": self.std.tolist(), "threshold": self.threshold, **self.meta}
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["PreFilter"]:
+        """Модель из файла; None, если файла нет или набор признаков не совпадает."""
+        try:
+            with open(path, "r", encoding="utf-8") as f: d = json.load(f)
+        except Exception:
+            return None
+        if tuple(d.get("features") or ()) != FEATURES: return None
+        meta = {k: v for k, v in d.items() if k not in ("features", "weights", "bias", "mean", "std", "threshold")}
+        return cls(d["weights"], d["bias"], d["mean"], d["std"], d["threshold"], meta)
+
+
+def train(rows: list[dict], labels: list[int], *, recall: float = 0.98, l2: float = 1e-2, epochs: int = 500,
+          lr: float = 0.5) -> PreFilter:
+    """
+    Логистическая регрессия (градиентный спуск, L2, веса классов по частоте).
+    Порог выбирается так, чтобы пропускать долю recall положительных примеров:
+    фильтр должен отсекать не-сделки, а не сделки.
+    """
+    if not rows: raise ValueError("no training rows")
+    X = np.array([[float(r.get(f, 0.0) or 0.0) for f in FEATURES] for r in rows])
+    y = np.asarray(labels, dtype=float)
+    if y.min() == y.max(): raise ValueError("training labels must contain both classes")
+    mean = X.mean(axis=0); std = X.std(axis=0); std[std < 1e-9] = 1.0  # константный признак
+    Xs = (X - mean) / std
+    pos = y.mean(); sw = np.where(y > 0, 0.5 / pos, 0.5 / (1.0 - pos))
+    w = np.zeros(Xs.shape[1]); b = 0.0
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-np.clip(Xs @ w + b, -50, 50)))
+        g = sw * (p - y) / len(y)
+        w -= lr * (Xs.T @ g + l2 * w); b -= lr * float(g.sum())
+    p = 1.0 / (1.0 + np.exp(-np.clip(Xs @ w + b, -50, 50)))
+    threshold = float(np.quantile(p[y > 0], max(0.0, 1.0 - recall)))
+    passed = p >= threshold
+    meta = {"trained_at": time.time(), "n": int(len(y)), "positives": int(y.sum()), "recall_target": recall,
+            "pass_rate": round(float(passed.mean()), 4),
+            "negatives_rejected": round(float((~passed[y == 0]).mean()), 4) if (y == 0).any() else None}
+    return PreFilter(w, b, mean, std, threshold, meta)
+
+
+def train_from_log(path: str, **kwargs) -> PreFilter:
+    """Обучение по журналу decisions.csv (колонки FEATURES + label)."""
+    import pandas as pd
+    df = pd.read_csv(path).dropna(subset=["label"])
+    rows = df.reindex(columns=list(FEATURES)).fillna(0.0).to_dict("records")
+    return train(rows, df["label"].astype(int).tolist(), **kwargs)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Train LLM pre-filter from the decisions log")
+    ap.add_argument("--log", required=True, help="decisions.csv")
+    ap.add_argument("--out", required=True, help="output model JSON (settings.perplexity.prefilter_model_path)")
+    ap.add_argument("--recall", type=float, default=0.98, help="share of logged trades the filter must pass")
+    args = ap.parse_args()
+    model = train_from_log(args.log, recall=args.recall)
+    model.save(args.out)
+    print(json.dumps(model.meta, indent=2))
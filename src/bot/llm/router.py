@@ -1,8 +1,13 @@
 from __future__ import annotations
-import json, httpx, re
+import asyncio, json, httpx, re, os, math, hashlib, threading, time, random
+from collections import OrderedDict
+from typing import Optional
 from ..models import Decision
 from ..config import settings
-from .perplexity_client import pplx_chat
+from ..utils.logging import logger
+from .perplexity_client import pplx_chat, pplx_stream_json
+from .prefilter import PreFilter
+from .payload import dumps, record_prompt
 SYSTEM = "You are a crypto event & trading decision engine. Return STRICT JSON by schema."
 def _schema(): return Decision.model_json_schema()
 def _parse_decision(text: str) -> Decision:
@@ -10,11 +15,245 @@ def _parse_decision(text: str) -> Decision:
     except Exception:
         m = re.search(r"\{[\s\S]*\}$", text.strip())
         if m: return Decision.model_validate(json.loads(m.group(0)))
+        start = text.find("{")  # JSON объект, за которым идут пояснения/сноски
+        if start >= 0: return Decision.model_validate(json.JSONDecoder().raw_decode(text[start:])[0])
         text2 = text.strip().strip('`'); return Decision.model_validate(json.loads(text2))
+def _content(res: dict) -> str:
+    return res.get("choices", [{}])[0].get("message", {}).get("content") or res.get("output_text") or res.get("answer") or ""
+
+# --- Кеш решений по квантованному отпечатку payload
+def _bucket(v, step: float):
+    try: v = float(v)
+    except (TypeError, ValueError): return None
+    if math.isnan(v): return None
+    return int(math.floor(v / step))
+def _band(v, width: float):
+    """Логарифмическая полоса: значения в пределах ~10**width раз попадают в одну полосу."""
+    try: v = float(v)
+    except (TypeError, ValueError): return None
+    if math.isnan(v) or v <= 0: return None
+    return int(math.floor(math.log10(v) / width))
+def fingerprint(model: str, payload: dict) -> str:
+    """Отпечаток входов решения: незначительные изменения hype/рынка/новостей дают тот же ключ."""
+    conf = settings.perplexity
+    social = payload.get("social") or {}; market = payload.get("market") or {}
+    fp = {"model": model, "stage": payload.get("_stage"), "quick_filter": payload.get("quick_filter"),
+          "symbol": payload.get("symbol"), "contract": payload.get("contract"),
+          "z": [_bucket(social.get(k), conf.decision_cache_z_step) for k in ("z_m", "z_a", "z_aw", "z_e")],
+          "red_flag": bool(social.get("red_flag")),
+          "liq": _band(market.get("liq_usd"), conf.decision_cache_band),
+          "vol": _band(market.get("vol_1h"), conf.decision_cache_band),
+          "chg_1h": _bucket(market.get("price_change_1h"), conf.decision_cache_chg_step),
+          "news": sorted({str(it.get("url")) for it in (payload.get("news") or []) if isinstance(it, dict) and it.get("url")})}
+    return hashlib.blake2b(json.dumps(fp, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+class DecisionCache:
+    def __init__(self, path: str, ttl_secs: float, max_entries: int, save_interval_secs: float = 60.0):
+        self.path = path; self.ttl = float(ttl_secs); self.max_entries = max(1, int(max_entries))
+        self.save_interval = float(save_interval_secs)
+        self._items: OrderedDict[str, tuple[float, Decision]] = OrderedDict()
+        self._lock = threading.Lock(); self._dirty = False; self._last_save = time.time()
+        self.hits = 0; self.misses = 0
+        self._load()
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f: raw = json.load(f)
+        except Exception: return
+        now = time.time()
+        for key, (ts, dec) in raw.items():
+            if now - float(ts) > self.ttl: continue
+            try: self._items[key] = (float(ts), Decision.model_validate(dec))
+            except Exception: continue
+        while len(self._items) > self.max_entries: self._items.popitem(last=False)
+    def get(self, key: str) -> Optional[Decision]:
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is None or time.time() - hit[0] > self.ttl:
+                if hit is not None: del self._items[key]; self._dirty = True
+                self.misses += 1; return None
+            self._items.move_to_end(key); self.hits += 1
+            return hit[1].model_copy(deep=True)  # вызывающий может мутировать решение
+    def put(self, key: str, dec: Decision):
+        with self._lock:
+            self._items[key] = (time.time(), dec.model_copy(deep=True)); self._items.move_to_end(key)
+            while len(self._items) > self.max_entries: self._items.popitem(last=False)
+            self._dirty = True
+        if time.time() - self._last_save >= self.save_interval: self.save()
+    def save(self):
+        with self._lock:
+            if not self._dirty: return
+            data = {k: [ts, d.model_dump(mode="json")] for k, (ts, d) in self._items.items()}
+            self._dirty = False; self._last_save = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(data, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            logger.error(f"Failed to save decision cache: {e}")
+    def __len__(self) -> int: return len(self._items)
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._items), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0, "ttl_secs": self.ttl}
+
+decision_cache: Optional[DecisionCache] = None
+if settings.perplexity.decision_cache_enabled:
+    decision_cache = DecisionCache(os.path.join(settings.logging.out_dir, "decision_cache.json"),
+                                   settings.perplexity.decision_cache_ttl_secs, settings.perplexity.decision_cache_max_entries,
+                                   settings.perplexity.decision_cache_save_secs)
+
 async def _ask_pplx(model: str, payload: dict) -> Decision:
-    res = await pplx_chat(model, SYSTEM, json.dumps(payload, ensure_ascii=False), temperature=0.2)
-    text = res.get("choices", [{}])[0].get("message", {}).get("content") or res.get("output_text") or res.get("answer") or ""
+    user = dumps(payload)
+    logger.debug(f"Prompt {payload.get('symbol')}: ~{record_prompt(SYSTEM, user)} tokens")
+    if settings.perplexity.stream:
+        return await pplx_stream_json(model, SYSTEM, user, _parse_decision, temperature=0.2)
+    res = await pplx_chat(model, SYSTEM, user, temperature=0.2)
+    text = _content(res)
     if not text: raise RuntimeError("Perplexity returned empty content")
     return _parse_decision(text)
-async def decide(payload: dict) -> Decision:
-    return await _ask_pplx(settings.perplexity.model_fast, payload | {"_stage": "filter"})
+async def _ask_fresh(model: str, payload: dict) -> Decision:
+    """Запрос мимо кеша (промах уже учтен) с записью ответа в кеш."""
+    dec = await _ask_pplx(model, payload)
+    if decision_cache is not None: decision_cache.put(fingerprint(model, payload), dec)
+    return dec
+async def _ask_cached(model: str, payload: dict) -> Decision:
+    if decision_cache is None: return await _ask_pplx(model, payload)
+    dec = decision_cache.get(fingerprint(model, payload))
+    if dec is not None: return dec
+    return await _ask_fresh(model, payload)
+
+# --- Каскад: локальный pre-filter -> model_fast (фильтр) -> model_final для уверенных сигналов
+prefilter: Optional[PreFilter] = PreFilter.load(settings.perplexity.prefilter_model_path
+                                                or os.path.join(settings.logging.out_dir, "prefilter.json"))
+_stages = {s: {"in": 0, "pass": 0, "secs": 0.0} for s in ("prefilter", "fast", "final")}
+def _record(stage: str, passed: bool, secs: float):
+    st = _stages[stage]; st["in"] += 1; st["pass"] += int(passed); st["secs"] += secs
+def cascade_stats() -> dict:
+    return {s: {"in": st["in"], "pass": st["pass"], "pass_rate": round(st["pass"] / st["in"], 3) if st["in"] else None,
+                "avg_ms": round(1000 * st["secs"] / st["in"], 2) if st["in"] else None} for s, st in _stages.items()} | {"prefilter_loaded": prefilter is not None}
+def _prefilter_pass(features: dict) -> bool:
+    if prefilter is None: return True
+    t0 = time.perf_counter(); ok = prefilter.accept(features)
+    _record("prefilter", ok, time.perf_counter() - t0)
+    # Малая доля отсеянных все равно идет в LLM, чтобы журнал для переобучения не был смещен
+    return ok or random.random() < settings.perplexity.prefilter_explore_rate
+async def _escalate(payload: dict, dec: Decision, fast_secs: float) -> Decision:
+    conf = settings.perplexity
+    confident = dec.trade_proposal.action != "flat" and dec.confidence >= conf.escalate_confidence
+    _record("fast", confident, fast_secs)
+    if not conf.escalate_enabled: return dec
+    if not confident: return dec  # неуверенные решения - как есть, порог отбирает только кандидатов на model_final
+    t0 = time.perf_counter()
+    final = await _ask_cached(conf.model_final, payload | {"_stage": "final"})
+    _record("final", final.trade_proposal.action != "flat", time.perf_counter() - t0)
+    return final
+async def decide(payload: dict, features: dict | None = None) -> Decision | None:
+    """
+    Без features - одно решение model_fast (как для пересмотра позиций).
+    С features - каскад для кандидата: None, если pre-filter отсек его до LLM;
+    решение model_fast ниже escalate_confidence возвращается как есть; уверенные
+    сигналы подтверждаются model_final.
+    """
+    conf = settings.perplexity
+    if features is None:
+        return await _ask_cached(conf.model_fast, payload | {"_stage": "filter"})
+    if not _prefilter_pass(features): return None
+    t0 = time.perf_counter()
+    dec = await _ask_cached(conf.model_fast, payload | {"_stage": "filter"})
+    return await _escalate(payload, dec, time.perf_counter() - t0)
+
+# --- Батчи: несколько кандидатов в одном запросе model_fast
+BATCH_SYSTEM = ("You are a crypto event & trading decision engine. The user sends a JSON array of candidates. "
+                "Return a STRICT JSON array with exactly one decision per candidate, in the same order, each with its symbol.")
+class BatchSizer:
+    """AIMD размер батча: +1 пока ответ укладывается в целевую задержку, /2 при медленном или битом ответе."""
+    def __init__(self, max_size: int, target_latency_secs: float, start: int = 2):
+        self.max_size = max(1, int(max_size)); self.target = float(target_latency_secs)
+        self.size = max(1, min(self.max_size, start))
+        self.batches = 0; self.items = 0; self.fallbacks = 0; self.secs = 0.0
+    def observe(self, n: int, secs: float, ok: bool):
+        self.batches += 1; self.items += n; self.secs += secs
+        if ok and secs <= self.target: self.size = min(self.max_size, self.size + 1)
+        else: self.size = max(1, self.size // 2)
+    def stats(self) -> dict:
+        return {"size": self.size, "batches": self.batches, "items": self.items, "fallbacks": self.fallbacks,
+                "avg_batch_ms": round(1000 * self.secs / self.batches, 1) if self.batches else None}
+batch_sizer = BatchSizer(settings.perplexity.batch_max_size, settings.perplexity.batch_target_latency_secs)
+def _parse_decisions(text: str) -> list[Decision]:
+    """JSON массив решений; отдельные невалидные элементы пропускаются."""
+    t = text.strip().strip('`').strip()
+    if t.startswith("json"): t = t[4:]
+    try: arr = json.loads(t)
+    except Exception:
+        # первый JSON массив; хвост с пояснениями и сносками вида [1] игнорируется
+        start = t.find("[")
+        if start < 0: raise ValueError("no JSON array in batch response")
+        arr, _ = json.JSONDecoder().raw_decode(t[start:])
+    if isinstance(arr, dict): arr = arr.get("decisions")
+    if not isinstance(arr, list): raise ValueError("batch response is not a JSON array")
+    out = []
+    for x in arr:
+        try: out.append(Decision.model_validate(x))
+        except Exception: continue
+    return out
+async def _fast_batch(payloads: list[dict]) -> list[Optional[Decision]]:
+    """Решения model_fast для батча; None - элемент не получен и пойдет отдельным запросом."""
+    model = settings.perplexity.model_fast
+    staged = [p | {"_stage": "filter"} for p in payloads]
+    t0 = time.perf_counter()
+    try:
+        user = dumps(staged)
+        logger.debug(f"Batch prompt ({len(staged)} symbols): ~{record_prompt(BATCH_SYSTEM, user)} tokens")
+        res = await pplx_chat(model, BATCH_SYSTEM, user, temperature=0.2)
+        decs = _parse_decisions(_content(res))
+    except Exception as e:
+        logger.warning(f"Batch decision failed for {len(payloads)} symbols, falling back: {e}")
+        batch_sizer.observe(len(payloads), time.perf_counter() - t0, ok=False)
+        return [None] * len(payloads)
+    # только совпадение по символу: решение без своего символа пойдет отдельным запросом;
+    # symbol/contract берутся из payload - модель может перепутать или выдумать адрес
+    by_symbol = {str(d.symbol).upper(): d for d in decs}
+    out = [by_symbol.get(str(p.get("symbol")).upper()) for p in payloads]
+    out = [d.model_copy(update={"symbol": p.get("symbol"), "contract": p.get("contract")}) if d is not None else None
+           for p, d in zip(payloads, out)]
+    batch_sizer.observe(len(payloads), time.perf_counter() - t0, ok=all(o is not None for o in out))
+    for p, d in zip(staged, out):
+        if d is not None and decision_cache is not None: decision_cache.put(fingerprint(model, p), d)
+    return out
+async def decide_batch(items: list[tuple[dict, dict | None]]) -> list[Optional[Decision]]:
+    """
+    Каскад decide() для нескольких кандидатов: pre-filter и кеш - по каждому,
+    оставшиеся идут в model_fast одним запросом; элементы, которых нет в ответе
+    (или весь ответ битый), запрашиваются по одному.
+    """
+    conf = settings.perplexity
+    out: list[Optional[Decision]] = [None] * len(items)
+    fast: dict[int, Decision] = {}; pending: list[int] = []
+    for i, (payload, features) in enumerate(items):
+        if features is not None and not _prefilter_pass(features): continue
+        cached = decision_cache.get(fingerprint(conf.model_fast, payload | {"_stage": "filter"})) if decision_cache is not None else None
+        if cached is not None: fast[i] = cached
+        else: pending.append(i)
+    t0 = time.perf_counter()
+    if len(pending) > 1:
+        for i, d in zip(pending, await _fast_batch([items[i][0] for i in pending])):
+            if d is not None: fast[i] = d
+    missing = [i for i in pending if i not in fast]
+    batch_sizer.fallbacks += len(missing) if len(pending) > 1 else 0
+    if missing:
+        # промах кеша по ним уже учтен при разборе батча
+        res = await asyncio.gather(*(_ask_fresh(conf.model_fast, items[i][0] | {"_stage": "filter"}) for i in missing),
+                                   return_exceptions=True)
+        for i, d in zip(missing, res):
+            if isinstance(d, Exception): logger.debug(f"Decision for {items[i][0].get('symbol')} failed: {d}")
+            else: fast[i] = d
+    idx = sorted(fast)
+    # задержка батча учитывается один раз - поровну на кандидатов каскада
+    n_cascade = sum(1 for i in idx if items[i][1] is not None)
+    fast_secs = (time.perf_counter() - t0) / max(1, n_cascade)
+    final = await asyncio.gather(*(_escalate(items[i][0], fast[i], fast_secs) if items[i][1] is not None
+                                   else asyncio.sleep(0, result=fast[i]) for i in idx), return_exceptions=True)
+    for i, d in zip(idx, final):
+        if not isinstance(d, Exception): out[i] = d
+    return out
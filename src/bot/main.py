@@ -17,6 +17,16 @@ def shutdown_handler(sig, frame):
             logger.info("Hype state saved successfully")
         except Exception as e:
             logger.error(f"Failed to save hype state on shutdown: {e}")
+    try:
+        from .llm.router import decision_cache
+        if decision_cache is not None: decision_cache.save()
+    except Exception as e:
+        logger.error(f"Failed to save decision cache on shutdown: {e}")
+    try:
+        from .llm.perplexity_client import ring
+        ring.flush()
+    except Exception as e:
+        logger.error(f"Failed to flush Perplexity key state on shutdown: {e}")
 
     logger.info("Shutdown complete")
     sys.exit(0)
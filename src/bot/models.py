@@ -33,6 +33,8 @@ class MarketSnapshot(BaseModel):
     ret_5m: Optional[float] = None
     price_change_1h: Optional[float] = None
     spread_bps: Optional[float] = None
+    price_usd: Optional[float] = None
+    fetched_at: Optional[float] = None  # unix ts получения данных (для TTL свежести)
 
 EventType = Literal["exchange_listing","partnership_product","security_incident","regulatory_legal","network_status","unlock_supply","shill","other"]
 
@@ -1,5 +1,6 @@
 import httpx
 from ..config import settings
+from .ratelimit import limited_request
 async def send_alert(text: str):
     tg = settings.telegram
     if not tg.enabled or not tg.bot_token or not tg.chat_id: return
@@ -7,7 +8,7 @@ async def send_alert(text: str):
     payload = {"chat_id": tg.chat_id, "text": text, "parse_mode": "HTML", "disable_web_page_preview": True}
     try:
         async with httpx.AsyncClient(timeout=10) as cli:
-            resp = await cli.post(url, json=payload)
+            resp = await limited_request("telegram", lambda: cli.post(url, json=payload))
             resp.raise_for_status()
     except Exception as e:
         # BUG FIX #50: Log critical alert failures (but don't fail the bot)
@@ -33,3 +33,28 @@ def estimate_pool_price_impact(meta: dict, trader_owner: str | None = None) -> T
     return pi, {"mints":[mint_a,mint_b],"delta":[da,db],"price_before":price_before,"price_after":price_after}
 def decode_exact_pool_pi(meta: dict, trader_owner: str | None = None):
     return estimate_pool_price_impact(meta, trader_owner)
+def _account_keys(tx: dict) -> list[str]:
+    """Адреса по accountIndex: статические ключи сообщения + загруженные из lookup tables (writable, затем readonly)."""
+    msg = ((tx.get("transaction") or {}).get("message") or {})
+    keys = [k.get("pubkey") if isinstance(k, dict) else k for k in msg.get("accountKeys") or []]
+    loaded = (tx.get("meta") or {}).get("loadedAddresses") or {}
+    return keys + list(loaded.get("writable") or []) + list(loaded.get("readonly") or [])
+def find_pool_vaults(tx: dict, trader_owner: str | None, mint: str, quote_mint: str) -> Optional[dict]:
+    """
+    Vault-аккаунты пула mint/quote_mint из свопа: владелец (authority пула), у которого в транзакции
+    есть балансы обоих минтов и наибольшее изменение mint. None - пул не найден (нет ключей/мульти-хоп без пары).
+    """
+    meta = tx.get("meta") or {}; keys = _account_keys(tx)
+    pre = {b.get("accountIndex"): b for b in meta.get("preTokenBalances") or []}
+    by_owner: dict = {}
+    for b in meta.get("postTokenBalances") or []:
+        owner = b.get("owner") or ""; idx = b.get("accountIndex")
+        if not owner or owner == trader_owner or b.get("mint") not in (mint, quote_mint): continue
+        if not isinstance(idx, int) or idx >= len(keys): continue
+        amt = float((b.get("uiTokenAmount") or {}).get("uiAmount", 0) or 0)
+        amt0 = float(((pre.get(idx) or {}).get("uiTokenAmount") or {}).get("uiAmount", 0) or 0)
+        by_owner.setdefault(owner, {})[b.get("mint")] = (keys[idx], abs(amt - amt0))
+    pairs = [(v[mint][1], owner, v) for owner, v in by_owner.items() if mint in v and quote_mint in v]
+    if not pairs: return None
+    _, owner, v = max(pairs, key=lambda x: x[0])
+    return {"token_vault": v[mint][0], "quote_vault": v[quote_mint][0], "authority": owner}
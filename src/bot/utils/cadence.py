@@ -0,0 +1,63 @@
+"""
+Position Cadence - адаптивный интервал перепроверки открытой позиции.
+
+По последним котировкам позиции оценивается реализованная волатильность
+(дисперсия лог-доходностей на секунду). Интервал - время, за которое цена
+с запасом z сигм может дойти до ближайшего порога (trailing stop, TP):
+    t = (distance / (z * sigma))^2,  с ограничением [min_secs, max_secs].
+Спокойные позиции проверяются редко, позиции у стопа - каждые несколько секунд.
+"""
+from __future__ import annotations
+import math, time
+from collections import deque
+from typing import Callable, Optional
+
+
+class PositionCadence:
+    def __init__(self, base_secs: float, min_secs: float, max_secs: float, window: int = 20, z: float = 3.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if not 0 < min_secs <= max_secs: raise ValueError("cadence requires 0 < min_secs <= max_secs")
+        self.base_secs = min(max_secs, max(min_secs, float(base_secs)))
+        self.min_secs = float(min_secs); self.max_secs = float(max_secs)
+        self.window = max(2, int(window)); self.z = float(z)
+        self._clock = clock
+        self._marks: dict[int, deque] = {}  # position id -> (t, value)
+        self._last: dict[int, float] = {}  # position id -> последний назначенный интервал
+
+    def observe(self, pid: int, value: float, now: Optional[float] = None):
+        """Котировка позиции (ожидаемый выход в WSOL); нулевые/ошибочные игнорируются."""
+        if not value or value <= 0: return
+        now = self._clock() if now is None else now
+        self._marks.setdefault(pid, deque(maxlen=self.window)).append((now, float(value)))
+
+    def volatility(self, pid: int) -> Optional[float]:
+        """Сигма лог-доходности за секунду; None, пока меньше двух котировок."""
+        marks = self._marks.get(pid)
+        if not marks or len(marks) < 2: return None
+        var = 0.0; span = 0.0
+        for (t0, v0), (t1, v1) in zip(marks, list(marks)[1:]):
+            var += math.log(v1 / v0) ** 2; span += max(0.0, t1 - t0)
+        return math.sqrt(var / span) if span > 0 else None
+
+    def next_interval(self, pid: int, distance: Optional[float]) -> float:
+        """Секунды до следующей проверки; distance - относительное расстояние до ближайшего порога."""
+        sigma = self.volatility(pid)
+        if distance is not None and distance <= 0: interval = self.min_secs
+        elif distance is None or sigma is None: interval = self.base_secs
+        elif sigma <= 0: interval = self.max_secs
+        else: interval = (distance / (self.z * sigma)) ** 2
+        interval = min(self.max_secs, max(self.min_secs, interval))
+        self._last[pid] = interval
+        return interval
+
+    def urgent(self, pid: int) -> bool:
+        return self._last.get(pid, self.base_secs) <= self.min_secs
+
+    def forget(self, pid: int):
+        self._marks.pop(pid, None); self._last.pop(pid, None)
+
+    def stats(self) -> dict:
+        if not self._last: return {"positions": 0}
+        v = sorted(self._last.values())
+        return {"positions": len(v), "min_interval": round(v[0], 2), "p50_interval": round(v[len(v) // 2], 2),
+                "max_interval": round(v[-1], 2), "urgent": sum(1 for x in v if x <= self.min_secs)}
@@ -79,34 +79,64 @@ def record_trade(profit_loss_wsol: float, contract: str):
         else:
             state["total_wins"] += 1
 
-        # Проверяем условия для открытия circuit breaker
-        if not state["is_open"]:
-            recent = state["recent_trades"]
-            if len(recent) >= getattr(settings.risk, 'circuit_breaker_min_trades', 5):
-                # Считаем процент убыточных
-                losses = sum(1 for t in recent if t["is_loss"])
-                loss_pct = losses / len(recent)
-
-                # Проверяем также абсолютный убыток
-                total_pl = sum(t["profit_loss"] for t in recent)
-                max_drawdown = abs(getattr(settings.risk, 'circuit_breaker_max_drawdown_wsol', 0.5))
-
-                loss_threshold = getattr(settings.risk, 'circuit_breaker_loss_threshold_pct', 0.7)
-
-                # Открываем circuit breaker если:
-                # 1. Процент убыточных > порога ИЛИ
-                # 2. Общий убыток превысил максимальный drawdown
-                if loss_pct >= loss_threshold or total_pl <= -max_drawdown:
-                    state["is_open"] = True
-                    state["opened_at"] = now
-
-                    # Cooldown период в часах
-                    cooldown_hours = getattr(settings.risk, 'circuit_breaker_cooldown_hours', 4)
-                    cooldown_until = datetime.now(timezone.utc) + timedelta(hours=cooldown_hours)
-                    state["cooldown_until"] = cooldown_until.isoformat()
+        _check_open(state, now)
+        _save_state(state)
+
+def amend_trade(delta_wsol: float, contract: str):
+    """
+    Поправка P/L последней записанной сделки по контракту - после сверки
+    фактического выхода с предварительной оценкой по котировке.
 
+    Args:
+        delta_wsol: Разница факт - оценка в WSOL
+        contract: Контракт токена
+    """
+    with _LOCK:
+        state = _load_state()
+        if state.get("manual_override", False):
+            return
+
+        trade = next((t for t in reversed(state["recent_trades"]) if t["contract"] == contract), None)
+        if trade is None:
+            return
+        was_loss = trade["is_loss"]
+        trade["profit_loss"] += delta_wsol
+        trade["is_loss"] = trade["profit_loss"] < 0
+        if was_loss != trade["is_loss"]:
+            state["total_losses"] += 1 if trade["is_loss"] else -1
+            state["total_wins"] += -1 if trade["is_loss"] else 1
+
+        _check_open(state, datetime.now(timezone.utc).isoformat())
         _save_state(state)
 
+def _check_open(state: dict, now: str):
+    """Открывает circuit breaker, если последние сделки превысили порог убыточных или drawdown."""
+    # Проверяем условия для открытия circuit breaker
+    if not state["is_open"]:
+        recent = state["recent_trades"]
+        if len(recent) >= getattr(settings.risk, 'circuit_breaker_min_trades', 5):
+            # Считаем процент убыточных
+            losses = sum(1 for t in recent if t["is_loss"])
+            loss_pct = losses / len(recent)
+
+            # Проверяем также абсолютный убыток
+            total_pl = sum(t["profit_loss"] for t in recent)
+            max_drawdown = abs(getattr(settings.risk, 'circuit_breaker_max_drawdown_wsol', 0.5))
+
+            loss_threshold = getattr(settings.risk, 'circuit_breaker_loss_threshold_pct', 0.7)
+
+            # Открываем circuit breaker если:
+            # 1. Процент убыточных > порога ИЛИ
+            # 2. Общий убыток превысил максимальный drawdown
+            if loss_pct >= loss_threshold or total_pl <= -max_drawdown:
+                state["is_open"] = True
+                state["opened_at"] = now
+
+                # Cooldown период в часах
+                cooldown_hours = getattr(settings.risk, 'circuit_breaker_cooldown_hours', 4)
+                cooldown_until = datetime.now(timezone.utc) + timedelta(hours=cooldown_hours)
+                state["cooldown_until"] = cooldown_until.isoformat()
+
 def is_circuit_open() -> tuple[bool, Optional[str]]:
     """
     Проверяет, открыт ли circuit breaker.
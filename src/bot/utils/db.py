@@ -3,7 +3,7 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional, List
 from ..config import settings
 
-_LOCK = threading.Lock()
+_LOCK = threading.RLock()  # функции доступа вызывают init_db() под блокировкой
 
 def _db_path():
     out = settings.logging.out_dir; os.makedirs(out, exist_ok=True); return os.path.join(out, "trader.db")
@@ -15,6 +15,10 @@ def _conn():
     conn.execute("PRAGMA journal_mode=WAL;")
     return conn
 
+# reconciled: NULL/1 - сверена (или до миграции), 0 - ждет getTransaction, -1 - сверить не удалось
+_TRADE_MIGRATIONS = (("expected_out", "REAL"), ("provisional_out", "REAL"), ("reconciled", "INTEGER"),
+                     ("owner", "TEXT"), ("out_token", "TEXT"), ("predicted_pi_pct", "REAL"))
+
 def init_db():
     with _LOCK:
         conn = _conn()
@@ -90,6 +94,15 @@ CREATE TABLE IF NOT EXISTS exits (
 );
 """
 )
+        conn.execute("""
+CREATE TABLE IF NOT EXISTS pool_vaults (
+  contract TEXT PRIMARY KEY,
+  token_vault TEXT,
+  quote_vault TEXT,
+  authority TEXT,
+  ts TEXT
+);
+""")
         # BUG FIX #42: Add indexes for frequently queried fields
         conn.execute("CREATE INDEX IF NOT EXISTS idx_positions_state ON positions(state)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_positions_contract ON positions(contract)")
@@ -98,6 +111,11 @@ CREATE TABLE IF NOT EXISTS exits (
         conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_quote_id ON trades(quote_id)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_exits_position_id ON exits(position_id)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_quotes_contract ON quotes(contract)")
+        # Миграция: колонки сверки сделок, добавленные после первой версии схемы
+        cols = {r["name"] for r in conn.execute("PRAGMA table_info(trades)")}
+        for name, decl in _TRADE_MIGRATIONS:
+            if name not in cols: conn.execute(f"ALTER TABLE trades ADD COLUMN {name} {decl}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_reconciled ON trades(reconciled)")
         conn.commit(); conn.close()
 
 def save_quote(symbol: str, contract: str, in_token: str, out_token: str, in_amount: str,
@@ -114,16 +132,66 @@ VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
 
 def save_trade(quote_id: int, tx: str | None, split: int, status: dict | None,
                realized_out: float | None, slippage_pct: float | None, amm_pi_pct: float | None,
-               side: str, contract: str) -> int:
+               side: str, contract: str, *, expected_out: float | None = None, provisional_out: float | None = None,
+               reconciled: bool = True, owner: str | None = None, out_token: str | None = None,
+               predicted_pi_pct: float | None = None) -> int:
+    """reconciled=False - realized_out еще не сверен по getTransaction (provisional_out - оценка по котировке);
+    predicted_pi_pct - прогноз сдвига цены пула планировщиком сплитов."""
     with _LOCK:
         init_db(); conn = _conn()
         ts = datetime.now(timezone.utc).isoformat()
         cur = conn.execute("""
-INSERT INTO trades(ts,quote_id,tx,split,status_json,realized_out,slippage_pct,amm_pi_pct,side,contract)
-VALUES (?,?,?,?,?,?,?,?,?,?)
-""", (ts,quote_id,tx,split,json.dumps(status or {}),realized_out,slippage_pct,amm_pi_pct,side,contract))
+INSERT INTO trades(ts,quote_id,tx,split,status_json,realized_out,slippage_pct,amm_pi_pct,side,contract,expected_out,provisional_out,reconciled,owner,out_token,predicted_pi_pct)
+VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+""", (ts,quote_id,tx,split,json.dumps(status or {}),realized_out,slippage_pct,amm_pi_pct,side,contract,
+      expected_out,provisional_out,1 if reconciled else 0,owner,out_token,predicted_pi_pct))
         conn.commit(); tid = cur.lastrowid; conn.close(); return tid
 
+def get_unreconciled_trades(limit: int = 100) -> List[sqlite3.Row]:
+    with _LOCK:
+        init_db(); conn = _conn()
+        rows = conn.execute("SELECT * FROM trades WHERE reconciled=0 AND tx IS NOT NULL ORDER BY id LIMIT ?", (limit,)).fetchall()
+        conn.close(); return rows
+
+def update_trade_reconciled(tid: int, realized_out: float | None, slippage_pct: float | None, amm_pi_pct: float | None,
+                            ok: bool = True):
+    """Итог сверки: ok=False - транзакцию получить не удалось (нужна ручная сверка)."""
+    with _LOCK:
+        init_db(); conn = _conn()
+        if ok:
+            conn.execute("UPDATE trades SET realized_out=?, slippage_pct=?, amm_pi_pct=?, reconciled=1 WHERE id=?",
+                         (realized_out, slippage_pct, amm_pi_pct, tid))
+        else:
+            conn.execute("UPDATE trades SET reconciled=-1 WHERE id=?", (tid,))
+        conn.commit(); conn.close()
+
+def adjust_position_qty(contract: str, delta_qty: float) -> bool:
+    """Поправка количества открытой позиции после сверки покупки (факт - предварительная оценка);
+    False - позиция еще не открыта."""
+    with _LOCK:
+        init_db(); conn = _conn()
+        row = conn.execute("SELECT * FROM positions WHERE contract=? AND state='open'", (contract,)).fetchone()
+        if row:
+            qty = max(0.0, float(row['qty'] or 0) + float(delta_qty)); inv = float(row['invested_wsol'] or 0)
+            conn.execute("UPDATE positions SET qty=?, avg_entry_wsol=? WHERE id=?", (qty, inv / max(1e-12, qty) if qty > 0 else 0.0, row['id']))
+            conn.commit()
+        conn.close(); return row is not None
+
+def adjust_exit_realized(contract: str, tx: str, trade_ts: str, delta_wsol: float) -> bool:
+    """Поправка realized_out выхода после сверки продажи (факт - предварительная оценка).
+    Выход - с той же подписью, иначе первый выход по contract, записанный после сделки;
+    False - выход еще не записан."""
+    with _LOCK:
+        init_db(); conn = _conn()
+        row = conn.execute("""
+SELECT e.id FROM exits e JOIN positions p ON p.id = e.position_id
+WHERE p.contract=? AND (e.tx=? OR e.ts>=?) ORDER BY (e.tx=?) DESC, e.id LIMIT 1
+""", (contract, tx, trade_ts, tx)).fetchone()
+        if row:
+            conn.execute("UPDATE exits SET realized_out=COALESCE(realized_out, 0) + ? WHERE id=?", (float(delta_wsol), row['id']))
+            conn.commit()
+        conn.close(); return row is not None
+
 def get_open_position_by_contract(contract: str) -> sqlite3.Row | None:
     with _LOCK:
         init_db(); conn = _conn()
@@ -217,6 +285,12 @@ def get_open_positions() -> List[sqlite3.Row]:
         rows = conn.execute("SELECT * FROM positions WHERE state='open' ORDER BY opened_at").fetchall()
         conn.close(); return rows
 
+def get_position(pid: int) -> sqlite3.Row | None:
+    with _LOCK:
+        init_db(); conn=_conn()
+        row = conn.execute("SELECT * FROM positions WHERE id=?", (pid,)).fetchone()
+        conn.close(); return row
+
 def get_recent_amm_pi(contract: str, minutes: int = 60) -> float | None:
     with _LOCK:
         init_db(); conn=_conn()
@@ -228,3 +302,51 @@ def get_recent_amm_pi(contract: str, minutes: int = 60) -> float | None:
             try: return float(row["min_pi"])
             except Exception: return None
         return None
+
+def get_recent_pool_samples(contract: str, side: str, minutes: int = 60, limit: int = 50) -> list[tuple[float, float]]:
+    """(in_amount сплита в минимальных единицах, amm_pi_pct) недавних сделок той же стороны - для оценки резервов пула."""
+    with _LOCK:
+        init_db(); conn=_conn()
+        cutoff = (datetime.now(timezone.utc) - timedelta(minutes=minutes)).isoformat()
+        rows = conn.execute("""
+SELECT q.in_amount AS in_amount, t.amm_pi_pct AS amm_pi_pct FROM trades t JOIN quotes q ON q.id = t.quote_id
+WHERE t.contract=? AND t.side=? AND t.amm_pi_pct IS NOT NULL AND t.ts >= ? ORDER BY t.id DESC LIMIT ?
+""", (contract, side, cutoff, limit)).fetchall()
+        conn.close()
+    out = []
+    for row in rows:
+        try: out.append((float(row["in_amount"]), float(row["amm_pi_pct"])))
+        except Exception: pass
+    return out
+
+def save_pool_vaults(contract: str, token_vault: str, quote_vault: str, authority: str | None = None):
+    """Vault-аккаунты пула токена (из декода нашего свопа) - для подписки на резервы."""
+    with _LOCK:
+        init_db(); conn=_conn()
+        conn.execute("INSERT OR REPLACE INTO pool_vaults(contract,token_vault,quote_vault,authority,ts) VALUES (?,?,?,?,?)",
+                     (contract, token_vault, quote_vault, authority, datetime.now(timezone.utc).isoformat()))
+        conn.commit(); conn.close()
+
+def get_pool_vaults_many(contracts: list[str]) -> dict[str, sqlite3.Row]:
+    if not contracts: return {}
+    with _LOCK:
+        init_db(); conn=_conn()
+        rows = conn.execute(f"SELECT * FROM pool_vaults WHERE contract IN ({','.join('?' * len(contracts))})", tuple(contracts)).fetchall()
+        conn.close()
+    return {r["contract"]: r for r in rows}
+
+def get_recent_amm_pi_many(contracts: list[str], minutes: int = 60) -> dict[str, float | None]:
+    """get_recent_amm_pi для нескольких контрактов одним запросом."""
+    out: dict[str, float | None] = {c: None for c in contracts}
+    if not out: return out
+    with _LOCK:
+        init_db(); conn=_conn()
+        cutoff = (datetime.now(timezone.utc) - timedelta(minutes=minutes)).isoformat()
+        marks = ",".join("?" * len(out))
+        rows = conn.execute(f"SELECT contract, MIN(amm_pi_pct) AS min_pi FROM trades WHERE contract IN ({marks}) AND ts >= ? GROUP BY contract",
+                            (*out, cutoff)).fetchall()
+        conn.close()
+    for row in rows:
+        try: out[row["contract"]] = None if row["min_pi"] is None else float(row["min_pi"])
+        except Exception: pass
+    return out
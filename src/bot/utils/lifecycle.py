@@ -0,0 +1,103 @@
+"""
+Symbol Lifecycle - вытеснение неактивных символов из всех per-symbol структур разом.
+
+Символы раскладываются по слотам timing wheel по времени истечения TTL.
+touch() только обновляет last_seen (O(1)); при прокрутке колеса слот
+проверяется лениво: символ, который трогали после планирования, или символ
+с открытой позицией (pinned) перепланируется, остальные вытесняются через
+зарегистрированные evictor-колбэки. Каждый символ живет ровно в одном слоте,
+поэтому прокрутка стоит O(1) амортизированно на символ.
+"""
+from __future__ import annotations
+import math, threading, time
+from typing import Callable, Iterable, Optional
+from .logging import logger
+
+
+class SymbolLifecycle:
+    def __init__(self, ttl_secs: float, tick_secs: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.ttl = float(ttl_secs)
+        self.tick = max(1e-3, float(tick_secs))
+        self._clock = clock
+        # +1 слот, чтобы символ с полным TTL не попадал в текущий слот
+        self._slots = max(1, math.ceil(self.ttl / self.tick)) + 1
+        self._wheel: list[set[str]] = [set() for _ in range(self._slots)]
+        self._slot_of: dict[str, int] = {}  # symbol -> абсолютный тик проверки
+        self._last_seen: dict[str, float] = {}
+        self._pinned: set[str] = set()
+        self._evictors: dict[str, Callable[[str], object]] = {}
+        self._cursor = int(clock() // self.tick)
+        self._lock = threading.Lock()
+        self.evicted_total = 0
+
+    def register(self, name: str, evict: Callable[[str], object]):
+        """Регистрирует per-symbol структуру: evict(symbol) удаляет из нее все данные символа."""
+        self._evictors[name] = evict
+
+    def _schedule(self, symbol: str, due: float):
+        tick = max(self._cursor + 1, math.ceil(due / self.tick))
+        # За пределами оборота колеса - перепроверим в последнем слоте
+        tick = min(tick, self._cursor + self._slots - 1)
+        self._wheel[tick % self._slots].add(symbol)
+        self._slot_of[symbol] = tick
+
+    def touch(self, symbol: str, now: Optional[float] = None):
+        if not symbol: return
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._last_seen[symbol] = now
+            if symbol not in self._slot_of:
+                self._schedule(symbol, now + self.ttl)
+
+    def touch_many(self, symbols: Iterable[str], now: Optional[float] = None):
+        for s in symbols: self.touch(s, now)
+
+    def set_pinned(self, symbols: Iterable[str]):
+        """Символы открытых позиций никогда не вытесняются."""
+        with self._lock:
+            self._pinned = {s for s in symbols if s}
+
+    def advance(self, now: Optional[float] = None) -> list[str]:
+        """Прокручивает колесо до текущего момента и вытесняет истекшие символы."""
+        now = self._clock() if now is None else now
+        target = int(now // self.tick)
+        expired: list[str] = []
+        with self._lock:
+            steps = target - self._cursor
+            if steps <= 0: return []
+            start = self._cursor
+            # При отставании больше чем на оборот достаточно пройти каждый слот один раз
+            for t in range(start + 1, start + 1 + min(steps, self._slots)):
+                self._cursor = t
+                idx = t % self._slots
+                bucket = self._wheel[idx]; self._wheel[idx] = set()
+                for sym in bucket:
+                    self._slot_of.pop(sym, None)
+                    last = self._last_seen.get(sym)
+                    if last is None: continue
+                    if sym in self._pinned:
+                        self._schedule(sym, now + self.ttl)
+                    elif last + self.ttl > now:
+                        self._schedule(sym, last + self.ttl)
+                    else:
+                        del self._last_seen[sym]; expired.append(sym)
+            self._cursor = target
+        for sym in expired:
+            for name, evict in self._evictors.items():
+                try: evict(sym)
+                except Exception as e:
+                    logger.error(f"Lifecycle evictor '{name}' failed for {sym}: {e}")
+        self.evicted_total += len(expired)
+        return expired
+
+    def is_live(self, symbol: str) -> bool:
+        return symbol in self._last_seen
+
+    @property
+    def live_count(self) -> int:
+        return len(self._last_seen)
+
+    def status(self) -> dict:
+        return {"live_symbols": self.live_count, "pinned": len(self._pinned),
+                "evicted_total": self.evicted_total, "ttl_secs": self.ttl, "tick_secs": self.tick,
+                "structures": sorted(self._evictors)}
@@ -9,16 +9,18 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 def _ensure_dir(path: str): os.makedirs(path, exist_ok=True)
-def log_signal(record: dict, *, fname_csv: str = "signals.csv", fname_parquet: str = "signals.parquet"):
+def log_signal(record: dict, *, fname_csv: str = "signals.csv", fname_parquet: str | None = "signals.parquet"):
     out_dir = settings.logging.out_dir; _ensure_dir(out_dir)
     ts = datetime.now(timezone.utc).isoformat(); rec = {"ts": ts, **record}
-    csv_path = os.path.join(out_dir, fname_csv); parquet_path = os.path.join(out_dir, fname_parquet)
+    csv_path = os.path.join(out_dir, fname_csv)
     header = not os.path.exists(csv_path)
     import csv
     with open(csv_path, "a", newline="", encoding="utf-8") as f:
         w = csv.DictWriter(f, fieldnames=list(rec.keys()))
         if header: w.writeheader()
         w.writerow(rec)
+    if not fname_parquet: return
+    parquet_path = os.path.join(out_dir, fname_parquet)
     try:
         df = pd.DataFrame([rec])
         if os.path.exists(parquet_path):
@@ -0,0 +1,169 @@
+"""
+Rate Limiter - общие token bucket лимиты на провайдера с адаптивным backoff.
+
+Каждый провайдер (gecko, dexscreener, gmgn, perplexity, telegram, solana_rpc) имеет
+свой bucket (rps, burst) из settings.rate_limits. Запросы ждут своей очереди
+вместо того, чтобы падать: ожидающие обслуживаются по приоритету
+(exit > execution > discovery), внутри приоритета - FIFO.
+На 429 / Retry-After bucket ставится на паузу и скорость снижается
+мультипликативно; успешные ответы постепенно возвращают ее к номиналу (AIMD).
+"""
+from __future__ import annotations
+import asyncio, heapq, itertools, time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+from ..config import settings
+from .logging import logger
+
+PRIORITIES = {"exit": 0, "execution": 1, "discovery": 2}
+
+
+class TokenBucket:
+    def __init__(self, name: str, rps: float, burst: int, min_rps_factor: float = 0.1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.base_rps = max(1e-3, float(rps))
+        self.rps = self.base_rps
+        self.burst = max(1, int(burst))
+        self.min_rps = self.base_rps * min_rps_factor
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._ts = clock()
+        self._paused_until = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.granted = 0
+        self.throttled = 0
+        self.waited_secs = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(float(self.burst), self._tokens + (now - self._ts) * self.rps)
+        self._ts = now
+
+    def _dispatch(self):
+        self._wakeup = None
+        now = self._clock()
+        self._refill(now)
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)  # отмененные ожидающие
+        while self._waiters and now >= self._paused_until and self._tokens >= 1.0:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done(): continue
+            self._tokens -= 1.0; self.granted += 1
+            fut.set_result(None)
+        if self._waiters:
+            delay = max(self._paused_until - now, (1.0 - self._tokens) / self.rps, 0.001)
+            self._wakeup = self._loop.call_later(delay, self._dispatch)
+
+    async def acquire(self, priority: str = "discovery"):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый event loop (перезапуск/тесты): таймеры и ожидающие старого loop недействительны
+            self._loop = loop; self._wakeup = None; self._waiters = []
+        now = self._clock()
+        self._refill(now)
+        if not self._waiters and now >= self._paused_until and self._tokens >= 1.0:
+            self._tokens -= 1.0; self.granted += 1
+            return
+        fut = loop.create_future()
+        heapq.heappush(self._waiters, (PRIORITIES.get(priority, 2), next(self._seq), fut))
+        if self._wakeup is None: self._dispatch()
+        t0 = self._clock()
+        try:
+            await fut
+        finally:
+            self.waited_secs += self._clock() - t0
+            if not fut.done(): fut.cancel()
+
+    def penalize(self, retry_after: float | None = None):
+        """429: пауза на Retry-After (или 1/rps) и мультипликативное снижение скорости."""
+        self.throttled += 1
+        now = self._clock()
+        self._refill(now)
+        self.rps = max(self.min_rps, self.rps * 0.5)
+        pause = retry_after if retry_after is not None else 1.0 / self.rps
+        self._paused_until = max(self._paused_until, now + max(0.0, pause))
+        self._tokens = 0.0
+
+    def reward(self):
+        """Успешный ответ: аддитивное восстановление скорости к номиналу."""
+        if self.rps < self.base_rps:
+            self.rps = min(self.base_rps, self.rps + self.base_rps * 0.05)
+
+    def status(self) -> dict:
+        now = self._clock()
+        return {"rps": round(self.rps, 3), "base_rps": self.base_rps, "burst": self.burst,
+                "tokens": round(min(float(self.burst), self._tokens + (now - self._ts) * self.rps), 2),
+                "paused_secs_left": round(max(0.0, self._paused_until - now), 2),
+                "waiting": sum(1 for _, _, f in self._waiters if not f.done()),
+                "granted": self.granted, "throttled": self.throttled, "waited_secs": round(self.waited_secs, 2)}
+
+
+_BUCKETS: dict[str, TokenBucket] = {}
+
+
+def bucket(provider: str) -> TokenBucket:
+    b = _BUCKETS.get(provider)
+    if b is None:
+        conf = settings.rate_limits.get(provider)
+        b = TokenBucket(provider, conf.rps, conf.burst) if conf else TokenBucket(provider, 5.0, 5)
+        _BUCKETS[provider] = b
+    return b
+
+
+def parse_retry_after(value: str | None) -> Optional[float]:
+    if not value: return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+async def acquire(provider: str, priority: str = "discovery"):
+    await bucket(provider).acquire(priority)
+
+
+def observe(provider: str, status_code: int, headers=None):
+    """Учитывает ответ провайдера: 429 -> backoff, 2xx -> восстановление скорости."""
+    b = bucket(provider)
+    if status_code == 429:
+        ra = parse_retry_after((headers or {}).get("Retry-After"))
+        b.penalize(ra)
+        logger.warning(f"Rate limited by {provider}, backing off {ra if ra is not None else 'adaptive'}s (rps={b.rps:.2f})")
+    elif 200 <= status_code < 300:
+        b.reward()
+
+
+async def limited_request(provider: str, send: Callable[[], Awaitable], *, priority: str = "discovery",
+                          max_retries: int | None = None):
+    """
+    Выполняет HTTP запрос через bucket провайдера.
+
+    На 429 запрос не падает, а повторяется после backoff (до max_retries раз);
+    последний ответ возвращается вызывающему как есть.
+    """
+    retries = settings.rate_limits.get(provider).max_retries if provider in settings.rate_limits else 3
+    retries = retries if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        await acquire(provider, priority)
+        resp = await send()
+        observe(provider, resp.status_code, resp.headers)
+        if resp.status_code != 429 or attempt >= retries:
+            return resp
+        attempt += 1
+
+
+def status() -> dict:
+    return {name: b.status() for name, b in _BUCKETS.items()}
+
+
+def reset():
+    """Сбрасывает все buckets (после изменения settings.rate_limits и в тестах)."""
+    _BUCKETS.clear()
@@ -0,0 +1,104 @@
+"""
+Refresh Scheduler - приоритетное обновление рыночных данных в рамках бюджета запросов.
+
+Символы разбиты на уровни приоритета:
+  position  - открытые позиции (самый короткий интервал)
+  candidate - топ hype-кандидаты, которые могут быть куплены
+  tail      - все остальные обнаруженные токены (обновляются редко)
+За один вызов next_batch() выдаются просроченные символы в порядке приоритета
+и просрочки, но не больше, чем осталось в бюджете провайдера за последнюю минуту.
+"""
+from __future__ import annotations
+import time
+from collections import deque
+from typing import Callable, Optional
+
+TIERS = ("position", "candidate", "tail")  # порядок = приоритет
+
+
+class RefreshScheduler:
+    def __init__(self, intervals: dict[str, float], budget_per_min: int, provider: str = "dexscreener",
+                 clock: Callable[[], float] = time.monotonic):
+        missing = [t for t in TIERS if t not in intervals]
+        if missing: raise ValueError(f"refresh intervals missing tiers: {missing}")
+        self.intervals = dict(intervals)
+        self.budget_per_min = max(1, int(budget_per_min))
+        self.provider = provider
+        self._clock = clock
+        self._items: dict[str, dict] = {}  # symbol -> {"contract", "tier", "last"}
+        self._sent: deque[float] = deque()  # время выданных запросов за последние 60 с
+        self.dispatched = 0
+
+    def track(self, symbol: str, contract: str | None, tier: str = "tail"):
+        """Добавляет символ; существующий символ не понижается ниже уже назначенного уровня."""
+        if tier not in TIERS: raise ValueError(f"unknown tier {tier}")
+        it = self._items.get(symbol)
+        if it is None:
+            self._items[symbol] = {"contract": contract, "tier": tier, "last": None}
+            return
+        if contract: it["contract"] = contract
+        if TIERS.index(tier) < TIERS.index(it["tier"]): it["tier"] = tier
+
+    def set_priorities(self, positions: dict[str, str | None], candidates: dict[str, str | None]):
+        """Переназначает уровни: позиции и кандидаты получают свои уровни, остальные уходят в tail."""
+        for it in self._items.values(): it["tier"] = "tail"
+        for sym, contract in candidates.items(): self.track(sym, contract, "candidate")
+        for sym, contract in positions.items(): self.track(sym, contract, "position")
+
+    def __contains__(self, symbol: object) -> bool: return symbol in self._items
+    def __len__(self) -> int: return len(self._items)
+
+    def forget(self, symbol: str):
+        self._items.pop(symbol, None)
+
+    def remaining_budget(self, now: Optional[float] = None) -> int:
+        now = self._clock() if now is None else now
+        while self._sent and now - self._sent[0] >= 60.0: self._sent.popleft()
+        return max(0, self.budget_per_min - len(self._sent))
+
+    def next_batch(self, max_items: int | None = None, now: Optional[float] = None) -> list[tuple[str, str | None, str]]:
+        """Просроченные символы (symbol, contract, tier) по приоритету; бюджет списывается сразу."""
+        now = self._clock() if now is None else now
+        budget = self.remaining_budget(now)
+        if max_items is not None: budget = min(budget, max_items)
+        if budget <= 0: return []
+        due = []
+        for sym, it in self._items.items():
+            if not it["contract"]: continue
+            interval = self.intervals[it["tier"]]
+            overdue = float("inf") if it["last"] is None else now - it["last"] - interval
+            if overdue >= 0:
+                due.append((TIERS.index(it["tier"]), -overdue, sym))
+        due.sort()
+        batch = []
+        for _, _, sym in due[:budget]:
+            it = self._items[sym]
+            it["last"] = now  # неудачный запрос тоже ждет следующего интервала
+            self._sent.append(now)
+            batch.append((sym, it["contract"], it["tier"]))
+        self.dispatched += len(batch)
+        return batch
+
+    def mark_refreshed(self, symbol: str, now: Optional[float] = None):
+        it = self._items.get(symbol)
+        if it is not None: it["refreshed"] = self._clock() if now is None else now
+
+    def staleness(self, now: Optional[float] = None) -> dict:
+        """Возраст данных по уровням: сколько символов, макс/средний возраст, сколько просрочено."""
+        now = self._clock() if now is None else now
+        report = {}
+        for tier in TIERS:
+            ages = []; overdue = 0; never = 0
+            for it in self._items.values():
+                if it["tier"] != tier: continue
+                ref = it.get("refreshed")
+                if ref is None: never += 1; continue
+                age = now - ref; ages.append(age)
+                if age > self.intervals[tier]: overdue += 1
+            report[tier] = {"count": len(ages) + never, "never_refreshed": never, "overdue": overdue,
+                            "interval_secs": self.intervals[tier],
+                            "max_age_secs": round(max(ages), 1) if ages else None,
+                            "avg_age_secs": round(sum(ages) / len(ages), 1) if ages else None}
+        report["budget"] = {"provider": self.provider, "per_min": self.budget_per_min,
+                            "remaining": self.remaining_budget(now)}
+        return report
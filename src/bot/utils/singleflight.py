@@ -0,0 +1,101 @@
+"""
+Single-flight - склейка одновременных одинаковых запросов в один HTTP вызов.
+
+Пока запрос с ключом K в полете, все остальные вызовы с тем же K ждут его
+результата вместо отправки собственного. Опционально результат держится в
+micro-TTL кеше. Запрос выполняется отдельной задачей, поэтому отмена одного
+из ожидающих не отменяет запрос для остальных.
+
+ВАЖНО: результат общий для всех ожидающих - его нельзя мутировать.
+"""
+from __future__ import annotations
+import asyncio, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from ..config import settings
+
+
+class SingleFlight:
+    def __init__(self, name: str, ttl_secs: float = 0.0, max_entries: int = 1024,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.ttl = float(ttl_secs)
+        self.max_entries = max(1, int(max_entries))
+        self._clock = clock
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self._cache: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.calls = 0  # реально выполненные запросы
+        self.merged = 0  # склеенные с запросом в полете
+        self.hits = 0  # отданные из micro-TTL кеша
+
+    def _cached(self, key: Hashable, now: float) -> tuple[bool, Any]:
+        if self.ttl <= 0: return False, None
+        hit = self._cache.get(key)
+        if hit is None: return False, None
+        if now - hit[0] > self.ttl:
+            del self._cache[key]; return False, None
+        return True, hit[1]
+
+    def _store(self, key: Hashable, started: float, value: Any):
+        if self.ttl <= 0: return
+        self._cache[key] = (started, value); self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries: self._cache.popitem(last=False)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        now = self._clock()
+        ok, value = self._cached(key, now)
+        if ok:
+            self.hits += 1; return value
+        task = self._inflight.get(key)
+        if task is not None:
+            self.merged += 1
+            return await asyncio.shield(task)
+        self.calls += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+
+        def _done(t: asyncio.Future, key=key, started=now):
+            if self._inflight.get(key) is t: del self._inflight[key]
+            if t.cancelled(): return
+            if t.exception() is None: self._store(key, started, t.result())
+        task.add_done_callback(_done)
+        return await asyncio.shield(task)
+
+    def invalidate(self, key: Hashable | None = None):
+        if key is None: self._cache.clear()
+        else: self._cache.pop(key, None)
+
+    def stats(self) -> dict:
+        total = self.calls + self.merged + self.hits
+        return {"calls": self.calls, "merged": self.merged, "hits": self.hits,
+                "saved_pct": round(100.0 * (self.merged + self.hits) / total, 1) if total else 0.0,
+                "inflight": len(self._inflight), "cached": len(self._cache), "ttl_secs": self.ttl}
+
+
+_FLIGHTS: dict[str, SingleFlight] = {}
+
+
+def flight(name: str, ttl_secs: Optional[float] = None) -> SingleFlight:
+    f = _FLIGHTS.get(name)
+    if f is None:
+        f = _FLIGHTS[name] = SingleFlight(name, ttl_secs or 0.0)
+    return f
+
+
+def normalize_key(*parts: Any, **params: Any) -> tuple:
+    """Ключ из параметров запроса: строки без пробелов, числа как float, kwargs по имени."""
+    def norm(v):
+        if isinstance(v, str): return v.strip()
+        if isinstance(v, bool) or v is None: return v
+        if isinstance(v, (int, float)): return float(v)
+        return str(v)
+    return tuple(norm(p) for p in parts) + tuple((k, norm(v)) for k, v in sorted(params.items()))
+
+
+def stats() -> dict:
+    return {name: f.stats() for name, f in _FLIGHTS.items()}
+
+
+# Общие flights для котировок GMGN и lookup'ов DexScreener
+route_flight = flight("gmgn_route", settings.execution.quote_cache_ttl_secs)
+dexscreener_flight = flight("dexscreener", settings.market.lookup_cache_ttl_secs)
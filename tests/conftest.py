@@ -0,0 +1,86 @@
+"""
+Общие фикстуры тестов исполнения: подмена GMGN/RPC вызовов executor'а и план покупки
+"""
+import asyncio
+import os
+import sys
+import time
+import pytest
+from contextlib import ExitStack
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.execution import broadcast, executor
+from bot.execution.gmgn_sol import WSOL
+from bot.models import ExecutionPlan
+
+
+def _plan(amount=1_000_000_000):
+    return ExecutionPlan(chain="sol", side="buy", in_token=WSOL, out_token="mint1", amount_in=str(amount),
+                         slippage_pct=10.0, symbol="TOK")
+
+
+class FakeGMGN:
+    """Подмена GMGN/RPC вызовов executor'а; считает запросы маршрутов и одновременность."""
+
+    def __init__(self, price_impact=1.0, route_delay=0.0, raw_tx=True, poll_delay=0.0, fail_tx=()):
+        self.price_impact = price_impact; self.route_delay = route_delay; self.raw_tx = raw_tx
+        self.poll_delay = poll_delay; self.fail_tx = set(fail_tx)
+        self.routes = []; self.sent = []; self.sent_at = []; self.inflight = 0; self.peak = 0
+        self.polling = 0; self.poll_peak = 0
+
+    async def route(self, token_in, token_out, amount, from_addr, slippage, **kwargs):
+        self.inflight += 1; self.peak = max(self.peak, self.inflight)
+        await asyncio.sleep(self.route_delay)
+        self.inflight -= 1
+        self.routes.append((amount, kwargs.get("coalesce", True)))
+        raw = {"swapTransaction": f"tx-{len(self.routes)}", "lastValidBlockHeight": 100} if self.raw_tx else {}
+        return {"data": {"quote": {"outAmount": str(amount * 2), "priceImpact": self.price_impact}, "raw_tx": raw}}
+
+    async def send(self, signed, anti_mev=False, priority="execution"):
+        if signed in self.fail_tx: raise RuntimeError(f"send failed: {signed}")
+        self.sent.append(signed); self.sent_at.append(time.monotonic())
+        return {"data": {"hash": f"sig-{signed}"}}
+
+    async def poll(self, txsig, last_h, priority="execution"):
+        self.polling += 1; self.poll_peak = max(self.poll_peak, self.polling)
+        await asyncio.sleep(self.poll_delay)
+        self.polling -= 1
+        return {"data": {"success": True}}
+
+    def patches(self):
+        return [patch.object(executor, "gmgn_get_route_sol", self.route), patch.object(broadcast, "gmgn_send_tx_sol", self.send),
+                patch.object(executor, "confirm_tx", self.poll), patch.object(executor, "sol_sign_tx_base64", lambda tx, key: tx),
+                patch.object(executor, "_fetch_solana_tx", return_value=None), patch.object(executor, "save_quote", return_value=1),
+                patch.object(executor, "save_trade", return_value=1), patch.object(executor, "send_alert", return_value=None)]
+
+    def patched(self, skip=()):
+        """Все подмены разом; skip - атрибуты, которые тест подменяет сам."""
+        stack = ExitStack()
+        for p in self.patches():
+            if p.attribute not in skip: stack.enter_context(p)
+        return stack
+
+
+async def _execute(fake, plan, **kwargs):
+    with fake.patched():
+        return await executor.execute_sol(plan, payer_b58="key", from_address="owner", dry_run=False, **kwargs)
+
+
+@pytest.fixture
+def gmgn():
+    """Фабрика FakeGMGN"""
+    return FakeGMGN
+
+
+@pytest.fixture
+def buy_plan():
+    """Фабрика плана покупки WSOL -> mint1 на amount лампортов"""
+    return _plan
+
+
+@pytest.fixture
+def run_sol():
+    """execute_sol с подменами FakeGMGN, реальная отправка (dry_run=False)"""
+    return _execute
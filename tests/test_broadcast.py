@@ -0,0 +1,166 @@
+"""
+Тесты для Broadcaster: пути отправки по стороне сделки, гонка GMGN/RPC, дедупликация по подписи и статистика путей
+"""
+import asyncio
+import base64
+import os
+import sys
+import pytest
+from contextlib import ExitStack
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from solders.hash import Hash
+from solders.keypair import Keypair
+from solders.message import MessageV0
+from solders.transaction import VersionedTransaction
+
+from bot.config import settings
+from bot.execution import broadcast
+from bot.execution.broadcast import Broadcaster, tx_signature
+
+
+def _signed_tx():
+    payer = Keypair()
+    tx = VersionedTransaction(MessageV0.try_compile(payer.pubkey(), [], [], Hash.default()), [payer])
+    return base64.b64encode(bytes(tx)).decode(), str(tx.signatures[0])
+
+
+class FakePaths:
+    def __init__(self, gmgn_delay=0.0, rpc_delay=0.0, fail=(), gmgn_hash=True):
+        self.gmgn_delay = gmgn_delay; self.rpc_delay = rpc_delay; self.fail = set(fail); self.gmgn_hash = gmgn_hash
+        self.calls = []
+
+    async def gmgn(self, signed, anti_mev=False, priority="execution"):
+        self.calls.append(("gmgn", anti_mev)); await asyncio.sleep(self.gmgn_delay)
+        if "gmgn" in self.fail: raise RuntimeError("gmgn down")
+        return {"data": {"hash": tx_signature(signed)} if self.gmgn_hash else {}}
+
+    async def rpc(self, method, params, priority="execution", url=None):
+        self.calls.append((url, params[1])); await asyncio.sleep(self.rpc_delay)
+        if url in self.fail: raise RuntimeError(f"{url} down")
+        return tx_signature(params[0])
+
+    def patched(self, rpc_url="http://rpc", endpoints=None, exit_paths=("gmgn", "rpc", "fast")):
+        stack = ExitStack()
+        for p in (patch.object(broadcast, "gmgn_send_tx_sol", self.gmgn), patch.object(broadcast, "rpc_call", self.rpc),
+                  patch.object(settings.solana, "rpc_url", rpc_url),
+                  patch.object(settings.solana, "send_endpoints", {"fast": "http://fast"} if endpoints is None else endpoints),
+                  patch.object(settings.execution, "broadcast_buy_paths", ["gmgn"]),
+                  patch.object(settings.execution, "broadcast_exit_paths", list(exit_paths))):
+            stack.enter_context(p)
+        return stack
+
+
+async def _send(fake, b, signed, side="sell", **kw):
+    with fake.patched(**kw):
+        return await b.send(signed, side=side)
+
+
+class TestPaths:
+    def test_signature_of_signed_tx(self):
+        signed, sig = _signed_tx()
+        assert tx_signature(signed) == sig and tx_signature("not-a-tx") is None
+
+    def test_paths_per_side(self):
+        b = Broadcaster(); fake = FakePaths()
+        with fake.patched(rpc_url=None, exit_paths=("gmgn", "rpc", "fast", "unknown")):
+            assert b.paths_for("buy") == ["gmgn"]
+            assert b.paths_for("sell") == ["gmgn", "fast"]  # rpc без rpc_url и неизвестный путь пропущены
+
+    def test_anti_mev_keeps_gmgn_only(self):
+        b = Broadcaster(); fake = FakePaths()
+        with fake.patched():
+            assert b.paths_for("sell", anti_mev=True) == ["gmgn"]
+            with patch.object(settings.execution, "broadcast_public_with_anti_mev", True):
+                assert b.paths_for("sell", anti_mev=True) == ["gmgn", "rpc", "fast"]
+
+    async def test_anti_mev_exit_not_sent_publicly(self):
+        b = Broadcaster(); fake = FakePaths()
+        signed, _sig = _signed_tx()
+        with fake.patched():
+            res = await b.send(signed, side="sell", anti_mev=True)
+        assert res["path"] == "gmgn" and fake.calls == [("gmgn", True)]
+
+
+class TestRace:
+    async def test_fastest_path_wins(self):
+        b = Broadcaster(); fake = FakePaths(gmgn_delay=0.2)
+        signed, sig = _signed_tx()
+        res = await _send(fake, b, signed)
+        assert res["data"]["hash"] == sig and res["path"] in ("rpc", "fast")
+        assert {c[0] for c in fake.calls} == {"gmgn", "http://rpc", "http://fast"}
+        assert fake.calls[1][1] == {"encoding": "base64", "skipPreflight": True, "maxRetries": 0}
+        await asyncio.sleep(0.25)  # GMGN дорабатывает в фоне
+        stats = b.stats()
+        assert stats["gmgn"]["acks"] == 1 and stats["gmgn"]["wins"] == 0
+        assert stats["rpc"]["wins"] + stats["fast"]["wins"] == 1
+
+    async def test_buy_goes_through_gmgn_only(self):
+        b = Broadcaster(); fake = FakePaths()
+        signed, _sig = _signed_tx()
+        res = await _send(fake, b, signed, side="buy")
+        assert res["path"] == "gmgn" and [c[0] for c in fake.calls] == ["gmgn"]
+
+    async def test_failed_path_falls_through(self):
+        b = Broadcaster(); fake = FakePaths(fail={"gmgn", "http://rpc"})
+        signed, sig = _signed_tx()
+        res = await _send(fake, b, signed)
+        assert res["path"] == "fast" and res["data"]["hash"] == sig
+        assert b.stats()["gmgn"]["errors"] == 1
+
+    async def test_missing_hash_is_a_path_error(self):
+        """Ответ без подписи - не ack: считается ошибкой пути, побеждает следующий"""
+        b = Broadcaster(); fake = FakePaths(rpc_delay=0.05, gmgn_hash=False)
+        signed, sig = _signed_tx()
+        res = await _send(fake, b, signed, endpoints={}, exit_paths=("gmgn", "rpc"))
+        assert res["path"] == "rpc" and res["data"]["hash"] == sig
+        stats = b.stats()
+        assert stats["gmgn"]["errors"] == 1 and stats["gmgn"]["acks"] == 0 and stats["rpc"]["wins"] == 1
+
+    async def test_all_paths_fail_then_retry(self):
+        b = Broadcaster(); signed, _sig = _signed_tx()
+        with pytest.raises(RuntimeError, match="all paths"):
+            await _send(FakePaths(fail={"gmgn", "http://rpc", "http://fast"}), b, signed)
+        fake = FakePaths()
+        assert (await _send(fake, b, signed))["path"] in ("gmgn", "rpc", "fast")
+        assert len(fake.calls) == 3  # после неудачи та же подпись рассылается заново
+
+
+class TestDedupe:
+    async def test_same_signature_sent_once(self):
+        b = Broadcaster(); fake = FakePaths(gmgn_delay=0.05, rpc_delay=0.05)
+        signed, sig = _signed_tx()
+        with fake.patched():
+            r1, r2 = await asyncio.gather(b.send(signed, side="sell"), b.send(signed, side="sell"))
+            r3 = await b.send(signed, side="sell")
+        assert r1 == r2 == r3 and r1["data"]["hash"] == sig
+        assert len(fake.calls) == 3 and b.stats()["deduped"] == 2
+
+    async def test_cancelled_race_releases_waiters(self):
+        """Отмена первой рассылки не оставляет ожидающих той же подписи висеть; ретрай рассылает заново"""
+        b = Broadcaster(); fake = FakePaths(gmgn_delay=0.2, rpc_delay=0.2)
+        signed, sig = _signed_tx()
+        with fake.patched():
+            first = asyncio.create_task(b.send(signed, side="sell"))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.create_task(b.send(signed, side="sell"))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            with pytest.raises(RuntimeError, match="interrupted"):
+                await asyncio.wait_for(waiter, timeout=1)
+            assert sig not in b._recent
+            res = await b.send(signed, side="sell")
+        assert res["data"]["hash"] == sig and len(fake.calls) == 6
+
+    def test_landing_recorded_per_path(self):
+        b = Broadcaster()
+        b.record_landing("rpc", 800); b.record_landing("rpc", 1200); b.record_landing(None, 5)
+        assert b.stats()["rpc"]["landing_p50_ms"] == 1200
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,118 @@
+"""
+Тесты для трекера подтверждений транзакций и пакетных JSON-RPC вызовов
+"""
+import asyncio
+import os
+import sys
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.config import settings
+from bot.execution import confirm, rpc
+from bot.execution.confirm import ConfirmationTracker
+from bot.execution.rpc import RPCError
+
+
+class FakeChain:
+    """Состояние сети для getBlockHeight/getSignatureStatuses; считает batch запросы."""
+
+    def __init__(self, height=100):
+        self.height = height; self.statuses = {}; self.requests = 0; self.calls_per_request = []
+
+    async def rpc_batch(self, calls, priority="execution"):
+        self.requests += 1; self.calls_per_request.append(len(calls))
+        out = []
+        for method, params in calls:
+            if method == "getBlockHeight": out.append(self.height)
+            else: out.append({"context": {"slot": 1}, "value": [self.statuses.get(sig) for sig in params[0]]})
+        return out
+
+
+def _tracker(chain, **kwargs):
+    return ConfirmationTracker(interval_secs=0.01, **kwargs), patch.object(confirm, "rpc_batch", chain.rpc_batch)
+
+
+class TestConfirmationTracker:
+    async def test_batches_all_pending_signatures(self):
+        chain = FakeChain()
+        tracker, p = _tracker(chain)
+        with p:
+            futs = [tracker.track(f"sig{i}", 200) for i in range(300)]
+            await asyncio.sleep(0.05)
+            assert all(not f.done() for f in futs)
+            for i in range(300): chain.statuses[f"sig{i}"] = {"slot": 5, "err": None, "confirmationStatus": "confirmed"}
+            results = await asyncio.wait_for(asyncio.gather(*futs), timeout=1)
+        assert all(r["success"] and r["state"] == "confirmed" for r in results)
+        assert set(chain.calls_per_request) == {3}  # getBlockHeight + 2 пачки по <=256 подписей
+        assert chain.requests < 20  # нагрузка не зависит от числа транзакций
+        assert tracker.stats()["confirmed"] == 300 and "landing_p50_ms" in tracker.stats()
+
+    async def test_expired_after_last_valid_height(self):
+        chain = FakeChain(height=150)
+        tracker, p = _tracker(chain)
+        with p:
+            res = await asyncio.wait_for(tracker.wait("sig", 120), timeout=1)
+        assert res["success"] is False and res["state"] == "expired"
+
+    async def test_failed_transaction(self):
+        chain = FakeChain()
+        chain.statuses["sig"] = {"slot": 7, "err": {"InstructionError": [0, "Custom"]}, "confirmationStatus": "confirmed"}
+        tracker, p = _tracker(chain)
+        with p:
+            res = await asyncio.wait_for(tracker.wait("sig", 200), timeout=1)
+        assert res["state"] == "failed" and res["err"] and res["slot"] == 7
+
+    async def test_waits_for_required_commitment(self):
+        chain = FakeChain()
+        chain.statuses["sig"] = {"slot": 7, "err": None, "confirmationStatus": "processed"}
+        tracker, p = _tracker(chain, commitment="confirmed")
+        with p:
+            fut = tracker.track("sig", 200)
+            await asyncio.sleep(0.05)
+            assert not fut.done()
+            chain.statuses["sig"]["confirmationStatus"] = "finalized"
+            res = await asyncio.wait_for(fut, timeout=1)
+        assert res["success"]
+
+    async def test_timeout_when_rpc_unavailable(self):
+        async def broken(calls, priority="execution"): raise RPCError("down")
+        tracker = ConfirmationTracker(interval_secs=0.01, timeout_secs=0.05)
+        with patch.object(confirm, "rpc_batch", broken):
+            res = await asyncio.wait_for(tracker.wait("sig", 200), timeout=1)
+        assert res["state"] == "timeout" and tracker.rpc_errors > 0
+
+    async def test_confirm_tx_falls_back_to_gmgn_without_rpc(self):
+        async def gmgn(sig, last_h, priority="execution"): return {"data": {"success": True, "via": "gmgn"}}
+        with patch.object(settings.solana, "rpc_url", None), patch("bot.execution.gmgn_sol.gmgn_poll_status", gmgn):
+            res = await confirm.confirm_tx("sig", 100)
+        assert res["data"]["via"] == "gmgn"
+
+
+class FakeResponse:
+    status_code = 200; headers = {}
+
+    def __init__(self, data): self._data = data
+    def raise_for_status(self): pass
+    def json(self): return self._data
+
+
+class TestRPCBatch:
+    async def test_results_in_call_order_with_errors(self):
+        async def fake_limited(provider, send, priority="discovery"):
+            return FakeResponse([{"jsonrpc": "2.0", "id": 1, "error": {"code": -32602, "message": "bad params"}},
+                                 {"jsonrpc": "2.0", "id": 0, "result": 123}])
+        with patch.object(settings.solana, "rpc_url", "http://rpc"), patch.object(rpc, "limited_request", fake_limited):
+            res = await rpc.rpc_batch([("getBlockHeight", []), ("getTransaction", ["x"])])
+            assert res[0] == 123 and isinstance(res[1], RPCError) and "bad params" in str(res[1])
+            assert await rpc.rpc_call("getBlockHeight", []) == 123
+
+    async def test_requires_rpc_url(self):
+        with patch.object(settings.solana, "rpc_url", None):
+            with pytest.raises(RPCError):
+                await rpc.rpc_call("getBlockHeight", [])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
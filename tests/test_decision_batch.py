@@ -0,0 +1,191 @@
+"""
+Тесты для батчевых решений LLM (decide_batch), адаптивного размера батча и параллельных решений оркестратора
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot import engine
+from bot.config import settings
+from bot.engine import Orchestrator
+from bot.llm import router
+from bot.llm.router import BatchSizer, _parse_decisions
+
+
+def payload(sym):
+    return {"symbol": sym, "contract": f"mint-{sym}", "social": {"z_m": 1.0}, "market": {"liq_usd": 1e5}}
+
+
+def reply(content):
+    return {"choices": [{"message": {"content": content}}]}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Подмена Perplexity: батчевые и одиночные вызовы считаются отдельно"""
+    state = {"batch_calls": [], "single_calls": [], "batch_reply": None}
+
+    async def fake_chat(model, system, user, temperature=0.2):
+        state["batch_calls"].append(json.loads(user))
+        return reply(state["batch_reply"])
+
+    async def fake_single(model, p):
+        state["single_calls"].append(p["symbol"])
+        return router.Decision(symbol=p["symbol"], confidence=0.1)
+
+    monkeypatch.setattr(router, "pplx_chat", fake_chat)
+    monkeypatch.setattr(router, "_ask_cached", fake_single)
+    monkeypatch.setattr(router, "_ask_fresh", fake_single)
+    monkeypatch.setattr(router, "decision_cache", None)
+    monkeypatch.setattr(router, "prefilter", None)
+    monkeypatch.setattr(router, "batch_sizer", BatchSizer(5, 8.0))
+    return state
+
+
+class TestParseDecisions:
+    """Тесты разбора JSON массива"""
+
+    def test_fenced_array(self):
+        """Массив в markdown-ограждении разбирается"""
+        decs = _parse_decisions('```json\n[{"symbol": "A"}, {"symbol": "B"}]\n```')
+        assert [d.symbol for d in decs] == ["A", "B"]
+
+    def test_invalid_items_skipped(self):
+        """Невалидные элементы пропускаются, остальные сохраняются"""
+        decs = _parse_decisions('[{"symbol": "A"}, {"confidence": 0.5}]')
+        assert [d.symbol for d in decs] == ["A"]
+
+    def test_not_array(self):
+        """Ответ без массива - ошибка"""
+        with pytest.raises(ValueError):
+            _parse_decisions("no json here")
+
+
+class TestDecideBatch:
+    """Тесты decide_batch"""
+
+    async def test_one_request_for_batch(self, llm):
+        """Несколько кандидатов - один запрос, решения сопоставляются по символу"""
+        llm["batch_reply"] = json.dumps([{"symbol": "B", "confidence": 0.2}, {"symbol": "A", "confidence": 0.3}])
+        decs = await router.decide_batch([(payload("A"), None), (payload("B"), None)])
+        assert len(llm["batch_calls"]) == 1 and llm["single_calls"] == []
+        assert [d.symbol for d in decs] == ["A", "B"]
+        assert decs[0].confidence == 0.3
+
+    async def test_malformed_falls_back_per_symbol(self, llm):
+        """Битый ответ батча - запросы по одному символу"""
+        llm["batch_reply"] = "sorry, I cannot"
+        decs = await router.decide_batch([(payload("A"), None), (payload("B"), None)])
+        assert sorted(llm["single_calls"]) == ["A", "B"]
+        assert [d.symbol for d in decs] == ["A", "B"]
+        assert router.batch_sizer.fallbacks == 2
+
+    async def test_partial_answer_fallback(self, llm):
+        """Пропущенный в ответе символ запрашивается отдельно"""
+        llm["batch_reply"] = json.dumps([{"symbol": "A"}])
+        decs = await router.decide_batch([(payload("A"), None), (payload("B"), None), (payload("C"), None)])
+        assert sorted(llm["single_calls"]) == ["B", "C"]
+        assert all(d is not None for d in decs)
+
+    async def test_contract_from_payload(self, llm):
+        """Перепутанные или чужие адреса в ответе заменяются адресами из payload"""
+        llm["batch_reply"] = json.dumps([{"symbol": "A", "contract": "mint-B"}, {"symbol": "b", "contract": "scam-mint"}])
+        decs = await router.decide_batch([(payload("A"), None), (payload("B"), None)])
+        assert llm["single_calls"] == []
+        assert [(d.symbol, d.contract) for d in decs] == [("A", "mint-A"), ("B", "mint-B")]
+
+    async def test_unknown_symbol_not_assigned_by_position(self, llm):
+        """Решение с чужим символом не присваивается по позиции - символ запрашивается отдельно"""
+        llm["batch_reply"] = json.dumps([{"symbol": "A", "confidence": 0.3}, {"symbol": "XYZ", "confidence": 0.9}])
+        decs = await router.decide_batch([(payload("A"), None), (payload("B"), None)])
+        assert llm["single_calls"] == ["B"]
+        assert decs[1].symbol == "B" and decs[1].confidence == 0.1
+
+    async def test_fallback_counts_one_cache_miss(self, monkeypatch, tmp_path):
+        """Кандидат, пропущенный в ответе батча, - один промах кеша, а не два; его решение кешируется"""
+        singles = []
+
+        async def fake_chat(model, system, user, temperature=0.2): return reply(json.dumps([{"symbol": "A"}]))
+        async def fake_ask(model, p):
+            singles.append(p["symbol"]); return router.Decision(symbol=p["symbol"], confidence=0.1)
+        monkeypatch.setattr(router, "pplx_chat", fake_chat); monkeypatch.setattr(router, "_ask_pplx", fake_ask)
+        monkeypatch.setattr(router, "decision_cache", router.DecisionCache(str(tmp_path / "dc.json"), 60, 100))
+        monkeypatch.setattr(router, "prefilter", None); monkeypatch.setattr(router, "batch_sizer", BatchSizer(5, 8.0))
+        items = [(payload(sym), None) for sym in "ABC"]
+        await router.decide_batch(items)
+        assert sorted(singles) == ["B", "C"]
+        assert router.decision_cache.stats()["misses"] == 3 and router.decision_cache.stats()["hits"] == 0
+        await router.decide_batch(items)
+        assert router.decision_cache.stats()["hits"] == 3 and len(singles) == 2
+
+    async def test_batch_latency_recorded_once(self, llm, monkeypatch):
+        """Задержка батча попадает в статистику стадии fast один раз, а не на каждого кандидата"""
+        async def slow_chat(model, system, user, temperature=0.2):
+            await asyncio.sleep(0.1)
+            return reply(json.dumps([{"symbol": sym} for sym in "ABCD"]))
+        monkeypatch.setattr(router, "pplx_chat", slow_chat)
+        monkeypatch.setattr(settings.perplexity, "escalate_enabled", False)
+        before = dict(router._stages["fast"])
+        await router.decide_batch([(payload(sym), {"hype": 1.0}) for sym in "ABCD"])
+        assert router._stages["fast"]["in"] - before["in"] == 4
+        assert 0.1 <= router._stages["fast"]["secs"] - before["secs"] < 0.2
+
+
+class TestBatchSizer:
+    """Тесты AIMD размера батча"""
+
+    def test_grows_when_fast_halves_when_slow(self):
+        sizer = BatchSizer(max_size=5, target_latency_secs=8.0, start=2)
+        for _ in range(10):
+            sizer.observe(sizer.size, 2.0, ok=True)
+        assert sizer.size == 5
+        sizer.observe(5, 12.0, ok=True)
+        assert sizer.size == 2
+        sizer.observe(2, 1.0, ok=False)
+        assert sizer.size == 1
+
+
+def cand(sym):
+    return {"symbol": sym, "payload": payload(sym), "features": None}
+
+
+class TestEvaluateCandidates:
+    """Тесты Orchestrator._evaluate_candidates: дедлайн и потолок параллельности"""
+
+    async def test_deadline_includes_semaphore_wait(self):
+        """Кандидат, не дождавшийся слота, снимается по общему дедлайну без запроса к LLM"""
+        calls = []
+
+        async def fake_decide(p, f): calls.append(p["symbol"]); return router.Decision(symbol=p["symbol"])
+        sem = asyncio.Semaphore(1); await sem.acquire()  # все слоты заняты
+        with patch.object(engine, "decide", fake_decide), patch.object(settings.perplexity, "decision_timeout_secs", 0.05):
+            t0 = time.monotonic()
+            res = await Orchestrator()._evaluate_batch([cand("A")], sem)
+        assert res[0][1] is None and calls == []
+        assert time.monotonic() - t0 < 0.5
+
+    async def test_concurrency_bound(self):
+        """Одновременно не больше max_concurrency решений, все кандидаты обработаны"""
+        state = {"inflight": 0, "peak": 0}; handled = []
+
+        async def fake_decide(p, f):
+            state["inflight"] += 1; state["peak"] = max(state["peak"], state["inflight"])
+            await asyncio.sleep(0.02)
+            state["inflight"] -= 1
+            return router.Decision(symbol=p["symbol"])
+
+        async def handle(c, dec): handled.append(dec.symbol)
+        with patch.object(engine, "decide", fake_decide), patch.object(engine.ring, "healthy_count", return_value=5), \
+                patch.object(settings.perplexity, "max_concurrency", 2), patch.object(settings.perplexity, "batch_enabled", False):
+            await Orchestrator()._evaluate_candidates([cand(s) for s in "ABCDE"], handle)
+        assert state["peak"] == 2 and sorted(handled) == list("ABCDE")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
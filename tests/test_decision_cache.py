@@ -0,0 +1,90 @@
+"""
+Тесты для кеша решений LLM по квантованному отпечатку payload
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.llm import router
+from bot.llm.router import DecisionCache, fingerprint
+from bot.models import Decision
+
+
+def make_payload(z_m=1.2, liq=50_000.0, vol=12_000.0, urls=("https://a.com/1",), chg=0.03):
+    return {"symbol": "BONK", "contract": "mint1", "quick_filter": True, "_stage": "filter",
+            "social": {"score": z_m, "z_m": z_m, "z_a": 0.4, "z_aw": 0.1, "z_e": 0.0, "red_flag": False},
+            "news": [{"title": "t", "url": u} for u in urls],
+            "market": {"liq_usd": liq, "vol_1h": vol, "price_change_1h": chg}}  # доля, как в MarketSnapshot
+
+
+class TestFingerprint:
+    """Тесты отпечатка payload"""
+
+    def test_small_moves_same_key(self):
+        """Небольшие изменения z-score и ликвидности дают тот же отпечаток"""
+        a = fingerprint("m", make_payload(z_m=1.2, liq=50_000.0))
+        b = fingerprint("m", make_payload(z_m=1.3, liq=52_000.0, chg=0.05))
+        assert a == b
+
+    def test_material_changes_new_key(self):
+        """Сдвиг z-score на корзину, другая полоса ликвидности или новая новость меняют ключ"""
+        base = fingerprint("m", make_payload())
+        assert fingerprint("m", make_payload(z_m=2.1)) != base
+        assert fingerprint("m", make_payload(liq=500_000.0)) != base
+        assert fingerprint("m", make_payload(chg=0.25)) != base  # +25% за час - другая корзина
+        assert fingerprint("m", make_payload(chg=-0.08)) != base
+        assert fingerprint("m", make_payload(urls=("https://a.com/1", "https://b.com/2"))) != base
+        assert fingerprint("other", make_payload()) != base
+
+    def test_news_order_irrelevant(self):
+        """Порядок новостей не влияет на ключ"""
+        a = fingerprint("m", make_payload(urls=("https://a.com/1", "https://b.com/2")))
+        b = fingerprint("m", make_payload(urls=("https://b.com/2", "https://a.com/1")))
+        assert a == b
+
+
+class TestDecisionCache:
+    """Тесты DecisionCache"""
+
+    def test_ttl_and_lru(self, tmp_path):
+        """Истекшие записи не отдаются, лимит вытесняет самые старые"""
+        cache = DecisionCache(str(tmp_path / "dc.json"), ttl_secs=60, max_entries=2)
+        cache.put("a", Decision(symbol="A")); cache.put("b", Decision(symbol="B"))
+        assert cache.get("a").symbol == "A"
+        cache.put("c", Decision(symbol="C"))  # вытесняет b (a недавно использован)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        cache._items["a"] = (cache._items["a"][0] - 120, cache._items["a"][1])
+        assert cache.get("a") is None
+
+    def test_persistence(self, tmp_path):
+        """Кеш переживает перезапуск"""
+        path = str(tmp_path / "dc.json")
+        cache = DecisionCache(path, ttl_secs=60, max_entries=10)
+        cache.put("k", Decision(symbol="BONK", confidence=0.7))
+        cache.save()
+        restored = DecisionCache(path, ttl_secs=60, max_entries=10)
+        dec = restored.get("k")
+        assert dec is not None and dec.symbol == "BONK" and dec.confidence == 0.7
+
+    async def test_decide_uses_cache(self, tmp_path, monkeypatch):
+        """Повторный decide с почти теми же входами не вызывает Perplexity"""
+        calls = []
+
+        async def fake_ask(model, payload):
+            calls.append(payload)
+            return Decision(symbol=payload["symbol"], confidence=0.8)
+
+        monkeypatch.setattr(router, "decision_cache", DecisionCache(str(tmp_path / "dc.json"), 60, 10))
+        monkeypatch.setattr(router, "_ask_pplx", fake_ask)
+        d1 = await router.decide(make_payload())
+        d2 = await router.decide(make_payload(z_m=1.25))
+        assert len(calls) == 1
+        assert d1.confidence == d2.confidence == 0.8
+        assert router.decision_cache.stats()["hits"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
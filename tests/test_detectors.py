@@ -0,0 +1,182 @@
+"""
+Тесты для on-chain детекторов: допечатка, FreezeAccount, изъятие ликвидности, задержка от времени блока и выход позиции по событию
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import pytest
+import websockets
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.config import settings
+from bot.engine import Orchestrator
+from bot.execution import detectors as detectors_mod
+from bot.execution.detectors import OnchainDetectors
+from bot.execution.pool_tracker import PoolTracker
+from bot.execution.subscriptions import SubscriptionHub
+from bot.utils import db
+
+
+@pytest.fixture
+def temp_db():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_dir = settings.logging.out_dir
+        settings.logging.out_dir = tmpdir
+        yield tmpdir
+        settings.logging.out_dir = original_dir
+
+
+def _mint(supply, slot):
+    return {"context": {"slot": slot}, "value": {"data": {"parsed": {"info": {"supply": str(supply)}}}}}
+
+
+def _logs(lines, err=None, slot=5):
+    return {"context": {"slot": slot}, "value": {"signature": "sigX", "err": err, "logs": lines}}
+
+
+def _acc(amount):
+    return {"data": {"parsed": {"info": {"tokenAmount": {"uiAmountString": str(amount)}}}}}
+
+
+def _setup(lp_drop_pct=30.0):
+    hub = SubscriptionHub(); pools = PoolTracker(fee_pct=0.0, hub=hub)
+    det = OnchainDetectors(pools, lp_drop_pct=lp_drop_pct, hub=hub, wall_clock=lambda: 1000.0)
+    events = []
+    pools.watch("mint1", "vt", "vw"); det.watch("mint1"); det.add_handler("mint1", events.append)
+    return hub, pools, det, events
+
+
+class TestMintAndFreeze:
+    def test_supply_increase_fires_once(self):
+        _hub, _pools, det, events = _setup()
+        det._on_mint("mint1", _mint(1000, 1))
+        det._on_mint("mint1", _mint(900, 2))  # burn - не повод выходить
+        assert events == []
+        det._on_mint("mint1", _mint(5000, 3))
+        det._on_mint("mint1", _mint(9000, 4))
+        assert [e.reason for e in events] == ["dev_minted_more"] and events[0].slot == 3
+
+    def test_stale_snapshot_ignored(self):
+        _hub, _pools, det, events = _setup()
+        det._on_mint("mint1", _mint(1000, 10))
+        det._on_mint("mint1", _mint(100, 5))
+        det._on_mint("mint1", _mint(1000, 11))
+        assert events == []
+
+    def test_freeze_account_logs(self):
+        _hub, _pools, det, events = _setup()
+        det._on_logs("mint1", _logs(["Program log: Instruction: MintTo"]))  # LP mint в депозите ликвидности
+        det._on_logs("mint1", _logs(["Program log: Instruction: FreezeAccount"], err={"x": 1}))
+        assert events == []
+        det._on_logs("mint1", _logs(["Program log: Instruction: FreezeAccount"]))
+        assert events[0].reason == "honeypot" and events[0].signature == "sigX"
+
+
+class TestLiquidityPull:
+    def test_withdraw_fires_swap_does_not(self):
+        _hub, pools, det, events = _setup()
+        pools.apply("vt", 1, _acc(1000)); pools.apply("vw", 1, _acc(100))
+        pools.apply("vt", 2, _acc(1600)); pools.apply("vw", 2, _acc(60))  # крупная продажа: токен вырос
+        assert events == []
+        pools.apply("vt", 3, _acc(500))  # вторая сторона еще не пришла - снимок несогласован
+        assert events == []
+        pools.apply("vw", 3, _acc(20))
+        assert [e.reason for e in events] == ["lp_pull"] and events[0].slot == 3
+
+    def test_small_drop_ignored(self):
+        _hub, pools, det, events = _setup(lp_drop_pct=50.0)
+        pools.apply("vt", 1, _acc(1000)); pools.apply("vw", 1, _acc(100))
+        pools.apply("vt", 2, _acc(700)); pools.apply("vw", 2, _acc(70))
+        assert events == []
+
+
+class TestLatency:
+    async def test_latency_from_block_time(self):
+        _hub, _pools, det, events = _setup()
+
+        async def block_time(method, params, priority="execution"):
+            assert method == "getBlockTime" and params == [3]; return 998
+        with patch.object(settings.solana, "rpc_url", "http://rpc"), patch.object(detectors_mod, "rpc_call", block_time):
+            det._on_mint("mint1", _mint(1, 2)); det._on_mint("mint1", _mint(2, 3))
+            await asyncio.sleep(0.01)
+        assert events[0].latency_ms == 2000 and det.stats()["latency_p50_ms"] == 2000
+
+
+class TestSubscriptions:
+    async def test_logs_and_mint_subscriptions_over_websocket(self):
+        methods = []
+
+        async def handler(ws):
+            async for raw in ws:
+                msg = json.loads(raw); methods.append(msg["method"])
+                sid = len(methods)
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": msg["id"], "result": sid}))
+                if msg["method"] == "logsSubscribe":
+                    await ws.send(json.dumps({"jsonrpc": "2.0", "method": "logsNotification", "params": {
+                        "subscription": sid, "result": _logs(["Program log: Instruction: FreezeAccount"], slot=42)}}))
+
+        hub = SubscriptionHub(); det = OnchainDetectors(PoolTracker(hub=hub), hub=hub)
+        fired = asyncio.Event(); events = []
+        det.watch("mint1"); det.add_handler("mint1", lambda ev: (events.append(ev), fired.set()))
+        async with websockets.serve(handler, "127.0.0.1", 0) as server:
+            task = asyncio.create_task(hub.run(f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"))
+            try:
+                await asyncio.wait_for(fired.wait(), timeout=3)
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        assert sorted(methods) == ["accountSubscribe", "logsSubscribe"]
+        assert events[0].reason == "honeypot" and events[0].slot == 42
+
+
+class TestPositionExit:
+    async def test_event_triggers_full_exit_without_quote(self):
+        orch = Orchestrator()
+        hub = SubscriptionHub(); pools = PoolTracker(hub=hub); det = OnchainDetectors(pools, hub=hub)
+        pos = {"id": 1, "symbol": "TOK", "contract": "mint1", "qty": 10.0, "state": "open"}
+        exits = []
+
+        async def kill_exit(p, ev):
+            exits.append(ev.reason); pos["state"] = "closed"
+
+        async def fake_eval(p, exp_wsol, min_pi): return 0.5
+        with patch("bot.engine.pools", pools), patch("bot.engine.detectors", det), \
+                patch("bot.engine.get_position", side_effect=lambda pid: dict(pos)), \
+                patch.object(orch, "_quote_position", return_value=1.0), patch.object(orch, "_evaluate_position", side_effect=fake_eval), \
+                patch.object(orch, "_kill_exit", kill_exit), patch.object(orch.pos_cadence, "next_interval", return_value=60.0):
+            worker = asyncio.create_task(orch._position_worker(1))
+            await asyncio.sleep(0.05)
+            det._emit("mint1", "lp_pull", 7, "test")
+            await asyncio.wait_for(worker, timeout=2)
+        assert exits == ["lp_pull"]
+        assert "mint1" not in det._handlers
+
+    @pytest.mark.parametrize("connected, watched, expect_exit", [(False, True, True), (True, False, True), (True, True, False)])
+    async def test_llm_kill_switch_without_detector_coverage(self, temp_db, connected, watched, expect_exit):
+        """Пока детекторы не покрывают токен (websocket не подключен или токен не под наблюдением) -
+        выход по kill_switch из решения LLM; при покрытии - только по событиям"""
+        pid = db.upsert_position_on_buy("TOK", "mint1", 100.0, 0.4, None, 6, 100, "owner", ["rug"])
+        hub = SubscriptionHub(); det = OnchainDetectors(PoolTracker(hub=hub), hub=hub)
+        if watched: det.watch("mint1")
+        hub.connected = connected
+        sold = []
+
+        async def fake_exec(plan, **kw):
+            sold.append(plan); return {"results": [{"realized_out": 0.3, "tx": "sig-kill"}]}
+        with patch("bot.engine.detectors", det), patch("bot.engine.execute_sol", fake_exec), patch("bot.engine.send_alert"), \
+                patch.object(settings.execution, "onchain_detectors", True), patch.object(settings.risk, "circuit_breaker_enabled", False):
+            res = await Orchestrator()._evaluate_position(db.get_position(pid), 0.4, None)
+        assert bool(sold) is expect_exit
+        if expect_exit:
+            assert res is None and db.get_position(pid)["state"] == "closed"
+            conn = db._conn(); row = conn.execute("SELECT reason FROM exits WHERE position_id=?", (pid,)).fetchone(); conn.close()
+            assert row["reason"] == "kill_switch"
+        else:
+            assert db.get_position(pid)["state"] == "open"
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
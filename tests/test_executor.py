@@ -0,0 +1,119 @@
+"""
+Тесты для исполнения сделок: переиспользование route0, параллельные маршруты и отправка сплитов, замер до первой отправки
+"""
+import os
+import sys
+import time
+import pytest
+from contextlib import contextmanager
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.config import settings
+from bot.execution import executor
+
+
+class TestRouteReuse:
+    async def test_single_split_reuses_route0(self, gmgn, buy_plan, run_sol):
+        fake = gmgn(price_impact=1.0)
+        res = await run_sol(fake, buy_plan())
+        assert len(fake.routes) == 1 and fake.routes[0][1] is False  # не склеивается: маршрут подписывается
+        assert fake.sent == ["tx-1"]
+        assert res["splits"] == 1 and res["failed_splits"] == 0
+        assert res["decision_to_submit_ms"] is not None
+        assert res["results"][0]["broadcast_path"] == "gmgn"  # покупки по умолчанию - только через GMGN
+
+    async def test_stale_route0_is_refetched(self, gmgn, buy_plan, run_sol):
+        fake = gmgn(price_impact=1.0)
+        with patch.object(settings.execution, "route_reuse_max_age_secs", 1e-9):
+            await run_sol(fake, buy_plan())
+        assert len(fake.routes) == 2 and fake.sent == ["tx-2"]
+
+    async def test_route_without_transaction_is_refetched(self, gmgn, buy_plan, run_sol):
+        fake = gmgn(price_impact=1.0, raw_tx=False)
+        res = await run_sol(fake, buy_plan())
+        assert len(fake.routes) == 2 and res["splits"] == 1
+
+
+class TestSplitRoutes:
+    async def test_split_routes_fetched_concurrently(self, gmgn, buy_plan, run_sol):
+        fake = gmgn(price_impact=40.0, route_delay=0.05)
+        with patch.object(settings.execution, "max_splits", 3), patch.object(settings.execution, "split_planner", "threshold"), \
+                patch.object(settings.execution, "split_threshold_price_impact_pct", 15.0):
+            res = await run_sol(fake, buy_plan(900))
+        assert res["splits"] == 3 and res["failed_splits"] == 0
+        assert [amt for amt, _ in fake.routes[1:]] == [300, 300, 300]
+        assert fake.peak == 3  # три маршрута сплитов - одним параллельным раундом
+        assert len(fake.sent) == 3
+
+    async def test_decision_latency_includes_time_before_call(self, gmgn, buy_plan, run_sol):
+        fake = gmgn(price_impact=1.0)
+        res = await run_sol(fake, buy_plan(), decided_at=time.monotonic() - 0.5)
+        assert res["decision_to_submit_ms"] >= 500
+        assert executor.submit_latency_stats()["trades"] >= 1
+
+
+@contextmanager
+def _split_settings(mode, stagger=0.5):
+    with patch.object(settings.execution, "max_splits", 3), patch.object(settings.execution, "split_planner", "threshold"), \
+            patch.object(settings.execution, "split_threshold_price_impact_pct", 15.0), \
+            patch.object(settings.execution, "split_submit_mode", mode), patch.object(settings.execution, "split_stagger_secs", stagger):
+        yield
+
+
+@pytest.fixture
+def run_split(run_sol, buy_plan):
+    async def run(fake, mode, stagger=0.5):
+        with _split_settings(mode, stagger):
+            return await run_sol(fake, buy_plan(900))
+    return run
+
+
+class TestSplitSubmission:
+    async def test_sequential_confirms_one_by_one(self, gmgn, run_split):
+        fake = gmgn(price_impact=40.0, poll_delay=0.05)
+        await run_split(fake, "sequential")
+        assert fake.poll_peak == 1
+
+    async def test_concurrent_confirms_independently(self, gmgn, run_split):
+        fake = gmgn(price_impact=40.0, poll_delay=0.2)
+        t0 = time.monotonic()
+        res = await run_split(fake, "concurrent")
+        assert time.monotonic() - t0 < 0.5  # не 3 цикла подтверждения подряд
+        assert fake.poll_peak == 3
+        assert [x["split"] for x in res["results"]] == [1, 2, 3]
+        assert sum(x["realized_out"] is None for x in res["results"]) == 3  # балансы неизвестны (нет getTransaction)
+
+    async def test_staggered_spacing(self, gmgn, run_split):
+        fake = gmgn(price_impact=40.0, poll_delay=0.3)
+        await run_split(fake, "staggered", stagger=0.1)
+        gaps = [b - a for a, b in zip(fake.sent_at, fake.sent_at[1:])]
+        assert len(gaps) == 2 and all(0.08 <= g < 0.25 for g in gaps)
+        assert fake.poll_peak >= 2  # следующий сплит отправлен до подтверждения предыдущего
+
+    async def test_partial_failure_is_aggregated(self, gmgn, buy_plan):
+        fake = gmgn(price_impact=40.0, fail_tx={"tx-3"})  # маршрут второго сплита (route0 = tx-1)
+        alerts = []
+
+        async def alert(msg): alerts.append(msg)
+        with _split_settings("concurrent"), fake.patched(skip={"send_alert"}), patch.object(executor, "send_alert", alert):
+            res = await executor.execute_sol(buy_plan(900), payer_b58="key", from_address="owner", dry_run=False)
+        assert res["failed_splits"] == 1 and len(res["results"]) == 3
+        assert "error" in res["results"][1] and res["results"][1]["split"] == 2
+        assert res["total_in_wsol"] == pytest.approx(600 / 1e9)
+        assert any("Partial split failure: 1/3" in a for a in alerts)
+
+    async def test_split_exception_does_not_cancel_others(self, gmgn, buy_plan):
+        """Исключение до отправки (запись котировки) - ошибка этого сплита, остальные исполняются"""
+        fake = gmgn(price_impact=40.0, poll_delay=0.05)
+        with _split_settings("concurrent"), fake.patched(skip={"save_quote"}), \
+                patch.object(executor, "save_quote", side_effect=[1, RuntimeError("database is locked"), 1]):
+            res = await executor.execute_sol(buy_plan(900), payer_b58="key", from_address="owner", dry_run=False)
+        assert res["failed_splits"] == 1 and [x["split"] for x in res["results"]] == [1, 2, 3]
+        assert "database is locked" in res["results"][1]["error"]
+        assert len(fake.sent) == 2 and res["total_in_wsol"] == pytest.approx(600 / 1e9)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -10,6 +10,7 @@ from datetime import datetime, timezone
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from bot.features.hype import HypeAggregator, RollingStats
+from bot.features.dedup import NearDupIndex
 from bot.models import SocialPost
 from bot.config import settings
 
@@ -199,5 +200,55 @@ def test_unique_authors_tracked(temp_data_dir):
     assert meta["unique_authors"] == 2
 
 
+def test_near_duplicates_collapsed(temp_data_dir):
+    """Тест что copy-paste посты схлопываются в один с счетчиком дубликатов."""
+    hype = HypeAggregator(window_secs=900, auto_load=False)
+    text = "Huge news for $PEPE holders, the dev team just locked liquidity forever, buy now before it flies"
+    platforms = ["bluesky", "reddit", "farcaster", "bluesky"]
+    for i, platform in enumerate(platforms):
+        suffix = "!!" if i % 2 else ""
+        post = SocialPost(
+            platform=platform,
+            post_id=f"shill{i}",
+            author_handle=f"bot{i}",
+            created_at=datetime.now(timezone.utc),
+            text=text + suffix,
+            symbols=["PEPE"]
+        )
+        hype.update(post)
+
+    _, meta = hype.hype_score("PEPE")
+
+    # Один канонический пост + 3 схлопнутых копии
+    assert meta["mentions"] == 1
+    assert meta["duplicates"] == 3
+
+
+def test_distinct_posts_not_collapsed(temp_data_dir):
+    """Тест что разные по содержанию посты не считаются дубликатами."""
+    hype = HypeAggregator(window_secs=900, auto_load=False)
+    texts = [
+        "Just bridged some $SOL to try the new perps exchange, fees look reasonable so far",
+        "Validator outage on $SOL again? My transactions are stuck for ten minutes already",
+    ]
+    for i, text in enumerate(texts):
+        hype.update(SocialPost(platform="bluesky", post_id=f"p{i}", created_at=datetime.now(timezone.utc),
+                               text=text, symbols=["SOL"]))
+
+    _, meta = hype.hype_score("SOL")
+    assert meta["mentions"] == 2
+    assert meta["duplicates"] == 0
+
+
+def test_dedup_index_respects_memory_budget():
+    """Тест что LSH индекс не превышает жесткий лимит записей."""
+    idx = NearDupIndex(window_secs=900, max_entries=50)
+    now = datetime.now(timezone.utc)
+    for i in range(500):
+        idx.check(f"k{i}", f"unique post number {i} about token {i * 7919} with extra words {i % 13}", now)
+    assert len(idx) <= 50
+    assert idx.stats()["evicted"] > 0
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
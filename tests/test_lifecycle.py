@@ -0,0 +1,75 @@
+"""
+Тесты для SymbolLifecycle (timing wheel вытеснение символов).
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.utils.lifecycle import SymbolLifecycle
+
+
+def _make(ttl=60, tick=10):
+    caches = {"a": {}, "b": {}}
+    lc = SymbolLifecycle(ttl_secs=ttl, tick_secs=tick, clock=lambda: 0.0)
+    for name, cache in caches.items():
+        lc.register(name, lambda sym, c=cache: c.pop(sym, None))
+    return lc, caches
+
+
+def test_inactive_symbol_evicted_from_all_structures():
+    """Тест что неактивный символ удаляется из всех зарегистрированных структур."""
+    lc, caches = _make()
+    for cache in caches.values():
+        cache["BTC"] = 1
+    lc.touch("BTC", now=0.0)
+
+    assert lc.advance(now=30.0) == []
+    assert lc.live_count == 1
+
+    evicted = lc.advance(now=80.0)
+    assert evicted == ["BTC"]
+    assert lc.live_count == 0
+    assert all("BTC" not in cache for cache in caches.values())
+
+
+def test_touched_symbol_survives():
+    """Тест что символ с недавней активностью перепланируется, а не вытесняется."""
+    lc, caches = _make()
+    lc.touch("SOL", now=0.0)
+    lc.touch("SOL", now=50.0)
+
+    assert lc.advance(now=80.0) == []
+    assert lc.is_live("SOL")
+
+    assert lc.advance(now=120.0) == ["SOL"]
+
+
+def test_pinned_symbol_never_evicted():
+    """Тест что символы открытых позиций не вытесняются."""
+    lc, _ = _make()
+    lc.touch("WIF", now=0.0)
+    lc.set_pinned({"WIF"})
+
+    assert lc.advance(now=1000.0) == []
+    assert lc.is_live("WIF")
+
+    # После закрытия позиции символ истекает через TTL
+    lc.set_pinned(set())
+    assert lc.advance(now=1100.0) == ["WIF"]
+
+
+def test_large_clock_jump_processes_each_slot_once():
+    """Тест что скачок времени больше оборота колеса вытесняет все истекшие символы."""
+    lc, _ = _make(ttl=60, tick=10)
+    for i in range(100):
+        lc.touch(f"S{i}", now=float(i % 50))
+
+    evicted = lc.advance(now=10_000.0)
+    assert len(evicted) == 100
+    assert lc.live_count == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,85 @@
+"""
+Тесты для MarketStore (TTL свежести, LRU вытеснение, локальные производные).
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.features.market_store import MarketStore
+from bot.models import MarketSnapshot
+
+
+class FakeClock:
+    def __init__(self, t=1_000_000.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+def _snap(sym, price=1.0, liq=10_000.0):
+    return MarketSnapshot(symbol=sym, contract="mint", liq_usd=liq, vol_1h=100.0, price_usd=price)
+
+
+def test_snapshot_records_fetch_time_and_expires():
+    """Тест что снимок получает время и перестает быть свежим после TTL."""
+    clock = FakeClock()
+    store = MarketStore(ttl_secs=60, clock=clock)
+    store["BTC"] = _snap("BTC")
+
+    assert store.get("BTC").fetched_at == clock.t
+    assert store.fresh("BTC") is not None
+
+    clock.t += 61
+    assert store.fresh("BTC") is None
+    # Устаревший снимок все еще доступен явно, но не как свежий
+    assert store.get("BTC") is not None
+    assert store.age("BTC") == pytest.approx(61)
+
+
+def test_lru_eviction_by_recency_not_alphabet():
+    """Тест что при переполнении вытесняется давно не использованный символ."""
+    clock = FakeClock()
+    store = MarketStore(max_symbols=2, clock=clock)
+    store["AAA"] = _snap("AAA")
+    store["ZZZ"] = _snap("ZZZ")
+    store.get("AAA")  # AAA недавно использован
+    store["MMM"] = _snap("MMM")
+
+    assert "AAA" in store
+    assert "MMM" in store
+    assert "ZZZ" not in store
+
+
+def test_prune_drops_old_snapshots():
+    """Тест что prune удаляет снимки старше max_age."""
+    clock = FakeClock()
+    store = MarketStore(max_age_secs=300, clock=clock)
+    store["OLD"] = _snap("OLD")
+    clock.t += 200
+    store["NEW"] = _snap("NEW")
+    clock.t += 200
+
+    assert store.prune() == ["OLD"]
+    assert store.keys() == ["NEW"]
+
+
+def test_local_return_and_liquidity_trend():
+    """Тест локального расчета доходности и тренда ликвидности по кольцу снимков."""
+    clock = FakeClock()
+    store = MarketStore(history_len=8, clock=clock)
+    for i in range(12):
+        store["SOL"] = _snap("SOL", price=100.0 + i, liq=10_000.0 + 1_000.0 * i)
+        clock.t += 60
+
+    # В кольце только последние 8 снимков
+    assert len(store.history("SOL")) == 8
+    # Цена 111 против 106 пятью минутами ранее
+    assert store.local_return("SOL", 300) == pytest.approx(111.0 / 106.0 - 1.0)
+    assert store.liquidity_trend("SOL", 3600) > 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
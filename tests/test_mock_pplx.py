@@ -0,0 +1,90 @@
+"""
+Тесты для mock Perplexity сервера и benchmark цикла решений
+"""
+import json
+import os
+import sys
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.bench.mock_pplx import Latency, MockConfig, create_app
+from bot.llm.router import _parse_decision, _parse_decisions
+
+
+def _client(**kwargs) -> TestClient:
+    conf = MockConfig(latency=Latency.parse("fixed:0"), tail_secs=0.0, seed=1, **kwargs)
+    return TestClient(create_app(conf))
+
+
+def _body(user, stream=False):
+    return {"model": "sonar", "stream": stream, "messages": [{"role": "system", "content": "x"},
+                                                             {"role": "user", "content": json.dumps(user)}]}
+
+
+class TestLatency:
+    def test_parse(self):
+        assert Latency.parse("fixed:250").kind == "fixed"
+        lat = Latency.parse("uniform:100:200")
+        assert (lat.a, lat.b) == (100.0, 200.0)
+        with pytest.raises(ValueError):
+            Latency.parse("pareto:1")
+
+    def test_sample_seconds(self):
+        import random
+        rnd = random.Random(0)
+        assert Latency.parse("fixed:250").sample(rnd) == 0.25
+        assert all(0.1 <= Latency.parse("uniform:100:200").sample(rnd) <= 0.2 for _ in range(20))
+
+
+class TestMockServer:
+    def test_single_decision_is_schema_valid(self):
+        res = _client().post("/chat/completions", json=_body({"symbol": "BONK", "contract": "mint1"}),
+                             headers={"Authorization": "Bearer k1"})
+        assert res.status_code == 200
+        dec = _parse_decision(res.json()["choices"][0]["message"]["content"])
+        assert dec.symbol == "BONK" and dec.contract == "mint1"
+
+    def test_batch_returns_array(self):
+        res = _client().post("/chat/completions", json=_body([{"symbol": "A"}, {"symbol": "B"}]),
+                             headers={"Authorization": "Bearer k1"})
+        decs = _parse_decisions(res.json()["choices"][0]["message"]["content"])
+        assert [d.symbol for d in decs] == ["A", "B"]
+
+    def test_stream_sse(self):
+        res = _client().post("/chat/completions", json=_body({"symbol": "WIF"}, stream=True),
+                             headers={"Authorization": "Bearer k1"})
+        assert res.headers["content-type"].startswith("text/event-stream")
+        lines = [l[6:] for l in res.text.splitlines() if l.startswith("data: ")]
+        assert lines[-1] == "[DONE]"
+        text = "".join(json.loads(l)["choices"][0]["delta"]["content"] for l in lines[:-1])
+        assert _parse_decision(text).symbol == "WIF"
+
+    def test_error_injection_per_key(self):
+        conf = MockConfig(latency=Latency.parse("fixed:0"), tail_secs=0.0, seed=1)
+        conf.add_error("k2:429:1")
+        client = TestClient(create_app(conf))
+        assert client.post("/chat/completions", json=_body({"symbol": "A"}), headers={"Authorization": "Bearer k1"}).status_code == 200
+        res = client.post("/chat/completions", json=_body({"symbol": "A"}), headers={"Authorization": "Bearer k2"})
+        assert res.status_code == 429 and "Rate limit" in res.json()["error"]["message"]
+        stats = client.get("/stats").json()
+        assert stats["k1"] == {"requests": 1, "ok": 1, "errors": {}}
+        assert stats["k2"]["errors"] == {"429": 1}
+
+
+class TestBenchmark:
+    async def test_run_benchmark(self):
+        from bot.bench.decisions import run_benchmark
+        from bot.llm import perplexity_client
+        ring_before = perplexity_client.ring
+        conf = MockConfig(latency=Latency.parse("fixed:20"), tail_secs=0.0, seed=1)
+        report = await run_benchmark(keys=2, candidates=4, rounds=2, conf=conf, key_rps=50.0)
+        assert report["decisions"] == 8 and report["failed"] == 0
+        assert report["p50_ms"] is not None and report["p99_ms"] >= report["p50_ms"]
+        assert sum(k["requests"] for k in report["keys_usage"]) == sum(s["requests"] for s in report["server"].values())
+        assert perplexity_client.ring is ring_before  # глобальное состояние восстановлено
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
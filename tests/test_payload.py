@@ -0,0 +1,72 @@
+"""
+Тесты для компактного payload решения и бюджета токенов
+"""
+import json
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.llm.payload import build_payload, compact_news, dumps, estimate_tokens, prune
+
+
+META = {"mentions": 12, "unique_authors": 7, "author_weight_sum": 3.14159265, "eng_approx": 0.000123456,
+        "red_flag": False, "duplicates": 0, "z_m": 2.718281828, "z_a": 1.0, "z_aw": None, "z_e": -0.333333333}
+MARKET = {"symbol": "BONK", "contract": "mint1", "network": "solana", "liq_usd": 123456.789, "vol_1h": 9876.54321,
+          "txns_h1": 321, "ret_5m": None, "price_change_1h": 12.3456789, "spread_bps": None, "price_usd": 0.0000123456}
+
+
+class TestPrune:
+    """Тесты очистки и округления"""
+
+    def test_drops_none_and_rounds(self):
+        out = prune({"a": None, "b": 3.14159265, "c": [], "d": {"e": None}, "f": False, "g": 100.0})
+        assert out == {"b": 3.142, "f": False, "g": 100}
+
+
+class TestCompactNews:
+    """Тесты дедупликации новостей"""
+
+    def test_dedupe_by_url_and_title(self):
+        items = [{"title": "Listing on Binance!", "url": "https://www.coindesk.com/a/?utm=x"},
+                 {"title": "Other", "url": "https://coindesk.com/a"},
+                 {"title": "listing on binance", "url": "https://decrypt.co/b"},
+                 {"title": "Fresh", "url": "https://decrypt.co/c"}]
+        out = compact_news(items, 6)
+        assert [it["title"] for it in out] == ["Listing on Binance!", "Fresh"]
+
+    def test_max_items(self):
+        items = [{"title": f"t{i}", "url": f"https://x.com/{i}"} for i in range(10)]
+        assert len(compact_news(items, 3)) == 3
+
+
+class TestBuildPayload:
+    """Тесты сборки payload"""
+
+    def test_compact_and_smaller(self):
+        """Компактный payload заметно меньше прежнего pretty json.dumps"""
+        news = [{"title": "Big news", "url": "https://coindesk.com/x"}] * 6
+        old = json.dumps({"symbol": "BONK", "contract": "mint1", "social": {"score": 2.5, **META}, "news": news,
+                          "market": MARKET, "quick_filter": True}, ensure_ascii=False)
+        p = build_payload("BONK", "mint1", 2.5, META, news, MARKET)
+        assert len(dumps(p)) < 0.6 * len(old)
+        assert p["social"]["z_m"] == 2.718 and "z_aw" not in p["social"]
+        assert len(p["news"]) == 1 and "ret_5m" not in p["market"]
+        assert " " not in dumps({"a": [1, 2]})
+
+    def test_token_budget_enforced(self):
+        """Бюджет токенов: новости и второстепенные поля выбрасываются, ключевые поля остаются"""
+        news = [{"title": f"Headline {i}: " + "very long text about the token " * 5, "url": f"https://site{i}.com/n"} for i in range(6)]
+        full = build_payload("BONK", "mint1", 2.5, META, news, MARKET)
+        budget = 120
+        assert estimate_tokens(dumps(full)) > 3 * budget
+        p = build_payload("BONK", "mint1", 2.5, META, news, MARKET, token_budget=budget)
+        assert estimate_tokens(dumps(p)) <= budget
+        assert len(p.get("news", [])) < len(full["news"])
+        assert p["symbol"] == "BONK" and p["contract"] == "mint1"
+        assert p["social"]["z_m"] == 2.718 and p["market"]["liq_usd"] == 123500
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
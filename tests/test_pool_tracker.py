@@ -0,0 +1,171 @@
+"""
+Тесты для Pool Tracker: поиск vault-аккаунтов пула, локальная цена выхода, подписки через websocket (stub RPC) и пробуждение воркеров позиций
+"""
+import asyncio
+import json
+import os
+import sys
+import pytest
+import websockets
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.engine import Orchestrator
+from bot.execution.gmgn_sol import WSOL
+from bot.execution.pool_tracker import PoolTracker
+from bot.execution.subscriptions import SubscriptionHub
+from bot.utils.amm_decode import find_pool_vaults
+
+
+def _acc(amount):
+    return {"data": {"parsed": {"info": {"tokenAmount": {"uiAmountString": str(amount)}}}}}
+
+
+def _bal(idx, owner, mint, amount):
+    return {"accountIndex": idx, "owner": owner, "mint": mint, "uiTokenAmount": {"uiAmount": amount}}
+
+
+class TestVaultDiscovery:
+    def test_pool_authority_with_both_mints(self):
+        tx = {"transaction": {"message": {"accountKeys": [{"pubkey": "me"}, {"pubkey": "myTok"}, {"pubkey": "myWsol"}]}},
+              "meta": {"loadedAddresses": {"writable": ["vaultTok", "vaultWsol", "otherTok"], "readonly": []},
+                       "preTokenBalances": [_bal(1, "me", "mint1", 0), _bal(3, "amm", "mint1", 1000), _bal(4, "amm", WSOL, 50),
+                                            _bal(5, "router", "mint1", 10)],
+                       "postTokenBalances": [_bal(1, "me", "mint1", 20), _bal(3, "amm", "mint1", 980), _bal(4, "amm", WSOL, 51),
+                                             _bal(5, "router", "mint1", 10)]}}
+        assert find_pool_vaults(tx, "me", "mint1", WSOL) == {"token_vault": "vaultTok", "quote_vault": "vaultWsol", "authority": "amm"}
+
+    def test_no_pair(self):
+        tx = {"transaction": {"message": {"accountKeys": ["a", "b"]}},
+              "meta": {"postTokenBalances": [_bal(1, "amm", "mint1", 5)]}}
+        assert find_pool_vaults(tx, "me", "mint1", WSOL) is None
+
+
+class TestLocalPrice:
+    def test_exit_quote_constant_product(self):
+        t = PoolTracker(fee_pct=0.0, hub=SubscriptionHub())
+        t.watch("mint1", "vt", "vw")
+        assert t.exit_quote("mint1", 10) is None  # резервы еще неизвестны
+        t.apply("vt", 5, _acc(1000)); t.apply("vw", 5, _acc(50))
+        assert t.exit_quote("mint1", 10) == pytest.approx(50 * 10 / 1010)
+
+    def test_fee_and_stale_snapshot(self):
+        t = PoolTracker(fee_pct=1.0, hub=SubscriptionHub())
+        t.watch("mint1", "vt", "vw")
+        t.apply("vt", 10, _acc(1000)); t.apply("vw", 10, _acc(50))
+        t.apply("vw", 9, _acc(99))  # снимок старше уведомления - игнорируется
+        assert t.reserves("mint1") == (1000.0, 50.0)
+        assert t.exit_quote("mint1", 10) == pytest.approx(50 * 9.9 / 1009.9)
+
+    def test_listeners_fire_when_reserves_known(self):
+        t = PoolTracker(hub=SubscriptionHub()); calls = []
+        t.watch("mint1", "vt", "vw"); t.add_listener("mint1", lambda: calls.append(1))
+        t.apply("vt", 1, _acc(1000))
+        assert calls == []
+        t.apply("vw", 1, _acc(50))
+        assert calls == [1]
+
+    def test_half_applied_swap(self):
+        """Пока пришла только одна сторона свопа, цены нет и слушатели не будятся"""
+        t = PoolTracker(fee_pct=0.0, hub=SubscriptionHub()); calls = []
+        t.watch("mint1", "vt", "vw"); t.add_listener("mint1", lambda: calls.append(1))
+        t.apply("vt", 5, _acc(1000)); t.apply("vw", 5, _acc(50))
+        assert calls == [1]
+        t.apply("vt", 6, _acc(1100))  # продажа в пул: токен уже вырос, WSOL еще старый
+        assert t.exit_quote("mint1", 10) is None and t.state("mint1") is None
+        assert calls == [1]
+        t.apply("vw", 6, _acc(50 * 1000 / 1100))
+        assert calls == [1, 1]
+        assert t.exit_quote("mint1", 10) == pytest.approx((50 * 1000 / 1100) * 10 / 1110)
+
+
+class TestWebsocket:
+    async def test_subscribe_notify_unsubscribe(self):
+        received = []; subscribed = asyncio.Event(); unsubscribed = asyncio.Event()
+
+        async def handler(ws):
+            subs = {}
+            async for raw in ws:
+                msg = json.loads(raw); received.append(msg)
+                if msg["method"] == "accountSubscribe":
+                    sid = 100 + len(subs); subs[msg["params"][0]] = sid
+                    await ws.send(json.dumps({"jsonrpc": "2.0", "id": msg["id"], "result": sid}))
+                    if len(subs) == 2:
+                        for vault, amount in (("vt", 1000), ("vw", 50)):
+                            await ws.send(json.dumps({"jsonrpc": "2.0", "method": "accountNotification", "params": {
+                                "subscription": subs[vault], "result": {"context": {"slot": 7}, "value": _acc(amount)}}}))
+                        subscribed.set()
+                elif msg["method"] == "accountUnsubscribe":
+                    unsubscribed.set()
+
+        hub = SubscriptionHub(); t = PoolTracker(fee_pct=0.0, hub=hub); woke = asyncio.Event()
+        t.watch("mint1", "vt", "vw"); t.add_listener("mint1", woke.set)
+        async with websockets.serve(handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            task = asyncio.create_task(hub.run(f"ws://127.0.0.1:{port}"))
+            try:
+                await asyncio.wait_for(subscribed.wait(), timeout=3)
+                await asyncio.wait_for(woke.wait(), timeout=3)
+                assert t.exit_quote("mint1", 10) == pytest.approx(50 * 10 / 1010)
+                assert {m["params"][0] for m in received if m["method"] == "accountSubscribe"} == {"vt", "vw"}
+                t.unwatch("mint1")
+                await asyncio.wait_for(unsubscribed.wait(), timeout=3)
+                assert hub.stats()["active"] == 0
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+
+class TestPositionWorker:
+    async def test_worker_wakes_on_pool_update_without_gmgn(self):
+        orch = Orchestrator()
+        t = PoolTracker(fee_pct=0.0, hub=SubscriptionHub())
+        t.watch("mint1", "vt", "vw"); t.apply("vt", 1, _acc(1000)); t.apply("vw", 1, _acc(50))
+        evaluated = []
+        pos = {"id": 1, "symbol": "TOK", "contract": "mint1", "qty": 10.0, "state": "open"}
+
+        async def fake_eval(p, exp_wsol, min_pi):
+            evaluated.append(exp_wsol); return 0.5
+
+        async def no_gmgn(p): raise AssertionError("GMGN quote with a live pool")
+        with patch("bot.engine.pools", t), \
+                patch("bot.engine.get_position", side_effect=lambda pid: pos if len(evaluated) < 2 else pos | {"state": "closed"}), \
+                patch.object(orch, "_quote_position", no_gmgn), patch.object(orch, "_evaluate_position", side_effect=fake_eval), \
+                patch.object(orch.pos_cadence, "next_interval", return_value=60.0), patch.object(orch.pos_cadence, "min_secs", 0.0):
+            worker = asyncio.create_task(orch._position_worker(1))
+            await asyncio.sleep(0.05)
+            t.apply("vt", 2, _acc(1000)); t.apply("vw", 2, _acc(60))  # обновление пула будит воркер раньше интервала
+            await asyncio.sleep(0.05)
+            t.apply("vt", 3, _acc(1000)); t.apply("vw", 3, _acc(61))
+            await asyncio.wait_for(worker, timeout=2)
+        assert evaluated == [pytest.approx(50 * 10 / 1010), pytest.approx(60 * 10 / 1010)]
+        assert "mint1" not in t._listeners
+
+    async def test_pool_updates_debounced_to_min_interval(self):
+        """Поток свопов не вызывает проверку на каждое обновление: не чаще раза в position_min_interval_secs"""
+        orch = Orchestrator()
+        t = PoolTracker(fee_pct=0.0, hub=SubscriptionHub())
+        t.watch("mint1", "vt", "vw"); t.apply("vt", 1, _acc(1000)); t.apply("vw", 1, _acc(50))
+        evaluated = []
+        pos = {"id": 1, "symbol": "TOK", "contract": "mint1", "qty": 10.0, "state": "open"}
+
+        async def fake_eval(p, exp_wsol, min_pi):
+            evaluated.append(exp_wsol); return 0.5
+        with patch("bot.engine.pools", t), \
+                patch("bot.engine.get_position", side_effect=lambda pid: pos if len(evaluated) < 2 else pos | {"state": "closed"}), \
+                patch.object(orch, "_evaluate_position", side_effect=fake_eval), \
+                patch.object(orch.pos_cadence, "next_interval", return_value=60.0), patch.object(orch.pos_cadence, "min_secs", 0.3):
+            worker = asyncio.create_task(orch._position_worker(1))
+            for slot in range(2, 12):
+                await asyncio.sleep(0.02)
+                t.apply("vt", slot, _acc(1000)); t.apply("vw", slot, _acc(50 + slot))
+            assert len(evaluated) == 1
+            await asyncio.sleep(0.2)
+            assert len(evaluated) == 2 and evaluated[1] == pytest.approx(61 * 10 / 1010)  # одна проверка по последним резервам
+            t.apply("vt", 12, _acc(1000)); t.apply("vw", 12, _acc(62))
+            await asyncio.wait_for(worker, timeout=2)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
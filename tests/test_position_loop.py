@@ -0,0 +1,198 @@
+"""
+Тесты для воркеров позиций: адаптивный интервал, параллельные котировки и пакетный запрос AMM price impact
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.config import settings
+from bot.engine import Orchestrator
+from bot.utils import db
+from bot.utils.cadence import PositionCadence
+
+
+@pytest.fixture
+def temp_db():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_dir = settings.logging.out_dir
+        settings.logging.out_dir = tmpdir
+        yield tmpdir
+        settings.logging.out_dir = original_dir
+
+
+def _pos(i, qty=1000.0):
+    return {"id": i, "symbol": f"TOK{i}", "contract": f"mint{i}", "qty": qty, "decimals": 6}
+
+
+class TestPositionCadence:
+    def test_base_interval_without_history(self):
+        c = PositionCadence(15, 2, 30)
+        assert c.next_interval(1, 0.1) == 15
+        c.observe(1, 1.0, now=0.0)
+        assert c.volatility(1) is None and c.next_interval(1, 0.1) == 15
+
+    def test_volatile_position_near_threshold_is_checked_often(self):
+        calm, wild = PositionCadence(15, 2, 30), PositionCadence(15, 2, 30)
+        for i in range(10):
+            calm.observe(1, 1.0 * (1.0005 if i % 2 else 1.0), now=i * 10.0)
+            wild.observe(1, 1.0 * (1.05 if i % 2 else 1.0), now=i * 10.0)
+        assert calm.next_interval(1, 0.10) == 30
+        fast = wild.next_interval(1, 0.02)
+        assert fast == 2 and wild.urgent(1)
+        assert wild.next_interval(1, 0.10) > fast
+
+    def test_crossed_threshold_is_min_interval(self):
+        c = PositionCadence(15, 2, 30)
+        assert c.next_interval(1, -0.01) == 2
+
+    def test_zero_quotes_are_ignored(self):
+        c = PositionCadence(15, 2, 30)
+        c.observe(1, 0.0, now=0.0); c.observe(1, 1.0, now=1.0)
+        assert c.volatility(1) is None
+
+
+class TestPositionWorkers:
+    async def test_quote_failure_is_zero(self):
+        async def fake_route(token_in, token_out, amount, **kwargs):
+            raise RuntimeError("route error")
+
+        orch = Orchestrator()
+        with patch("bot.execution.gmgn_sol.gmgn_get_route_sol", fake_route), \
+                patch("bot.engine.send_alert", return_value=None):
+            assert await orch._quote_position(_pos(1)) == 0.0
+
+    async def test_worker_exits_when_position_closed(self):
+        orch = Orchestrator()
+        rows = iter([_pos(1) | {"state": "open"}, _pos(1) | {"state": "open"}, _pos(1, qty=0.0) | {"state": "closed"}])
+        evaluated = []
+
+        async def fake_eval(pos, exp_wsol, min_pi):
+            evaluated.append(exp_wsol); return 0.5
+
+        with patch("bot.engine.get_position", side_effect=lambda pid: next(rows)), \
+                patch.object(orch, "_quote_position", side_effect=[1.0, 1.1]), \
+                patch.object(orch, "_evaluate_position", side_effect=fake_eval), \
+                patch.object(orch.pos_cadence, "next_interval", return_value=0.0), patch.object(orch.pos_cadence, "min_secs", 0.0):
+            await asyncio.wait_for(orch._position_worker(1), timeout=2)
+        assert evaluated == [1.0, 1.1]
+
+    async def test_supervisor_runs_workers_concurrently(self):
+        orch = Orchestrator()
+        inflight = peak = 0
+
+        async def slow_quote(pos):
+            nonlocal inflight, peak
+            inflight += 1; peak = max(peak, inflight)
+            await asyncio.sleep(0.1)
+            inflight -= 1
+            return 1.0
+
+        positions = [_pos(i) | {"state": "open"} for i in range(4)]
+        with patch("bot.engine.get_open_positions", return_value=positions), \
+                patch("bot.engine.get_recent_amm_pi_many", return_value={}), \
+                patch("bot.engine.get_position", side_effect=lambda pid: positions[pid]), \
+                patch.object(orch, "_quote_position", side_effect=slow_quote), \
+                patch.object(orch, "_evaluate_position", return_value=0.5):
+            task = asyncio.create_task(orch._run_positions())
+            await asyncio.sleep(0.3)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError): await task
+        assert peak == 4  # каждая позиция - своя задача
+        assert orch.pos_budget.granted >= 4
+
+
+async def _run_supervisor(orch, positions, secs=0.3):
+    with patch("bot.engine.get_open_positions", return_value=positions), \
+            patch("bot.engine.get_recent_amm_pi_many", return_value={}), \
+            patch("bot.engine.get_position", side_effect=lambda pid: positions[pid]):
+        task = asyncio.create_task(orch._run_positions())
+        await asyncio.sleep(secs)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError): await task
+
+
+class TestMarkPositions:
+    async def test_quotes_bounded_by_mark_concurrency(self):
+        inflight = peak = 0
+        marks = {}
+
+        async def fake_route(token_in, token_out, amount, **kwargs):
+            nonlocal inflight, peak
+            inflight += 1; peak = max(peak, inflight)
+            await asyncio.sleep(0.1)
+            inflight -= 1
+            return {"data": {"quote": {"outAmount": str(amount // 1000)}}}
+
+        async def fake_eval(pos, exp_wsol, min_pi):
+            marks.setdefault(pos["id"], exp_wsol); return 0.5
+        with patch.object(settings.execution, "mark_concurrency", 3), patch.object(settings.execution, "position_marks_per_min", 6000):
+            orch = Orchestrator()
+        t0 = time.monotonic()
+        with patch("bot.execution.gmgn_sol.gmgn_get_route_sol", fake_route), patch.object(orch, "_evaluate_position", side_effect=fake_eval):
+            await _run_supervisor(orch, [_pos(i) | {"state": "open"} for i in range(6)])
+        assert peak == 3
+        assert len(marks) == 6 and time.monotonic() - t0 < 0.5  # 2 волны по 0.1s, а не 6 последовательных
+        assert list(marks.values()) == [1000 * 10**6 // 1000 / 1e9] * 6
+
+    async def test_failed_quote_is_zero_and_does_not_block_others(self):
+        marks = {}
+
+        async def fake_route(token_in, token_out, amount, **kwargs):
+            if token_in == "mint1": raise RuntimeError("route error")
+            return {"data": {"quote": {"outAmount": "2000000000"}}}
+
+        async def fake_eval(pos, exp_wsol, min_pi):
+            marks.setdefault(pos["id"], exp_wsol); return 0.5
+        orch = Orchestrator()
+        with patch("bot.execution.gmgn_sol.gmgn_get_route_sol", fake_route), patch("bot.engine.send_alert", return_value=None), \
+                patch.object(orch, "_evaluate_position", side_effect=fake_eval):
+            await _run_supervisor(orch, [_pos(i) | {"state": "open"} for i in range(3)], secs=0.1)
+        assert marks == {0: 2.0, 1: 0.0, 2: 2.0}
+
+    async def test_restarted_worker_keeps_cadence_history(self):
+        """Упавший воркер перезапускается супервизором; волатильность открытой позиции не сбрасывается"""
+        orch = Orchestrator(); starts = []
+        orch.pos_cadence.observe(0, 1.0, now=0.0); orch.pos_cadence.observe(0, 1.1, now=10.0)
+
+        async def worker(pid):
+            starts.append(pid)
+            if len(starts) == 1: raise RuntimeError("worker crashed")
+            await asyncio.sleep(10)
+        with patch.object(orch, "_position_worker", side_effect=worker), patch.object(settings.execution, "position_supervisor_secs", 0.05):
+            await _run_supervisor(orch, [_pos(0) | {"state": "open"}], secs=0.2)
+        assert len(starts) == 2 and orch.pos_cadence.volatility(0) is not None
+
+
+class TestEvaluatePosition:
+    async def test_quote_failures_counted_then_reset(self, temp_db):
+        pid = db.upsert_position_on_buy("TOK", "mint1", 100.0, 0.4, None, 6, 100, "owner", [])
+        orch = Orchestrator()
+        with patch("bot.engine.send_alert", return_value=None):
+            assert await orch._evaluate_position(db.get_position(pid), 0.0, None) is None
+            assert json.loads(db.get_position(pid)["meta_json"])["quote_failures"] == 1
+            distance = await orch._evaluate_position(db.get_position(pid), 0.4, None)
+        assert json.loads(db.get_position(pid)["meta_json"])["quote_failures"] == 0
+        assert distance is not None and distance > 0 and db.get_position(pid)["state"] == "open"
+
+class TestRecentAmmPiMany:
+    def test_single_query_matches_per_contract(self, temp_db):
+        db.save_trade(1, "tx1", 0, None, 1.0, 0.5, -3.0, "sell", "mintA")
+        db.save_trade(2, "tx2", 0, None, 1.0, 0.5, -9.5, "sell", "mintA")
+        db.save_trade(3, "tx3", 0, None, 1.0, 0.5, -1.0, "sell", "mintB")
+        res = db.get_recent_amm_pi_many(["mintA", "mintB", "mintC"], minutes=60)
+        assert res == {"mintA": -9.5, "mintB": -1.0, "mintC": None}
+        assert res["mintA"] == db.get_recent_amm_pi("mintA", minutes=60)
+
+    def test_empty(self, temp_db):
+        assert db.get_recent_amm_pi_many([]) == {}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,104 @@
+"""
+Тесты для PPLXKeyRing - выбор наименее загруженного ключа и отложенная запись состояния
+"""
+import json
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.llm.perplexity_client import PPLXKeyRing
+
+
+@pytest.fixture
+def make_ring(tmp_path, monkeypatch):
+    """Кольцо из трех ключей с состоянием во временной директории"""
+    monkeypatch.setenv("PPLX_API_KEYS", "k1,k2,k3")
+
+    def factory(**kwargs):
+        kwargs.setdefault("max_rps", 0)
+        kwargs.setdefault("flush_secs", 3600)
+        return PPLXKeyRing(path=str(tmp_path / "pplx_keys.json"), **kwargs)
+    return factory
+
+
+class TestKeySelection:
+    """Тесты выбора ключа"""
+
+    def test_least_inflight_spreads_load(self, make_ring):
+        """Одновременные запросы расходятся по разным ключам"""
+        ring = make_ring()
+        keys = [ring.acquire()[0] for _ in range(3)]
+        assert sorted(keys) == ["k1", "k2", "k3"]
+        ring.release("k2")
+        assert ring.acquire()[0] == "k2"
+
+    def test_prefers_lower_latency(self, make_ring):
+        """При равной загрузке выбирается ключ с лучшей задержкой"""
+        ring = make_ring()
+        ring.mark_success("k1", 3.0)
+        ring.mark_success("k2", 0.5)
+        ring.mark_success("k3", 1.5)
+        assert ring.acquire()[0] == "k2"
+
+    def test_cooldown_excluded(self, make_ring):
+        """Ключ в cooldown не выбирается и не считается здоровым"""
+        ring = make_ring()
+        ring.mark_error("k1", 429, "rate limited")
+        assert ring.healthy_count() == 2
+        picked = {ring.acquire()[0] for _ in range(4)}
+        assert "k1" not in picked
+
+    def test_rps_ceiling(self, make_ring):
+        """Ключи, уперевшиеся в RPS потолок, возвращают время ожидания"""
+        ring = make_ring(max_rps=1)
+        for _ in range(3):
+            key, _ = ring.acquire(); ring.release(key)
+        key, wait = ring.acquire()
+        assert key is None
+        assert 0 < wait <= 1.0
+
+    def test_no_healthy_keys(self, make_ring):
+        """Без здоровых ключей ожидание не предлагается"""
+        ring = make_ring()
+        for k in ("k1", "k2", "k3"):
+            ring.mark_error(k, 500, "boom")
+        assert ring.acquire() == (None, 0.0)
+
+    def test_usage_stats(self, make_ring):
+        """Статистика показывает inflight, запросы и задержку по ключам"""
+        ring = make_ring()
+        key, _ = ring.acquire()
+        ring.mark_success(key, 0.2)
+        st = ring.status()
+        entry = next(k for k in st["keys"] if k["requests"] == 1)
+        assert entry["inflight"] == 1 and entry["ok"] == 1 and entry["ewma_latency_ms"] == 200.0
+        assert st["healthy"] == 3 and st["inflight"] == 1
+
+
+class TestPersistence:
+    """Тесты отложенной записи состояния"""
+
+    def test_no_write_per_call(self, make_ring, tmp_path):
+        """Успешные вызовы не переписывают файл до flush"""
+        ring = make_ring()
+        path = tmp_path / "pplx_keys.json"
+        mtime = path.stat().st_mtime_ns
+        for _ in range(5):
+            key, _ = ring.acquire(); ring.mark_success(key, 0.1); ring.release(key)
+        assert path.stat().st_mtime_ns == mtime
+        ring.flush()
+        data = json.loads(path.read_text())
+        assert sum(k["ok"] for k in data["keys"]) == 5
+
+    def test_dead_key_saved_immediately(self, make_ring, tmp_path):
+        """Отключение ключа (401) сохраняется сразу и переживает рестарт"""
+        ring = make_ring()
+        ring.mark_error("k1", 401, "invalid key")
+        restored = make_ring()
+        assert restored.healthy_count() == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
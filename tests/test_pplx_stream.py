@@ -0,0 +1,142 @@
+"""
+Тесты для потокового режима Perplexity (SSE) и hedged запросов против локального stub сервера
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.llm import perplexity_client
+from bot.llm.perplexity_client import JSONObjectScanner, PPLXKeyRing, pplx_stream_json
+from bot.llm.router import _parse_decision
+
+DECISION = json.dumps({"symbol": "BONK", "confidence": 0.75, "direction": "up",
+                       "rationale": "braces {inside} \"quoted\" string"})
+
+
+def sse_chunks(text: str, size: int = 7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """SSE stub: решение, затем медленный хвост (пояснения, citations)"""
+    tail_delay = 1.5
+    errors = []  # статусы ошибок для первых запросов
+    keys = []
+    delays = {}  # Authorization -> задержка перед ответом
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StubHandler.keys.append(self.headers.get("Authorization"))
+        time.sleep(StubHandler.delays.get(self.headers.get("Authorization"), 0))
+        if StubHandler.errors:
+            status = StubHandler.errors.pop(0)
+            body = json.dumps({"error": {"message": "rate limited"}}).encode()
+            self.send_response(status); self.send_header("Content-Length", str(len(body))); self.end_headers()
+            self.wfile.write(body); return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            for part in ["Here is the decision: "] + sse_chunks(DECISION):
+                self.wfile.write(f"data: {json.dumps({'choices': [{'delta': {'content': part}}]})}\n\n".encode())
+                self.wfile.flush()
+            time.sleep(self.tail_delay)
+            self.wfile.write(f"data: {json.dumps({'choices': [{'delta': {'content': ' Sources: ...'}}]})}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("PPLX_API_KEYS", "k1,k2")
+    monkeypatch.setattr(perplexity_client, "ring", PPLXKeyRing(path=str(tmp_path / "keys.json"), max_rps=0))
+    monkeypatch.setattr(perplexity_client, "PPLX_URL", f"http://127.0.0.1:{server.server_port}/chat/completions")
+    StubHandler.errors = []; StubHandler.keys = []; StubHandler.delays = {}
+    yield StubHandler
+    server.shutdown()
+
+
+class TestJSONObjectScanner:
+    """Тесты инкрементального парсера"""
+
+    def test_object_split_across_chunks(self):
+        """Объект, разбитый на куски, собирается при закрытии"""
+        sc = JSONObjectScanner()
+        out = []
+        for part in sse_chunks("prefix " + DECISION + " trailing", 3):
+            out += sc.feed(part)
+        assert out == [DECISION]
+
+    def test_braces_in_strings_ignored(self):
+        """Скобки и кавычки внутри строк не влияют на глубину"""
+        sc = JSONObjectScanner()
+        assert sc.feed('{"a": "}{\\"}", "b": {"c": 1}}') == ['{"a": "}{\\"}", "b": {"c": 1}}']
+
+
+class TestStreaming:
+    """Тесты потокового запроса"""
+
+    async def test_returns_before_stream_ends(self, stub):
+        """Решение возвращается до медленного хвоста ответа"""
+        t0 = time.monotonic()
+        dec = await pplx_stream_json("m", "sys", "user", _parse_decision)
+        assert dec.symbol == "BONK" and dec.confidence == 0.75
+        assert time.monotonic() - t0 < stub.tail_delay
+        stats = perplexity_client.stream_stats()
+        assert stats["calls"] >= 1 and stats["ttft_p50_ms"] is not None
+
+    async def test_key_error_rotates(self, stub):
+        """429 в потоковом режиме уводит ключ в cooldown, запрос повторяется на другом ключе"""
+        stub.errors = [429]
+        dec = await pplx_stream_json("m", "sys", "user", _parse_decision)
+        assert dec.symbol == "BONK"
+        assert len(set(stub.keys)) == 2
+        assert perplexity_client.ring.healthy_count() == 1
+
+
+class TestHedging:
+    """Тесты hedged запросов"""
+
+    async def test_hedge_wins_on_slow_key(self, stub, monkeypatch):
+        """Медленный первый ключ: дубль на втором ключе отвечает раньше"""
+        monkeypatch.setattr(perplexity_client.settings.perplexity, "hedge_default_delay_secs", 0.2)
+        monkeypatch.setattr(perplexity_client, "_hedge_log", perplexity_client.deque(maxlen=200))
+        stub.delays = {"Bearer k1": 1.0}
+        before = dict(perplexity_client._hedge_counts)
+        t0 = time.monotonic()
+        dec = await pplx_stream_json("m", "sys", "user", _parse_decision)
+        assert dec.symbol == "BONK"
+        assert time.monotonic() - t0 < 1.0
+        assert stub.keys == ["Bearer k1", "Bearer k2"]
+        stats = perplexity_client.hedge_stats()
+        assert stats["hedged"] == before["hedged"] + 1
+        assert stats["hedge_won"] == before["hedge_won"] + 1
+        await asyncio.sleep(0.1)  # отмененный проигравший освобождает ключ
+        assert perplexity_client.ring.status()["inflight"] == 0
+
+    async def test_hedge_budget(self, stub, monkeypatch):
+        """При исчерпанном бюджете дубль не отправляется"""
+        monkeypatch.setattr(perplexity_client.settings.perplexity, "hedge_default_delay_secs", 0.1)
+        monkeypatch.setattr(perplexity_client, "_hedge_log", perplexity_client.deque([True] * 10, maxlen=200))
+        stub.delays = {"Bearer k1": 0.4}
+        dec = await pplx_stream_json("m", "sys", "user", _parse_decision)
+        assert dec.symbol == "BONK"
+        assert stub.keys == ["Bearer k1"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
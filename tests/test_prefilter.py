@@ -0,0 +1,130 @@
+"""
+Тесты для локального pre-filter и каскада решений LLM
+"""
+import os
+import sys
+import random
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.llm import router
+from bot.llm.prefilter import PreFilter, FEATURES, candidate_features, train, train_from_log
+from bot.models import Decision, TradeProposal
+
+
+def synthetic(n=400, seed=1):
+    """Сделки - высокий hype и market_score, не-сделки - низкие"""
+    rnd = random.Random(seed)
+    rows, labels = [], []
+    for _ in range(n):
+        y = int(rnd.random() < 0.3)
+        base = 2.0 if y else -0.5
+        meta = {"z_m": base + rnd.gauss(0, 0.7), "z_a": base / 2 + rnd.gauss(0, 0.5), "z_aw": 0.0, "z_e": 0.0,
+                "red_flag": False, "mentions": 5 + 10 * y}
+        rows.append(candidate_features(meta["z_m"], meta, 3.0 * y + rnd.gauss(0, 1), 0.3, 10 ** (4 + y), 10 ** (3 + y)))
+        labels.append(y)
+    return rows, labels
+
+
+class TestPreFilter:
+    """Тесты обучения и применения модели"""
+
+    def test_train_keeps_recall_and_rejects_non_trades(self):
+        """Модель пропускает почти все сделки и отсекает большинство не-сделок"""
+        rows, labels = synthetic()
+        model = train(rows, labels, recall=0.98)
+        passed = [model.accept(r) for r in rows]
+        pos = [p for p, y in zip(passed, labels) if y]
+        neg = [p for p, y in zip(passed, labels) if not y]
+        assert sum(pos) / len(pos) >= 0.95
+        assert sum(neg) / len(neg) < 0.3
+
+    def test_single_class_rejected(self):
+        """Обучение без обоих классов невозможно"""
+        rows, _ = synthetic(20)
+        with pytest.raises(ValueError):
+            train(rows, [0] * len(rows))
+
+    def test_save_load_roundtrip(self, tmp_path):
+        """Сохраненная модель дает те же вероятности"""
+        rows, labels = synthetic()
+        model = train(rows, labels)
+        path = str(tmp_path / "prefilter.json")
+        model.save(path)
+        loaded = PreFilter.load(path)
+        assert loaded is not None
+        assert abs(loaded.predict(rows[0]) - model.predict(rows[0])) < 1e-9
+        assert PreFilter.load(str(tmp_path / "missing.json")) is None
+
+    def test_train_from_log(self, tmp_path):
+        """Обучение по журналу decisions.csv"""
+        import pandas as pd
+        rows, labels = synthetic(200)
+        path = tmp_path / "decisions.csv"
+        pd.DataFrame([{"symbol": "X", **r, "label": y} for r, y in zip(rows, labels)]).to_csv(path, index=False)
+        model = train_from_log(str(path))
+        assert model.meta["n"] == 200
+        assert set(FEATURES) == set(rows[0])
+
+
+def decision(action="long", confidence=0.9):
+    return Decision(symbol="BONK", confidence=confidence, trade_proposal=TradeProposal(action=action))
+
+
+class TestCascade:
+    """Тесты каскада pre-filter -> model_fast -> model_final"""
+
+    @pytest.fixture
+    def llm(self, monkeypatch):
+        calls = []
+        answers = {}
+
+        async def fake_ask(model, payload):
+            calls.append((model, payload["_stage"]))
+            return answers[payload["_stage"]]
+
+        monkeypatch.setattr(router, "_ask_cached", fake_ask)
+        return calls, answers
+
+    async def test_prefilter_rejects_without_llm(self, llm, monkeypatch):
+        """Отсеянный pre-filter кандидат не доходит до LLM"""
+        calls, _ = llm
+        rows, labels = synthetic()
+        monkeypatch.setattr(router, "prefilter", train(rows, labels))
+        monkeypatch.setattr(router.settings.perplexity, "prefilter_explore_rate", 0.0)
+        weak = candidate_features(-1.0, {"z_m": -1.0}, -2.0, 0.0, 100.0, 10.0)
+        assert await router.decide({"symbol": "BONK"}, weak) is None
+        assert calls == []
+
+    async def test_low_confidence_not_escalated(self, llm, monkeypatch):
+        """Неуверенное решение model_fast возвращается как есть, без вызова model_final"""
+        calls, answers = llm
+        monkeypatch.setattr(router, "prefilter", None)
+        answers["filter"] = decision(confidence=0.3)
+        dec = await router.decide({"symbol": "BONK"}, {"hype": 1.0})
+        assert dec.trade_proposal.action == "long" and dec.confidence == 0.3
+        assert [stage for _, stage in calls] == ["filter"]
+
+    async def test_confident_escalates_to_final(self, llm, monkeypatch):
+        """Уверенный сигнал подтверждается model_final"""
+        calls, answers = llm
+        monkeypatch.setattr(router, "prefilter", None)
+        answers["filter"] = decision(confidence=0.9)
+        answers["final"] = decision(action="flat", confidence=0.5)
+        dec = await router.decide({"symbol": "BONK"}, {"hype": 1.0})
+        assert dec.trade_proposal.action == "flat"
+        assert calls == [(router.settings.perplexity.model_fast, "filter"), (router.settings.perplexity.model_final, "final")]
+        assert router.cascade_stats()["final"]["in"] >= 1
+
+    async def test_without_features_single_call(self, llm):
+        """Без признаков (пересмотр позиций) - одно решение model_fast как есть"""
+        calls, answers = llm
+        answers["filter"] = decision(confidence=0.3)
+        dec = await router.decide({"symbol": "BONK"})
+        assert dec.trade_proposal.action == "long"
+        assert len(calls) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
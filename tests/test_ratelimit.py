@@ -0,0 +1,82 @@
+"""
+Тесты для token bucket rate limiter.
+"""
+import asyncio
+import os
+import sys
+import time
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.utils import ratelimit
+from bot.utils.ratelimit import TokenBucket, limited_request, parse_retry_after
+from bot.config import settings, RateLimitConf
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+async def test_requests_wait_instead_of_failing():
+    """Тест что запросы сверх burst ждут очереди, а не отклоняются."""
+    b = TokenBucket("test", rps=50.0, burst=2)
+    t0 = time.monotonic()
+    await asyncio.gather(*(b.acquire() for _ in range(6)))
+    elapsed = time.monotonic() - t0
+
+    assert b.granted == 6
+    # 4 запроса сверх burst при 50 rps -> не меньше ~80 мс
+    assert elapsed >= 0.07
+
+
+async def test_exit_priority_served_before_discovery():
+    """Тест что выходы обслуживаются раньше discovery запросов."""
+    b = TokenBucket("test", rps=20.0, burst=1)
+    await b.acquire()  # исчерпали burst
+    order = []
+
+    async def req(name, prio):
+        await b.acquire(prio)
+        order.append(name)
+
+    tasks = [asyncio.create_task(req(f"disc{i}", "discovery")) for i in range(3)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(req("exit", "exit")))
+    await asyncio.gather(*tasks)
+
+    assert order[0] == "exit"
+
+
+async def test_429_retries_after_retry_after():
+    """Тест что 429 с Retry-After приводит к паузе и повтору, а не к ошибке."""
+    ratelimit.reset()
+    settings.rate_limits["unit_test"] = RateLimitConf(rps=100.0, burst=5, max_retries=3)
+    responses = [FakeResponse(429, {"Retry-After": "0.1"}), FakeResponse(200)]
+
+    async def send():
+        return responses.pop(0)
+
+    t0 = time.monotonic()
+    resp = await limited_request("unit_test", send)
+
+    assert resp.status_code == 200
+    assert time.monotonic() - t0 >= 0.09
+    st = ratelimit.status()["unit_test"]
+    assert st["throttled"] == 1
+    assert st["rps"] < 100.0  # скорость снижена после 429
+    del settings.rate_limits["unit_test"]
+    ratelimit.reset()
+
+
+def test_parse_retry_after():
+    """Тест разбора заголовка Retry-After."""
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("garbage") is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
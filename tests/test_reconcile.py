@@ -0,0 +1,203 @@
+"""
+Тесты для фоновой сверки сделок: миграция trades, batch getTransaction, backoff, поправка позиции и выхода
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.config import settings
+from bot.execution import executor, reconcile
+from bot.execution.reconcile import Reconciler
+from bot.execution.rpc import RPCError
+from bot.utils import circuit_breaker, db
+
+
+@pytest.fixture
+def temp_db():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_dir = settings.logging.out_dir
+        settings.logging.out_dir = tmpdir
+        yield tmpdir
+        settings.logging.out_dir = original_dir
+
+
+def _tx(owner, mint, before, after, decimals=6):
+    bal = lambda amt: [{"owner": owner, "mint": mint, "uiTokenAmount": {"uiAmount": amt, "decimals": decimals}}]
+    return {"meta": {"preTokenBalances": bal(before), "postTokenBalances": bal(after)}}
+
+
+def _pending_buy(provisional=100.0):
+    db.upsert_position_on_buy("TOK", "mint1", provisional, 0.5, None, 6, 100, "owner", [])
+    return db.save_trade(1, "sig1", 1, {"success": True}, None, None, None, "buy", "mint1", expected_out=100_000_000,
+                         provisional_out=provisional, reconciled=False, owner="owner", out_token="mint1")
+
+
+def _pending_sell(provisional=0.5):
+    """Выход позиции mint1 с оценкой provisional WSOL; сделка еще не сверена."""
+    pid = db.upsert_position_on_buy("TOK", "mint1", 100.0, 0.4, None, 6, 100, "owner", [])
+    tid = db.save_trade(1, "sig-sell", 1, {"success": True}, None, None, None, "sell", "mint1", expected_out=500_000_000,
+                        provisional_out=provisional, reconciled=False, owner="owner", out_token="WSOL")
+    return pid, tid
+
+
+def _exit_realized(pid):
+    conn = db._conn(); row = conn.execute("SELECT realized_out FROM exits WHERE position_id=?", (pid,)).fetchone(); conn.close()
+    return row["realized_out"]
+
+
+class Clock:
+    def __init__(self): self.t = 0.0
+    def __call__(self): return self.t
+
+
+class TestMigration:
+    def test_adds_columns_to_old_trades_table(self, temp_db):
+        conn = sqlite3.connect(os.path.join(temp_db, "trader.db"))
+        conn.execute("CREATE TABLE trades (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT, quote_id INTEGER, tx TEXT, split INTEGER, "
+                     "status_json TEXT, realized_out REAL, slippage_pct REAL, amm_pi_pct REAL, side TEXT, contract TEXT)")
+        conn.execute("INSERT INTO trades(tx, side, contract) VALUES ('old', 'buy', 'mint0')")
+        conn.commit(); conn.close()
+        db.init_db()
+        conn = sqlite3.connect(os.path.join(temp_db, "trader.db"))
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(trades)")}
+        conn.close()
+        assert {"expected_out", "provisional_out", "reconciled", "owner", "out_token"} <= cols
+        assert db.get_unreconciled_trades() == []  # старые сделки не сверяются повторно
+
+
+class TestReconciler:
+    async def test_fills_trade_and_corrects_position(self, temp_db):
+        tid = _pending_buy()
+        calls = []
+
+        async def fake_batch(batch, priority="execution"):
+            calls.append(batch); return [_tx("owner", "mint1", 0.0, 98.0)]
+        with patch.object(reconcile, "rpc_batch", fake_batch):
+            assert await Reconciler().run_once() == 1
+        assert calls[0][0][0] == "getTransaction" and calls[0][0][1][0] == "sig1"
+        assert db.get_unreconciled_trades() == []
+        conn = db._conn(); row = conn.execute("SELECT * FROM trades WHERE id=?", (tid,)).fetchone(); conn.close()
+        assert row["realized_out"] == 98.0 and row["slippage_pct"] == pytest.approx(2.0) and row["reconciled"] == 1
+        assert float(db.get_open_position_by_contract("mint1")["qty"]) == pytest.approx(98.0)
+
+    async def test_batches_many_signatures_in_one_request(self, temp_db):
+        for i in range(5):
+            db.save_trade(1, f"sig{i}", 1, None, None, None, None, "buy", "mint1", provisional_out=1.0, reconciled=False,
+                          owner="owner", out_token="mint2")
+        sizes = []
+
+        async def fake_batch(batch, priority="execution"):
+            sizes.append(len(batch)); return [_tx("owner", "mint2", 0.0, 1.0) for _ in batch]
+        with patch.object(reconcile, "rpc_batch", fake_batch):
+            assert await Reconciler(batch_size=3).run_once() == 3
+            assert await Reconciler(batch_size=3).run_once() == 2
+        assert sizes == [3, 2]
+
+    async def test_backoff_then_give_up(self, temp_db):
+        _pending_buy()
+        clock = Clock(); alerts = []
+
+        async def not_yet(batch, priority="execution"): return [None for _ in batch]
+        async def alert(msg): alerts.append(msg)
+        rec = Reconciler(max_attempts=3, base_backoff_secs=1.0, clock=clock)
+        with patch.object(reconcile, "rpc_batch", not_yet), patch.object(reconcile, "send_alert", alert):
+            await rec.run_once()
+            assert rec.counts["retried"] == 1
+            await rec.run_once()  # еще в паузе - запроса нет
+            assert rec.counts["batches"] == 1
+            clock.t = 1.5; await rec.run_once()
+            clock.t = 10.0; await rec.run_once()
+        assert rec.counts["given_up"] == 1 and alerts
+        conn = db._conn(); row = conn.execute("SELECT reconciled FROM trades WHERE tx='sig1'").fetchone(); conn.close()
+        assert row["reconciled"] == -1
+
+    async def test_rpc_error_is_retried(self, temp_db):
+        _pending_buy()
+
+        async def failing(batch, priority="execution"): return [RPCError("node behind")]
+        rec = Reconciler()
+        with patch.object(reconcile, "rpc_batch", failing):
+            assert await rec.run_once() == 0
+        assert rec.stats()["backing_off"] == 1 and len(db.get_unreconciled_trades()) == 1
+
+    async def test_buy_reconciled_before_position_is_opened(self, temp_db):
+        """Сплит покупки сверен раньше, чем открыта позиция - поправка не теряется"""
+        db.save_trade(1, "sig1", 1, {"success": True}, None, None, None, "buy", "mint1", expected_out=100_000_000,
+                      provisional_out=100.0, reconciled=False, owner="owner", out_token="mint1")
+        clock = Clock()
+
+        async def fake_batch(batch, priority="execution"): return [_tx("owner", "mint1", 0.0, 90.0)]
+        rec = Reconciler(clock=clock)
+        with patch.object(reconcile, "rpc_batch", fake_batch):
+            assert await rec.run_once() == 0
+            assert rec.counts["retried"] == 1 and len(db.get_unreconciled_trades()) == 1
+            db.upsert_position_on_buy("TOK", "mint1", 100.0, 0.5, None, 6, 100, "owner", [])
+            clock.t = 5.0
+            assert await rec.run_once() == 1
+        assert float(db.get_open_position_by_contract("mint1")["qty"]) == pytest.approx(90.0)
+
+
+class TestSellReconciliation:
+    async def test_corrects_exit_and_circuit_breaker(self, temp_db):
+        pid, tid = _pending_sell(provisional=0.5)
+        db.reduce_position(pid, 100.0, None, 0.5, None, None, "sig-sell", "trailing_stop")
+        circuit_breaker.record_trade(0.1, "mint1")  # по оценке: 0.5 - 0.4 вложено
+
+        async def fake_batch(batch, priority="execution"): return [_tx("owner", "WSOL", 1.0, 1.3, decimals=9)]
+        with patch.object(reconcile, "rpc_batch", fake_batch), patch.object(settings.risk, "circuit_breaker_enabled", True):
+            assert await Reconciler().run_once() == 1
+        assert _exit_realized(pid) == pytest.approx(0.3)
+        status = circuit_breaker.get_status()
+        assert status["recent_total_pl"] == pytest.approx(-0.1) and status["total_losses"] == 1 and status["total_wins"] == 0
+
+    async def test_waits_until_exit_is_recorded(self, temp_db):
+        pid, tid = _pending_sell(provisional=0.5)
+        clock = Clock()
+
+        async def fake_batch(batch, priority="execution"): return [_tx("owner", "WSOL", 1.0, 1.3, decimals=9)]
+        rec = Reconciler(clock=clock)
+        with patch.object(reconcile, "rpc_batch", fake_batch):
+            assert await rec.run_once() == 0  # сплиты еще исполняются - выхода нет
+            assert rec.counts["retried"] == 1 and len(db.get_unreconciled_trades()) == 1
+            db.reduce_position(pid, 100.0, None, 0.5, None, None, "sig-other-split", "tp1")
+            clock.t = 5.0
+            assert await rec.run_once() == 1
+        assert _exit_realized(pid) == pytest.approx(0.3)
+
+
+class TestExecutorProvisional:
+    async def test_async_mode_skips_get_transaction(self, gmgn, buy_plan):
+        async def decimals(mint): return 6
+        saved = []
+        fake = gmgn(price_impact=1.0)
+        with patch.object(settings.solana, "rpc_url", "http://rpc"), patch.object(settings.execution, "reconcile_async", True), \
+                patch.object(executor, "token_decimals", decimals), \
+                patch.object(executor, "_fetch_solana_tx", side_effect=AssertionError("getTransaction on hot path")), \
+                fake.patched(skip={"_fetch_solana_tx", "save_trade"}), \
+                patch.object(executor, "save_trade", lambda **kw: saved.append(kw) or 1):
+            res = await executor.execute_sol(buy_plan(1_000_000), payer_b58="key", from_address="owner", dry_run=False)
+        r = res["results"][0]
+        assert r["provisional"] and r["realized_out"] == pytest.approx(2.0)  # outAmount 2_000_000 при decimals=6
+        assert saved[0]["realized_out"] is None and saved[0]["reconciled"] is False
+        assert saved[0]["provisional_out"] == pytest.approx(2.0) and saved[0]["owner"] == "owner"
+
+    async def test_decimals_resolved_on_timeout(self, gmgn, buy_plan):
+        """Исход неизвестен (таймаут подтверждения) - decimals все равно берутся из минта, а не 0"""
+        async def decimals(mint): return 6
+        async def timeout(txsig, last_h, priority="execution"): return {"data": {"success": False, "state": "timeout"}}
+        fake = gmgn(price_impact=1.0)
+        with patch.object(settings.solana, "rpc_url", "http://rpc"), patch.object(settings.execution, "reconcile_async", True), \
+                patch.object(executor, "token_decimals", decimals), fake.patched(skip={"confirm_tx"}), \
+                patch.object(executor, "confirm_tx", timeout):
+            res = await executor.execute_sol(buy_plan(1_000_000), payer_b58="key", from_address="owner", dry_run=False)
+        r = res["results"][0]
+        assert r["provisional"] and r["realized_out"] is None and r["decimals"] == 6
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,92 @@
+"""
+Тесты для RefreshScheduler (приоритетное обновление котировок) и первичного снимка discovery.
+"""
+import asyncio
+import os
+import sys
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot import engine
+from bot.utils.refresh import RefreshScheduler
+
+INTERVALS = {"position": 10, "candidate": 30, "tail": 300}
+
+
+def _make(budget=100):
+    return RefreshScheduler(intervals=INTERVALS, budget_per_min=budget, clock=lambda: 0.0)
+
+
+def test_positions_refreshed_before_tail():
+    """Тест что позиции и кандидаты обслуживаются раньше хвоста при нехватке бюджета."""
+    sch = _make(budget=2)
+    for i in range(5):
+        sch.track(f"TAIL{i}", f"mint{i}", "tail")
+    sch.set_priorities(positions={"POS": "mint_pos"}, candidates={"CAND": "mint_cand"})
+
+    batch = sch.next_batch(now=0.0)
+    assert [sym for sym, _, _ in batch] == ["POS", "CAND"]
+    # Бюджет исчерпан - до истечения минуты ничего не выдается
+    assert sch.next_batch(now=1.0) == []
+
+
+def test_intervals_follow_tier():
+    """Тест что уровни обновляются со своими интервалами."""
+    sch = _make()
+    sch.set_priorities(positions={"POS": "m1"}, candidates={})
+    sch.track("TAIL", "m2", "tail")
+    sch.next_batch(now=0.0)
+
+    assert [s for s, _, _ in sch.next_batch(now=11.0)] == ["POS"]
+    assert [s for s, _, _ in sch.next_batch(now=301.0)] == ["POS", "TAIL"]
+
+
+def test_candidate_demoted_when_no_longer_ranked():
+    """Тест что символ возвращается в хвост, когда выпадает из кандидатов."""
+    sch = _make()
+    sch.track("SYM", "m1", "tail")
+    sch.set_priorities(positions={}, candidates={"SYM": None})
+    sch.next_batch(now=0.0)
+    assert [s for s, _, _ in sch.next_batch(now=31.0)] == ["SYM"]
+
+    sch.set_priorities(positions={}, candidates={})
+    assert sch.next_batch(now=62.0) == []
+
+
+def test_staleness_report_per_tier():
+    """Тест отчета о возрасте данных по уровням."""
+    sch = _make()
+    sch.set_priorities(positions={"POS": "m1"}, candidates={})
+    sch.track("TAIL", "m2", "tail")
+    sch.mark_refreshed("POS", now=0.0)
+
+    report = sch.staleness(now=25.0)
+    assert report["position"]["count"] == 1
+    assert report["position"]["max_age_secs"] == 25.0
+    assert report["position"]["overdue"] == 1
+    assert report["tail"]["never_refreshed"] == 1
+
+
+async def test_gecko_seed_uses_pool_reserve():
+    """Тест что первичный снимок GeckoTerminal берет ликвидность из резерва пула, а не из FDV."""
+    mint = "DezXAZ8z7PnrnRJjz3wXBoRgixCa6xjnB7YaB1pPB263"
+    pool = {"attributes": {"base_token": {"symbol": "bonk", "address": mint}, "reserve_in_usd": "12500.5",
+                           "fdv_usd": "950000000", "volume_usd": {"m5": "10", "h1": "3400.0", "h24": "80000"},
+                           "base_token_price_usd": "0.0000231"}}
+
+    async def trending(page=1): return {"data": [pool]}
+    orch = engine.Orchestrator()
+    with patch.object(engine, "trending_pools_solana", trending):
+        task = asyncio.create_task(orch._run_gecko())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    snap = orch.market_cache.get("BONK")
+    assert snap.liq_usd == 12500.5 and snap.vol_1h == 3400.0 and snap.price_usd == pytest.approx(0.0000231)
+    assert "BONK" in orch.refresh
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,126 @@
+"""
+Тесты для SingleFlight - склейки одновременных одинаковых запросов
+"""
+import asyncio
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.utils.singleflight import SingleFlight, normalize_key
+
+
+class FakeClock:
+    def __init__(self, t: float = 0.0):
+        self.t = t
+
+    def __call__(self) -> float:
+        return self.t
+
+
+class TestSingleFlight:
+    """Тесты для SingleFlight"""
+
+    async def test_concurrent_identical_calls_merged(self):
+        """Одновременные одинаковые запросы выполняются одним вызовом"""
+        sf = SingleFlight("t")
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"ok": calls}
+
+        results = await asyncio.gather(*(sf.do("k", fetch) for _ in range(5)))
+        assert calls == 1
+        assert all(r == {"ok": 1} for r in results)
+        assert sf.stats()["merged"] == 4
+
+    async def test_different_keys_not_merged(self):
+        """Разные параметры - разные запросы"""
+        sf = SingleFlight("t")
+        calls = []
+
+        async def fetch(k):
+            calls.append(k)
+            await asyncio.sleep(0)
+            return k
+
+        await asyncio.gather(sf.do("a", lambda: fetch("a")), sf.do("b", lambda: fetch("b")))
+        assert sorted(calls) == ["a", "b"]
+
+    async def test_micro_ttl_cache(self):
+        """Результат отдается из кеша до истечения TTL"""
+        clock = FakeClock(100.0)
+        sf = SingleFlight("t", ttl_secs=1.0, clock=clock)
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        assert await sf.do("k", fetch) == 1
+        clock.t = 100.5
+        assert await sf.do("k", fetch) == 1
+        assert sf.stats()["hits"] == 1
+        clock.t = 101.5
+        assert await sf.do("k", fetch) == 2
+
+    async def test_no_cache_without_ttl(self):
+        """Без TTL последовательные вызовы идут в сеть"""
+        sf = SingleFlight("t")
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        await sf.do("k", fetch)
+        await sf.do("k", fetch)
+        assert calls == 2
+
+    async def test_error_propagates_and_not_cached(self):
+        """Ошибку получают все ожидающие, и она не кешируется"""
+        sf = SingleFlight("t", ttl_secs=10.0)
+        calls = 0
+
+        async def fail():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(sf.do("k", fail), sf.do("k", fail), return_exceptions=True)
+        assert calls == 1
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await sf.do("k", fail)
+        assert calls == 2
+
+    async def test_cancelled_waiter_does_not_cancel_others(self):
+        """Отмена первого вызывающего не отменяет запрос для остальных"""
+        sf = SingleFlight("t")
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return 42
+
+        leader = asyncio.create_task(sf.do("k", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(sf.do("k", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == 42
+
+    def test_normalize_key(self):
+        """Нормализация параметров: пробелы, int/float, порядок kwargs"""
+        assert normalize_key(" mint ", 100, a=1, b="x") == normalize_key("mint", 100.0, b="x ", a=1.0)
+        assert normalize_key("mint", 100) != normalize_key("mint", 101)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,113 @@
+"""
+Тесты для планировщика сплитов: оценка резервов constant-product пула, выбор числа/размеров сплитов, калибровка
+"""
+import os
+import sys
+import tempfile
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bot.config import settings
+from bot.execution import executor, split_planner
+from bot.execution.split_planner import (estimate_reserve, plan_splits, predicted_pi_pct, reserve_from_decode,
+                                         reserve_from_quote, simulate)
+from bot.utils import db
+
+
+@pytest.fixture
+def temp_db():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_dir = settings.logging.out_dir
+        settings.logging.out_dir = tmpdir
+        yield tmpdir
+        settings.logging.out_dir = original_dir
+
+
+class TestReserveEstimate:
+    def test_quote_impact_inverts_to_reserve(self):
+        assert reserve_from_quote(100, 100 / 1100 * 100) == pytest.approx(1000)
+
+    def test_decode_impact_inverts_to_reserve(self):
+        assert reserve_from_decode(100, -predicted_pi_pct(1000, 100)) == pytest.approx(1000)
+
+    def test_median_of_quote_and_decodes(self):
+        samples = [(50, predicted_pi_pct(2000, 50)), (80, predicted_pi_pct(2000, 80))]
+        assert estimate_reserve(100, 100 / 1100 * 100, samples) == pytest.approx(2000)
+
+    def test_no_information(self):
+        assert estimate_reserve(100, 0.0, [(10, 0.0)]) is None
+        assert plan_splits(100, None, 0.0, 3, 0.5).sizes == [100]
+
+
+class TestPlan:
+    def test_fees_dominate_small_trade(self):
+        plan = plan_splits(1_000, 10_000.0, fee_in=500.0, max_splits=3, recovery=1.0)
+        assert plan.sizes == [1_000] and plan.fee_cost == 500.0
+
+    def test_no_recovery_no_split(self):
+        # constant product без восстановления: последовательные свопы = один своп
+        single, _ = simulate(1e6, [500_000], 0.0)
+        parts, _ = simulate(1e6, [250_000, 250_000], 0.0)
+        assert parts == pytest.approx(single)
+        assert plan_splits(500_000, 1e6, fee_in=1.0, max_splits=3, recovery=0.0).sizes == [500_000]
+
+    def test_full_recovery_splits_equally(self):
+        plan = plan_splits(900_000, 1e6, fee_in=1.0, max_splits=3, recovery=1.0)
+        assert plan.sizes == [300_000, 300_000, 300_000]
+        assert all(p == pytest.approx(predicted_pi_pct(1e6, 300_000)) for p in plan.predicted_pi_pct)
+
+    def test_partial_recovery_geometric_sizes(self):
+        plan = plan_splits(900_000, 1e6, fee_in=1.0, max_splits=3, recovery=0.5)
+        assert len(plan.sizes) == 3 and sum(plan.sizes) == 900_000
+        # сдвиг первой части давит на все следующие - первые части меньше, и это дешевле равных
+        assert plan.sizes[0] < plan.sizes[-1]
+        assert plan.impact_cost < simulate(1e6, [300_000] * 3, 0.5)[0]
+
+    def test_calibration(self):
+        split_planner._calibration.clear()
+        split_planner.record_realized("tx", 10.0, -12.0)
+        split_planner.record_realized("tx", None, 5.0)
+        stats = split_planner.calibration_stats()
+        assert stats == {"samples": 1, "bias_pct": 2.0, "mean_abs_err_pct": 2.0}
+
+
+class TestExecutorPlanning:
+    async def test_amm_planner_sizes_splits(self, temp_db, gmgn, buy_plan, run_sol):
+        fake = gmgn(price_impact=40.0)
+        with patch.object(settings.execution, "split_planner", "amm"), patch.object(settings.execution, "max_splits", 3), \
+                patch.object(settings.execution, "split_recovery", 1.0):
+            res = await run_sol(fake, buy_plan(10_000_000_000))
+        assert res["splits"] == 3 and sum(res["split_sizes"]) == 10_000_000_000
+        assert [amt for amt, _ in fake.routes[1:]] == res["split_sizes"]
+        assert all(r["predicted_pi_pct"] > 0 for r in res["results"])
+
+    @pytest.mark.parametrize("mode", ["concurrent", "staggered"])
+    async def test_no_split_without_pool_recovery(self, temp_db, gmgn, buy_plan, run_sol, mode):
+        """Сплиты, отправленные без ожидания подтверждения, не дают пулу восстановиться - только комиссии"""
+        fake = gmgn(price_impact=40.0)
+        with patch.object(settings.execution, "split_planner", "amm"), patch.object(settings.execution, "max_splits", 3), \
+                patch.object(settings.execution, "split_recovery", 1.0), patch.object(settings.execution, "split_submit_mode", mode), \
+                patch.object(settings.execution, "split_stagger_secs", 0.0):
+            res = await run_sol(fake, buy_plan(10_000_000_000))
+        assert res["splits"] == 1 and res["split_sizes"] == [10_000_000_000]
+
+    def test_recovery_by_submit_mode(self):
+        with patch.object(settings.execution, "split_recovery", 0.5), patch.object(settings.execution, "split_recovery_secs", 2.0), \
+                patch.object(settings.execution, "split_stagger_secs", 0.5):
+            for mode, expected in (("sequential", 0.5), ("concurrent", 0.0), ("staggered", 0.125)):
+                with patch.object(settings.execution, "split_submit_mode", mode):
+                    assert executor._split_recovery() == pytest.approx(expected)
+            with patch.object(settings.execution, "split_submit_mode", "staggered"), patch.object(settings.execution, "split_stagger_secs", 5.0):
+                assert executor._split_recovery() == pytest.approx(0.5)
+
+    def test_pool_samples_from_past_trades(self, temp_db):
+        qid = db.save_quote("TOK", "mint1", "WSOL", "mint1", "1000", 10.0, False, None, {}, 5.0, 2000.0, {})
+        db.save_trade(qid, "sig", 1, None, 1.0, 0.0, -7.5, "buy", "mint1")
+        db.save_trade(qid, "sig2", 1, None, 1.0, 0.0, -3.0, "sell", "mint1")
+        assert db.get_recent_pool_samples("mint1", "buy") == [(1000.0, -7.5)]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])